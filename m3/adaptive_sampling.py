@@ -0,0 +1,197 @@
+"""
+위험도 기반 적응형 분석 주기 + 전체 추론량 제한
+
+모든 카메라를 같은 주기(interval_seconds)로 분석하면 비어 있는 카메라와 위험 직전 카메라가
+같은 연산량을 씀. 카메라마다 최근 PCT 추세로 다음 분석 주기를 정하고,
+전체 추론 속도(프레임/초)는 공용 토큰 버킷으로 제한해 위험한 카메라부터 배분함
+- AdaptiveInterval: 카메라 1개의 다음 분석 주기 결정
+    · 경고/위험 등급 → 최소 주기
+    · PCT가 빠르게 오르거나 (분당 변화율 또는 직전 대비 변화폭) 다음 등급 경계에 가까움
+      → 주기를 shrink배로 단축
+    · 안전 등급에서 안정적 → 주기를 grow배로 연장 (최대 주기까지)
+    · 그 외 → 기본 주기로 복귀
+- InferenceBudget: 초당 추론 프레임 수 제한. 토큰이 모자라면 우선순위(위험 등급)가
+  높은 요청부터 순서대로 받음 (영상 업로드 작업은 가장 낮은 우선순위)
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from typing import Any, Dict
+
+from constants import (CongestionLevel, ADAPTIVE_MIN_INTERVAL_SEC, ADAPTIVE_MAX_INTERVAL_SEC,
+                       ADAPTIVE_BOUNDARY_MARGIN_PCT, ADAPTIVE_RISE_PCT_PER_MIN,
+                       ADAPTIVE_SHRINK_FACTOR, ADAPTIVE_GROW_FACTOR)
+
+logger = logging.getLogger(__name__)
+
+_LEVELS = list(CongestionLevel)
+_HIGH_RISK = (CongestionLevel.WARNING, CongestionLevel.DANGER)
+
+
+def risk_priority(level) -> int:
+    """등급 → 우선순위 (1:안전 ~ 4:위험, DB risk_level과 같은 값)"""
+    return _LEVELS.index(level) + 1
+
+
+class AdaptiveInterval:
+    """
+    카메라 1개의 분석 주기 컨트롤러
+
+    update(pct)를 분석할 때마다 호출하면 다음 분석까지 기다릴 시간(초)을 돌려줌
+    """
+
+    def __init__(self, base_interval, min_interval=ADAPTIVE_MIN_INTERVAL_SEC,
+                 max_interval=ADAPTIVE_MAX_INTERVAL_SEC, boundary_margin=ADAPTIVE_BOUNDARY_MARGIN_PCT,
+                 rise_pct_per_min=ADAPTIVE_RISE_PCT_PER_MIN, shrink=ADAPTIVE_SHRINK_FACTOR,
+                 grow=ADAPTIVE_GROW_FACTOR):
+        """
+        Args:
+            base_interval: 기본 분석 주기 (초, 기존 interval_seconds)
+            min_interval / max_interval: 주기 범위 (초)
+            boundary_margin: 다음 등급 하한까지 이 PCT 이내면 경계 근처로 봄
+            rise_pct_per_min: 분당 PCT 상승이 이 값 이상이면 상승 중으로 봄
+            shrink / grow: 단축/연장 시 곱하는 배수
+        """
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max(max_interval, min_interval))
+        self.base_interval = min(max(float(base_interval), self.min_interval), self.max_interval)
+        self.boundary_margin = boundary_margin
+        self.rise_pct_per_min = rise_pct_per_min
+        self.shrink = shrink
+        self.grow = grow
+
+        self.interval = self.base_interval
+        self.reason = 'base'
+        self.slope = None          # PCT 변화율 (분당, 지수 이동 평균)
+        self._last_pct = None
+        self._last_at = None
+
+    def update(self, pct, now=None) -> float:
+        """분석 결과 PCT 반영 → 다음 분석 주기 (초)"""
+        now = time.monotonic() if now is None else now
+        pct = float(pct)
+        # 주기가 길면 분당 변화율이 작게 나오므로 직전 대비 변화폭도 함께 봄
+        jump = pct - self._last_pct if self._last_pct is not None else 0.0
+        if self._last_at is not None and now > self._last_at:
+            rate = (pct - self._last_pct) / (now - self._last_at) * 60
+            self.slope = rate if self.slope is None else self.slope * 0.5 + rate * 0.5
+        self._last_pct, self._last_at = pct, now
+
+        level = CongestionLevel.get_level(pct)
+        idx = _LEVELS.index(level)
+        near_boundary = idx + 1 < len(_LEVELS) and _LEVELS[idx + 1].min_pct - pct <= self.boundary_margin
+        rising = (self.slope is not None and self.slope >= self.rise_pct_per_min) or jump >= self.boundary_margin
+        stable = (self.slope is not None and abs(self.slope) < self.rise_pct_per_min / 2
+                  and abs(jump) < self.boundary_margin)
+
+        if level in _HIGH_RISK:
+            self.interval, self.reason = self.min_interval, 'high_risk'
+        elif rising or near_boundary:
+            self.interval = max(self.min_interval, min(self.interval, self.base_interval) * self.shrink)
+            self.reason = 'rising' if rising else 'near_boundary'
+        elif level is CongestionLevel.SAFE and stable:
+            self.interval = min(self.max_interval, max(self.interval, self.base_interval) * self.grow)
+            self.reason = 'stable'
+        else:
+            self.interval, self.reason = self.base_interval, 'base'
+        return self.interval
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'interval_sec': round(self.interval, 2),
+            'interval_reason': self.reason,
+            'pct_slope_per_min': round(self.slope, 2) if self.slope is not None else None,
+        }
+
+
+class InferenceBudget:
+    """
+    전체 추론 속도 제한 (토큰 버킷, 1토큰 = 추론 프레임 1장)
+
+    max_per_sec이 0/None이면 제한 없음. 대기자가 있으면 새 요청도 순서를 기다리며,
+    대기자 사이에서는 priority가 높은 쪽 → 먼저 온 쪽 순으로 토큰을 받음
+    """
+
+    def __init__(self, max_per_sec=None, burst=None):
+        """
+        Args:
+            max_per_sec: 초당 최대 추론 프레임 수 (0/None이면 제한 없음)
+            burst: 버킷 크기 (기본: 1초 분량)
+        """
+        self.rate = float(max_per_sec or 0)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiters = []   # heap: [-priority, seq, cost]
+        self._seq = 0
+
+        # 통계
+        self.granted = 0
+        self.waited = 0
+        self.max_wait_ms = 0.0
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, cost=1, priority=0) -> float:
+        """
+        cost장 분량의 토큰을 받을 때까지 대기
+
+        Returns:
+            대기한 시간 (초)
+        """
+        if not self.enabled:
+            return 0.0
+        cost = min(float(cost), self.capacity)
+        self._refill()
+        if not self._waiters and self._tokens >= cost:
+            self._tokens -= cost
+            self.granted += 1
+            return 0.0
+
+        started = time.monotonic()
+        self._seq += 1
+        entry = [-priority, self._seq, cost]
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                self._refill()
+                head = self._waiters[0]
+                if head is entry and self._tokens >= cost:
+                    heapq.heappop(self._waiters)
+                    self._tokens -= cost
+                    break
+                # 맨 앞 대기자의 토큰이 찰 때까지 대기
+                await asyncio.sleep(max((head[2] - self._tokens) / self.rate, 0.005))
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+        waited = time.monotonic() - started
+        self.granted += 1
+        self.waited += 1
+        self.max_wait_ms = max(self.max_wait_ms, waited * 1000)
+        return waited
+
+    def get_stats(self) -> Dict[str, Any]:
+        if self.enabled:
+            self._refill()
+        return {
+            'enabled': self.enabled,
+            'max_per_sec': self.rate or None,
+            'tokens': round(self._tokens, 2) if self.enabled else None,
+            'waiting': len(self._waiters),
+            'granted': self.granted,
+            'waited': self.waited,
+            'max_wait_ms': round(self.max_wait_ms, 1),
+        }
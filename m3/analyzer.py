@@ -2,37 +2,48 @@
 M3 혼잡도 분석기
 """
 
+import threading
+
 import cv2
 import numpy as np
 import torch
-from PIL import Image
-import torchvision.transforms as transforms
 
-from constants import CongestionLevel, DEFAULT_THRESHOLD, DEFAULT_ZONE_WEIGHTS, DEFAULT_ROI_PARAMS
+from constants import (CongestionLevel, DEFAULT_THRESHOLD, DEFAULT_ZONE_WEIGHTS, DEFAULT_ROI_PARAMS,
+                       DEFAULT_TILE_SIZE, DEFAULT_TILE_OVERLAP, DEFAULT_MAX_TILES_PER_BATCH,
+                       DEFAULT_TILE_MERGE_RADIUS, DEFAULT_ROI_CROP_MARGIN, DEFAULT_ROI_CROP_VERIFY_FRAMES,
+                       DEFAULT_ROI_CROP_VERIFY_INTERVAL, DENSITY_FULL_PCT)
+from preprocess import FramePreprocessor, PAD_MULTIPLE, get_padded_size
+from backends import TorchBackend
+from tiling import compute_tiles, needs_tiling, merge_tile_points
+from roi import CompiledROI, CompiledZones, ROICache
+from perspective import PerspectiveMap, perspective_key, ground_density
 
 # [신규] develop 버전의 헬퍼 함수들 추가
+# (N, 2) 배열을 불리언 마스크로 한 번에 처리 (점이 수천 개인 밀집 프레임 대응)
 def filter_by_confidence(points, scores, threshold=0.45):
     """신뢰도 기반 필터링"""
-    filtered = []
-    for (x, y), s in zip(points, scores):
-        if s >= threshold:
-            filtered.append((x, y))
-    return np.array(filtered) if filtered else np.empty((0, 2))
+    points = np.asarray(points)
+    if len(points) == 0: return np.empty((0, 2))
+    kept = points[np.asarray(scores) >= threshold, :2]
+    return kept if len(kept) else np.empty((0, 2))
 
 def filter_by_perspective(points, frame_height):
     """Y축 위치 기반 필터링: 원근 왜곡 및 오탐 보정"""
     if len(points) == 0: return points
-    filtered = []
-    for p in points:
-        x, y = p[0], p[1]
-        if y < frame_height * 0.10: continue  # 너무 상단(멀리) 제외
-        if y > frame_height * 0.95: continue  # 너무 하단(가까이) 제외
-        filtered.append((x, y))
-    return np.array(filtered) if filtered else np.empty((0, 2))
+    points = np.asarray(points)
+    y = points[:, 1]
+    # 너무 상단(멀리) / 너무 하단(가까이) 제외
+    drop = (y < frame_height * 0.10) | (y > frame_height * 0.95)
+    kept = points[~drop, :2]
+    return kept if len(kept) else np.empty((0, 2))
 
 def auto_roi(frame, top_y_ratio=0.3, top_w_ratio=0.2, bottom_w_ratio=0.6):
     """중앙 고정 Auto ROI 생성"""
     h, w = frame.shape[:2]
+    return auto_roi_for_shape(h, w, top_y_ratio, top_w_ratio, bottom_w_ratio)
+
+def auto_roi_for_shape(h, w, top_y_ratio=0.3, top_w_ratio=0.2, bottom_w_ratio=0.6):
+    """프레임 크기만으로 Auto ROI 생성 (auto_roi와 동일)"""
     center_x = w // 2
     
     top_y = int(h * top_y_ratio)
@@ -53,20 +64,36 @@ def calculate_scene_density(points, roi_area, scene_weights, frame_height):
     """구역별(Near/Mid/Far) 가중치 적용 밀도 계산"""
     if frame_height is None or roi_area <= 0: return 0.0, 0.0
     
-    near, mid, far = 0, 0, 0
-    for p in points:
-        y = p[1]
-        if y > frame_height * 0.66: near += 1
-        elif y > frame_height * 0.33: mid += 1
-        else: far += 1
+    if len(points) == 0:
+        near, mid, far = 0, 0, 0
+    else:
+        y = np.asarray(points)[:, 1]
+        is_near = y > frame_height * 0.66
+        near = int(np.count_nonzero(is_near))
+        mid = int(np.count_nonzero((y > frame_height * 0.33) & ~is_near))
+        far = len(y) - near - mid
         
     weighted_count = (near * scene_weights[0] + mid * scene_weights[1] + far * scene_weights[2])
     weighted_density = weighted_count / roi_area * 1000
     
     # PCT 기준: 1000px당 0.15명을 100%로 가정
-    pct = min(100, (weighted_density / 0.15) * 100)
+    pct = min(100, (weighted_density / DENSITY_FULL_PCT) * 100)
     return weighted_density, pct
 
+def scene_point_weights(points, scene_weights, frame_height):
+    """점별 구역(Near/Mid/Far) 가중치 (calculate_scene_density와 같은 구간)"""
+    y = np.asarray(points)[:, 1]
+    return np.where(y > frame_height * 0.66, scene_weights[0],
+                    np.where(y > frame_height * 0.33, scene_weights[1], scene_weights[2]))
+
+def count_diff(result, reference):
+    """두 분석 결과의 인원 차이 {항목: reference - result} (전체/제외 영역/구역별, 같으면 빈 dict)"""
+    pairs = [('count', result['count'], reference['count']),
+             ('excluded', result['excluded_count'], reference['excluded_count'])]
+    for name, zone in reference['zones'].items():
+        pairs.append((f"zone:{name}", result['zones'].get(name, {}).get('count', 0), zone['count']))
+    return {key: ref - value for key, value, ref in pairs if ref != value}
+
 
 class M3CongestionAnalyzer:
     """
@@ -74,16 +101,37 @@ class M3CongestionAnalyzer:
     """
     def __init__(self, model, device, roi_polygon=None, max_capacity=None, 
                  use_adaptive_roi=True, zone_weights=DEFAULT_ZONE_WEIGHTS,
-                 threshold=DEFAULT_THRESHOLD, roi_params=None):
+                 threshold=DEFAULT_THRESHOLD, roi_params=None, backend=None,
+                 tile_size=DEFAULT_TILE_SIZE, tile_overlap=DEFAULT_TILE_OVERLAP,
+                 max_tiles_per_batch=DEFAULT_MAX_TILES_PER_BATCH,
+                 tile_merge_radius=DEFAULT_TILE_MERGE_RADIUS,
+                 roi_crop=False, roi_crop_margin=DEFAULT_ROI_CROP_MARGIN, zone_settings=None,
+                 perspective=None, roi_crop_verify_frames=DEFAULT_ROI_CROP_VERIFY_FRAMES,
+                 roi_crop_verify_interval=DEFAULT_ROI_CROP_VERIFY_INTERVAL):
         """
         Args:
-            model: P2PNet 모델 객체
+            model: P2PNet 모델 객체 (backend를 지정하면 None 가능)
             device: 디바이스 (cuda/cpu)
             roi_polygon: ROI 다각형 좌표 [(x1,y1), (x2,y2), ...] (None이면 전체 영역)
             max_capacity: 최대 수용 인원 (명)
+            backend: (선택) 추론 백엔드 (None이면 model로 TorchBackend 생성)
+            tile_size: (선택) 타일 크기 (128 배수). 패딩 후 이보다 큰 프레임은 겹침 타일로 나눠 추론
+            tile_overlap: 타일 간 겹침 폭 (128 배수)
+            max_tiles_per_batch: 한 번의 추론에 넣을 최대 타일 수 (메모리 예산)
+            tile_merge_radius: 겹침 구간 중복 점 병합 거리 (px)
+            roi_crop: ROI 바운딩 박스만 잘라서 추론할지 여부 (기본 False, 크롭 검증 후 켜는 것을 권장)
+            roi_crop_margin: ROI 바깥으로 함께 넣을 주변 영역 폭 (px, ROI 경계 근처 특징 보존용)
+            roi_crop_verify_frames: 크롭 설정별로 전체 프레임 추론과 인원을 비교할 프레임 수
+                                    (불일치하면 해당 설정은 전체 프레임 추론으로 전환, 0이면 비교 안 함)
+            roi_crop_verify_interval: 검증이 끝난 설정도 크롭 프레임 N장마다 1장씩 다시 비교 (0이면 안 함)
+            zone_settings: (선택) 기본 구역/제외 영역 설정 {'zones': [...], 'exclude': [...]}
+                           (M3Config.get_zone_settings 형식)
+            perspective: (선택) 기본 원근 모델 설정 (M3Config.get_perspective_settings 형식).
+                         있으면 Near/Mid/Far 가중치 대신 지면 면적 맵으로 밀도(명/m²) 계산
         """
         self.model = model
         self.device = device
+        self.backend = backend if backend is not None else TorchBackend(model, device)
         self.roi_polygon = roi_polygon
         self.max_capacity = max_capacity
         self.threshold = threshold
@@ -93,20 +141,43 @@ class M3CongestionAnalyzer:
         self.zone_weights = zone_weights
         self.scene_weights = (zone_weights['near'], zone_weights['mid'], zone_weights['far'])
         self.roi_params = roi_params if roi_params else DEFAULT_ROI_PARAMS
-        self.cached_roi = None
+        # [신규] (ROI 파라미터, 프레임 크기)별 ROI 다각형/면적/래스터 마스크 캐시
+        self.roi_cache = ROICache()
+        self.zone_settings = zone_settings
+        self.perspective = perspective
+        
+        # [신규] 타일 추론 설정 (4K/파노라마 프레임의 메모리/지연 상한)
+        if tile_size is not None:
+            if tile_size % PAD_MULTIPLE or tile_overlap % PAD_MULTIPLE:
+                raise ValueError(f"tile_size/tile_overlap은 {PAD_MULTIPLE}의 배수여야 합니다: {tile_size}, {tile_overlap}")
+            if tile_overlap >= tile_size:
+                raise ValueError(f"tile_overlap({tile_overlap})은 tile_size({tile_size})보다 작아야 합니다.")
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.max_tiles_per_batch = max(1, int(max_tiles_per_batch))
+        self.tile_merge_radius = tile_merge_radius
+        
+        # [신규] ROI 크롭 추론 (ROI 밖 영역은 연산하지 않음)
+        self.roi_crop = roi_crop
+        self.roi_crop_margin = roi_crop_margin
+        # [검증] 크롭 설정 키 → {'frames': 크롭 프레임 수, 'checked': 비교 횟수, 'matched': 사람이 있는 프레임 중
+        #        일치한 수, 'ok': True/False/None(검증 중), 'diff': 불일치 내역}
+        # (분석 풀/워밍업 스레드/API 호출에서 함께 갱신하므로 락으로 보호)
+        self.roi_crop_verify_frames = max(0, int(roi_crop_verify_frames or 0))
+        self.roi_crop_verify_interval = max(0, int(roi_crop_verify_interval or 0))
+        self._crop_checks = {}
+        self._crop_lock = threading.Lock()
         
         # ROI 면적 계산
         if roi_polygon:
-            self.roi_area = cv2.contourArea(np.array(roi_polygon, dtype=np.int32))
+            self._roi_array = np.array(roi_polygon, dtype=np.int32)
+            self.roi_area = cv2.contourArea(self._roi_array)
         else:
             self.roi_area = 1920 * 1080  # 기본값 (Full HD)
         
-        # Transform
-        self.transform = transforms.Compose([
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                               std=[0.229, 0.224, 0.225])
-        ])
+        # 전처리 (감마 보정 + 128 배수 패딩 + 정규화, 재사용 버퍼)
+        # 감마 1.5는 어두운 부분을 밝게 끌어올리면서 밝은 부분은 유지함 (야간/저조도 대응)
+        self.preprocessor = FramePreprocessor(device=device)
         
         # [수정] 리사이징 제거 (사람이 작은 영상에서 탐지 실패 방지)
         # self.target_width = 1024  
@@ -116,6 +187,9 @@ class M3CongestionAnalyzer:
         print(f"  ROI: {'사용자 정의' if roi_polygon else '전체 영역'}")
         print(f"  면적: {self.roi_area:,.0f} 픽셀")
         print(f"  최대 수용: {max_capacity}명" if max_capacity else "  최대 수용: 미설정")
+        print(f"  추론 백엔드: {self.backend.name}")
+        if tile_size:
+            print(f"  타일 추론: {tile_size}px (겹침 {tile_overlap}px, 배치당 최대 {self.max_tiles_per_batch}개)")
         # print(f"  성능 최적화: Max Width {self.target_width}px")
     
     def is_point_in_roi(self, point):
@@ -124,104 +198,428 @@ class M3CongestionAnalyzer:
             return True  # ROI 없으면 모든 점 허용
         
         x, y = point
-        result = cv2.pointPolygonTest(
-            np.array(self.roi_polygon, dtype=np.int32),
-            (float(x), float(y)),
-            False
-        )
+        result = cv2.pointPolygonTest(self._roi_array, (float(x), float(y)), False)
         return result >= 0  # 0 이상이면 내부 또는 경계
     
-    def predict_count(self, frame):
+    def get_input_size(self, frame, region=None):
         """
-        프레임에서 사람 수 예측 (ROI 필터링 포함)
+        프레임이 모델에 입력될 때의 패딩 후 크기 (H', W')
+        
+        모델이 128의 배수 크기만 받을 수 있는 경우가 많으므로 128 배수로 올림
+        region이 있으면 잘라낸 영역 기준
+        """
+        if region is not None:
+            x0, y0, x1, y1 = region
+            return get_padded_size(y1 - y0, x1 - x0, self.preprocessor.pad_multiple)
+        return self.preprocessor.get_input_size(frame)
+
+    def _compiled_roi(self, frame_shape, roi_params=None):
+        """
+        [신규] 프레임 크기에 맞춘 CompiledROI (Adaptive or Fixed or 전체 영역)
+        
+        (ROI 파라미터, 프레임 크기)별로 다각형/면적/래스터 마스크를 한 번만 만들어 캐시함
+        (M3Config.get_roi_params로 받은 카메라별 파라미터도 매 프레임 다시 계산하지 않음)
         
         Args:
-            frame: OpenCV BGR 이미지
+            frame_shape: 원본 프레임 shape
+            roi_params: (선택) 요청별 커스텀 ROI 파라미터
+        """
+        h, w = frame_shape[:2]
+        key = self._roi_key(frame_shape, roi_params)
         
-        Returns:
-            count: 사람 수
-            points: 점 좌표 배열
+        if key[0] == 'auto':
+            # 커스텀 파라미터가 들어오면 기본 파라미터 대신 적용
+            current_params = roi_params if roi_params else self.roi_params
+            return self.roi_cache.get(key, lambda: CompiledROI(
+                auto_roi_for_shape(h, w, **current_params), (h, w)))
+        if key[0] == 'fixed':
+            return self.roi_cache.get(key, lambda: CompiledROI(self._roi_array, (h, w)))
+        return self.roi_cache.get(key, lambda: CompiledROI(
+            [[0, h], [w, h], [w, 0], [0, 0]], (h, w), full_frame=True))
+
+    def _roi_key(self, frame_shape, roi_params=None):
+        """ROI 캐시 키 (ROI 종류, 파라미터, 프레임 크기)"""
+        h, w = frame_shape[:2]
+        if self.use_adaptive_roi and self.roi_polygon is None:
+            current_params = roi_params if roi_params else self.roi_params
+            return ('auto', ROICache.params_key(current_params), h, w)
+        if self.roi_polygon:
+            return ('fixed', h, w)
+        return ('full', h, w)
+
+    def _perspective_map(self, frame_shape, perspective=None):
         """
-        # [추가] 야간/저조도 대응을 위한 감마 보정 (Gamma Correction)
-        # 이미지를 전체적으로 밝게 만듦 (gamma < 1.0 : 밝게, gamma > 1.0 : 어둡게)
-        # 감마 1.5는 어두운 부분을 밝게 끌어올리면서 밝은 부분은 유지함
-        gamma = 1.5
-        look_up_table = np.array([((i / 255.0) ** (1.0 / gamma)) * 255
-                                  for i in np.arange(0, 256)]).astype("uint8")
-        frame = cv2.LUT(frame, look_up_table)
+        [신규] 프레임 크기에 맞춘 원근 면적 맵 (원근 모델이 없으면 None)
+        
+        Args:
+            frame_shape: 원본 프레임 shape
+            perspective: (선택) 요청별 원근 모델 설정. 없으면 초기화 시 설정 사용
+        """
+        settings = perspective if perspective is not None else self.perspective
+        if not settings:
+            return None
+        h, w = frame_shape[:2]
+        key = ('perspective', perspective_key(settings), h, w)
+        return self.roi_cache.get(key, lambda: PerspectiveMap(settings, (h, w)))
+
+    def _roi_ground_area(self, frame_shape, roi_params, perspective, perspective_map):
+        """ROI 지면 면적 (m², ROI/원근 모델/프레임 크기별 캐시)"""
+        settings = perspective if perspective is not None else self.perspective
+        key = ('ground', self._roi_key(frame_shape, roi_params), perspective_key(settings))
+        compiled_roi = self._compiled_roi(frame_shape, roi_params)
+        return self.roi_cache.get(key, lambda: perspective_map.ground_area(compiled_roi.mask))
+
+    def _zone_ground_areas(self, frame_shape, zone_settings, perspective, compiled_zones, perspective_map):
+        """구역 라벨별 지면 면적 (m², 구역/원근 모델/프레임 크기별 캐시)"""
+        zones = self.zone_settings if zone_settings is None else zone_settings
+        settings = perspective if perspective is not None else self.perspective
+        h, w = frame_shape[:2]
+        key = ('zone_ground', ROICache.zones_key(zones.get('zones') or [], zones.get('exclude') or []),
+               perspective_key(settings), h, w)
+        return self.roi_cache.get(key, lambda: perspective_map.label_areas(
+            compiled_zones.labels, compiled_zones.excluded_label + 1))
 
-        # 원본 크기 저장
+    def _compiled_zones(self, frame_shape, zone_settings=None):
+        """
+        [신규] 프레임 크기에 맞춘 구역 라벨 래스터 (구역/제외 영역이 없으면 None)
+        
+        Args:
+            frame_shape: 원본 프레임 shape
+            zone_settings: (선택) 요청별 구역 설정. 없으면 초기화 시 설정 사용
+        """
+        settings = zone_settings if zone_settings is not None else self.zone_settings
+        if not settings:
+            return None
+        zones = settings.get('zones') or []
+        exclude = settings.get('exclude') or []
+        if not zones and not exclude:
+            return None
+        h, w = frame_shape[:2]
+        key = ('zones', ROICache.zones_key(zones, exclude), h, w)
+        return self.roi_cache.get(key, lambda: CompiledZones(zones, (h, w), exclude))
+
+    def _resolve_roi(self, frame, roi_params=None):
+        """
+        프레임에 적용할 ROI 다각형 (Adaptive or Fixed or 전체 영역)
+        
+        Args:
+            frame: 원본 프레임 이미지
+            roi_params: (선택) 요청별 커스텀 ROI 파라미터
+        """
+        return self._compiled_roi(frame.shape, roi_params).polygon
+
+    def get_inference_region(self, frame, roi_params=None, zone_settings=None):
+        """
+        [신규] ROI 크롭 추론 영역 (x0, y0, x1, y1)
+        
+        ROI 바운딩 박스에 roi_crop_margin만큼 주변 영역을 더한 범위.
+        구역/제외 영역이 있으면 그 바운딩 박스까지 합쳐서 잡음 (ROI 밖 구역 인원도 전체 프레임과 같게 집계).
+        시작 좌표는 128 배수로 내림하여 앵커/풀링 격자가 전체 프레임 추론과 일치하도록 하고,
+        끝 좌표는 패딩 후 크기까지 실제 프레임 픽셀로 채움 (프레임 안쪽에 0 패딩이 생기지 않음).
+        margin이 모델의 수용 영역보다 넓으면 ROI/구역 안 점의 점수는 전체 프레임 추론과 같음
+        
+        Args:
+            frame: 원본 프레임 이미지
+            roi_params: (선택) 요청별 커스텀 ROI 파라미터
+            zone_settings: (선택) 요청별 구역/제외 영역 설정
+        
+        Returns:
+            (x0, y0, x1, y1) 또는 None (크롭해도 입력 크기가 줄지 않거나,
+            크롭 검증에서 전체 프레임 결과와 달랐던 설정이면 전체 프레임 추론)
+        """
+        if not self.roi_crop:
+            return None
+        with self._crop_lock:
+            check = self._crop_checks.get(self._crop_key(frame.shape, roi_params, zone_settings))
+            if check is not None and check['ok'] is False:
+                return None
+        
         h, w = frame.shape[:2]
+        x, y, bw, bh = self._compiled_roi(frame.shape, roi_params).bbox
+        compiled_zones = self._compiled_zones(frame.shape, zone_settings)
+        if compiled_zones is not None:
+            zx, zy, zw, zh = compiled_zones.bbox
+            x1, y1 = max(x + bw, zx + zw), max(y + bh, zy + zh)
+            x, y = min(x, zx), min(y, zy)
+            bw, bh = x1 - x, y1 - y
         
-        # 1. 리사이징 (제거됨)
-        # 원거리 영상에서 사람이 뭉개지는 문제로 인해 원본 해상도 유지
-        scale_ratio = 1.0
-        new_w, new_h = w, h
+        multiple = self.preprocessor.pad_multiple
+        margin = self.roi_crop_margin
+        x0 = max(0, (x - margin) // multiple * multiple)
+        y0 = max(0, (y - margin) // multiple * multiple)
+        x1 = min(w, x + bw + margin)
+        y1 = min(h, y + bh + margin)
+        if x1 <= x0 or y1 <= y0:
+            return None
         
-        # (선택 사항) 만약 너무 큰 이미지가 들어오면 여기서 제한 가능
-        # if self.target_width and w > self.target_width: ...
-            
-        # 2. 128 배수 맞춤 (P2PNet 요구사항 - 필수)
-        # 모델이 128의 배수 크기만 받을 수 있는 경우가 많음
-        gw, gh = new_w, new_h
-        if gw % 128 != 0:
-            gw = ((gw // 128) + 1) * 128
-        if gh % 128 != 0:
-            gh = ((gh // 128) + 1) * 128
-            
-        # 패딩이 필요한 경우
-        pad_w = gw - new_w
-        pad_h = gh - new_h
+        gh, gw = get_padded_size(y1 - y0, x1 - x0, multiple)
+        if (gh, gw) == get_padded_size(h, w, multiple):
+            return None
+        # 패딩으로 채워질 부분은 프레임 픽셀로 (프레임 끝에 닿으면 전체 프레임 추론과 같은 패딩)
+        return (x0, y0, min(w, x0 + gw), min(h, y0 + gh))
+
+    def _crop_key(self, frame_shape, roi_params=None, zone_settings=None):
+        """크롭 검증 키 (ROI 캐시 키, 구역 설정)"""
+        settings = zone_settings if zone_settings is not None else self.zone_settings
+        zones_key = None
+        if settings:
+            zones_key = ROICache.zones_key(settings.get('zones') or [], settings.get('exclude') or [])
+        return (self._roi_key(frame_shape, roi_params), zones_key)
+
+    def crop_check_due(self, frame_shape, region, roi_params=None, zone_settings=None):
+        """
+        [검증] 이번 크롭 프레임을 전체 프레임으로도 추론해 비교할지 여부
         
-        if pad_w > 0 or pad_h > 0:
-            frame = cv2.copyMakeBorder(frame, 0, pad_h, 0, pad_w, cv2.BORDER_CONSTANT, value=(0,0,0))
-            
-        # BGR → RGB
-        img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        img_pil = Image.fromarray(img_rgb)
+        크롭 설정(ROI, 구역, 프레임 크기)별로 처음 roi_crop_verify_frames장(사람이 검출된 프레임 기준)은
+        모두 비교하고, 이후에는 roi_crop_verify_interval장마다 1장씩 비교함.
+        전체 프레임 추론은 호출한 쪽이 크롭 추론과 같은 경로(스케줄러 대기열/배치)로 실행하고
+        결과를 resolve_crop_check()에 넘김
         
-        # Transform
-        img_tensor = self.transform(img_pil).unsqueeze(0).to(self.device)
+        Args:
+            frame_shape: 원본 프레임 shape
+            region: get_inference_region() 결과 (None이면 비교하지 않음)
+        """
+        if region is None or not self.roi_crop_verify_frames:
+            return False
+        key = self._crop_key(frame_shape, roi_params, zone_settings)
+        with self._crop_lock:
+            check = self._crop_checks.setdefault(
+                key, {'frames': 0, 'checked': 0, 'matched': 0, 'ok': None, 'diff': None})
+            check['frames'] += 1
+            if check['ok'] is None:
+                return True
+            return bool(self.roi_crop_verify_interval) and check['frames'] % self.roi_crop_verify_interval == 0
+
+    def resolve_crop_check(self, frame, result, full_result, roi_params=None, zone_settings=None):
+        """
+        [검증] 크롭/전체 프레임 분석 결과 비교 (전체/제외 영역/구역별 인원)
         
-        # FP16 지원
-        if next(self.model.parameters()).dtype == torch.float16:
-            img_tensor = img_tensor.half()
+        하나라도 다르면 그 설정은 이후 get_inference_region이 None을 돌려 전체 프레임으로 추론함
         
-        # 추론
-        with torch.no_grad():
-            outputs = self.model(img_tensor)
+        Returns:
+            result 또는 (불일치 시) full_result
+        """
+        diff = count_diff(result, full_result)
+        non_empty = bool(full_result['count'] or full_result['excluded_count'] or
+                         any(zone['count'] for zone in full_result['zones'].values()))
+        key = self._crop_key(frame.shape, roi_params, zone_settings)
+        with self._crop_lock:
+            check = self._crop_checks.setdefault(
+                key, {'frames': 0, 'checked': 0, 'matched': 0, 'ok': None, 'diff': None})
+            check['checked'] += 1
+            switched = False
+            if diff:
+                switched = check['ok'] is not False
+                check['ok'], check['diff'] = False, diff
+            elif non_empty:
+                # 빈 프레임(워밍업 포함)은 차이가 드러나지 않으므로 검증 완료 조건에 넣지 않음
+                check['matched'] += 1
+                if check['ok'] is None and check['matched'] >= self.roi_crop_verify_frames:
+                    check['ok'] = True
+        if switched:
+            h, w = frame.shape[:2]
+            print(f"⚠️ ROI 크롭 추론 결과가 전체 프레임과 다름 ({w}x{h}, 차이 {diff}) → 전체 프레임 추론으로 전환")
+        return full_result if diff else result
+
+    def get_roi_crop_stats(self):
+        """크롭 검증 현황 (검증 완료/검증 중/전체 프레임 전환 설정 수 + 전환 사유)"""
+        with self._crop_lock:
+            checks = [dict(c) for c in self._crop_checks.values()]
+        return {
+            'enabled': self.roi_crop,
+            'verify_frames': self.roi_crop_verify_frames,
+            'verify_interval': self.roi_crop_verify_interval,
+            'checked': sum(c['checked'] for c in checks),
+            'verified': sum(1 for c in checks if c['ok'] is True),
+            'pending': sum(1 for c in checks if c['ok'] is None),
+            'fallback': [c['diff'] for c in checks if c['ok'] is False],
+        }
+
+    def _postprocess(self, outputs_scores, outputs_points, frame_shape, image_shape=None, offset=(0, 0)):
+        """
+        단일 프레임 모델 출력 → (count, points, scores) 변환
         
-        outputs_scores = torch.nn.functional.softmax(outputs['pred_logits'], -1)[:, :, 1][0]
-        outputs_points = outputs['pred_points'][0]
+        Args:
+            outputs_scores: (N,) 사람 클래스 확률
+            outputs_points: (N, 2) 예측 좌표
+            frame_shape: 원본 프레임 shape (좌표 클램핑용)
+            image_shape: 실제 모델에 넣은 이미지 shape (패딩 영역 제거용, None이면 frame_shape)
+            offset: 모델 입력 이미지의 프레임 내 시작 좌표 (x, y)
+        """
+        points, scores = self._select_points(outputs_scores, outputs_points, image_shape or frame_shape)
+        points[:, 0] += offset[0]
+        points[:, 1] += offset[1]
+        return self._finalize_points(points, scores, frame_shape)
+
+    def _select_points(self, outputs_scores, outputs_points, frame_shape):
+        """
+        임계값 적용 + 패딩 영역에 찍힌 점 제거 → (points, scores) NumPy 배열
         
-        # 임계값
-        threshold = self.threshold
+        Args:
+            frame_shape: 모델 입력 전(패딩 전) 이미지 shape
+        """
+        h, w = frame_shape[:2]
         
         # 마스크 생성
-        mask = outputs_scores > threshold
+        mask = outputs_scores > self.threshold
         points = outputs_points[mask].cpu().numpy()
         scores = outputs_scores[mask].cpu().numpy()  # 점수도 함께 추출
         
         # 3. 좌표 복원 (패딩 제거)
         if len(points) > 0:
-            # 패딩 영역에 찍힌 점 제거
-            valid_mask = (points[:, 0] < new_w) & (points[:, 1] < new_h)
+            valid_mask = (points[:, 0] < w) & (points[:, 1] < h)
             points = points[valid_mask]
             scores = scores[valid_mask]
-            
-            # 좌표 클램핑
-            if len(points) > 0:
-                points[:, 0] = np.clip(points[:, 0], 0, w-1)
-                points[:, 1] = np.clip(points[:, 1], 0, h-1)
+        
+        return points, scores
+
+    def _finalize_points(self, points, scores, frame_shape):
+        """프레임 좌표 클램핑 + ROI 필터링 → (count, points, scores)"""
+        h, w = frame_shape[:2]
+        
+        # 좌표 클램핑
+        if len(points) > 0:
+            points[:, 0] = np.clip(points[:, 0], 0, w-1)
+            points[:, 1] = np.clip(points[:, 1], 0, h-1)
         
         # ROI 필터링 (선택적)
         if self.roi_polygon is not None:
-            # ROI 내부 점들만 필터링
-            roi_mask = [self.is_point_in_roi(p) for p in points]
+            # ROI 내부 점들만 필터링 (래스터 마스크 조회 한 번)
+            roi_mask = self._compiled_roi(frame_shape).contains(points)
             points = points[roi_mask]
             scores = scores[roi_mask]
         
         return len(points), points, scores
+
+    def predict_count(self, frame, region=None):
+        """
+        프레임에서 사람 수 예측 (ROI 필터링 포함)
+        
+        Args:
+            frame: OpenCV BGR 이미지
+            region: (선택) 추론할 영역 (x0, y0, x1, y1), get_inference_region() 결과
+        
+        Returns:
+            count: 사람 수
+            points: 점 좌표 배열
+            scores: 점별 신뢰도
+        """
+        return self.predict_counts([frame], [region])[0]
+
+    def predict_counts(self, frames, regions=None):
+        """
+        [신규] 여러 프레임 배치 예측
+        
+        패딩 후 크기가 같은 프레임끼리 하나의 텐서로 쌓아 P2PNet을 1회만 실행하고,
+        출력을 프레임별로 다시 나눔 (크기가 다르면 크기별로 1회씩 실행)
+        
+        Args:
+            frames: OpenCV BGR 이미지 리스트
+            regions: (선택) 프레임별 추론 영역 (x0, y0, x1, y1) 리스트. None인 항목은 전체 프레임
+        
+        Returns:
+            list: 프레임 순서대로 (count, points, scores) 튜플 (좌표는 원본 프레임 기준)
+        """
+        results = [None] * len(frames)
+        if regions is None:
+            regions = [None] * len(frames)
+        
+        # 0. 추론 영역 잘라내기 (복사 없이 view) + 프레임 내 시작 좌표
+        inputs = []
+        for frame, region in zip(frames, regions):
+            if region is None:
+                inputs.append((frame, (0, 0)))
+            else:
+                x0, y0, x1, y1 = region
+                inputs.append((frame[y0:y1, x0:x1], (x0, y0)))
+        
+        # 1. 패딩 크기별로 그룹화 (타일 추론 대상은 따로 모음)
+        groups = {}
+        tiled = []
+        for idx, (image, _) in enumerate(inputs):
+            if self.tile_size and needs_tiling(image.shape[0], image.shape[1], self.tile_size):
+                tiled.append(idx)
+                continue
+            groups.setdefault(self.preprocessor.get_input_size(image), []).append(idx)
+        
+        for members in groups.values():
+            # 전처리 (그룹 전체를 하나의 배치 버퍼에 채움)
+            batch = self.preprocessor.preprocess([inputs[idx][0] for idx in members])
+            
+            # 2. 그룹당 1회 추론 (FP16 변환은 백엔드에서 처리)
+            outputs = self.backend(batch)
+            
+            batch_scores = torch.nn.functional.softmax(outputs['pred_logits'], -1)[:, :, 1]
+            batch_points = outputs['pred_points']
+            
+            # 3. 프레임별 후처리
+            for b, idx in enumerate(members):
+                image, offset = inputs[idx]
+                results[idx] = self._postprocess(batch_scores[b], batch_points[b], frames[idx].shape,
+                                                 image_shape=image.shape, offset=offset)
+        
+        if tiled:
+            self._predict_tiled(frames, inputs, tiled, results)
+        
+        return results
+
+    def _predict_tiled(self, frames, inputs, indices, results):
+        """
+        [신규] 대형 프레임 타일 추론
+        
+        프레임을 128 정렬된 겹침 타일로 나누고, 모든 프레임의 타일을 max_tiles_per_batch 장씩
+        묶어 추론함 (입력 해상도와 무관하게 한 번에 올라가는 텐서 크기가 제한됨).
+        타일 좌표를 프레임 좌표로 옮긴 뒤 겹침 구간의 중복 점은 격자 기반으로 병합
+        
+        Args:
+            frames: 전체 프레임 리스트
+            inputs: 프레임별 (모델 입력 이미지, 프레임 내 시작 좌표) 리스트
+            indices: 타일 추론할 프레임 인덱스
+            results: 결과를 채울 리스트 (predict_counts와 공유)
+        """
+        # 1. 타일 작업 목록 (패딩 후 크기별 그룹화)
+        tiles_by_frame = {}
+        jobs = {}
+        for idx in indices:
+            image = inputs[idx][0]
+            h, w = image.shape[:2]
+            tiles = compute_tiles(h, w, self.tile_size, self.tile_overlap)
+            tiles_by_frame[idx] = tiles
+            for t, (x0, y0, x1, y1) in enumerate(tiles):
+                crop = image[y0:y1, x0:x1]
+                jobs.setdefault(self.preprocessor.get_input_size(crop), []).append((idx, t, crop))
+        
+        collected = {idx: ([], [], []) for idx in indices}
+        
+        # 2. 타일 예산 단위로 추론
+        for group in jobs.values():
+            for i in range(0, len(group), self.max_tiles_per_batch):
+                chunk = group[i:i + self.max_tiles_per_batch]
+                batch = self.preprocessor.preprocess([crop for _, _, crop in chunk])
+                outputs = self.backend(batch)
+                
+                batch_scores = torch.nn.functional.softmax(outputs['pred_logits'], -1)[:, :, 1]
+                batch_points = outputs['pred_points']
+                
+                for b, (idx, t, crop) in enumerate(chunk):
+                    points, scores = self._select_points(batch_scores[b], batch_points[b], crop.shape)
+                    x0, y0 = tiles_by_frame[idx][t][:2]
+                    points[:, 0] += x0 + inputs[idx][1][0]
+                    points[:, 1] += y0 + inputs[idx][1][1]
+                    collected[idx][0].append(points)
+                    collected[idx][1].append(scores)
+                    collected[idx][2].append(np.full(len(points), t, dtype=np.int32))
+        
+        # 3. 프레임별 중복 병합 + 후처리
+        for idx in indices:
+            points_list, scores_list, ids_list = collected[idx]
+            ox, oy = inputs[idx][1]
+            tiles = [(x0 + ox, y0 + oy, x1 + ox, y1 + oy) for x0, y0, x1, y1 in tiles_by_frame[idx]]
+            points, scores = merge_tile_points(
+                np.concatenate(points_list), np.concatenate(scores_list),
+                np.concatenate(ids_list), tiles, radius=self.tile_merge_radius
+            )
+            results[idx] = self._finalize_points(points, scores, frames[idx].shape)
     
     def calculate_density(self, count):
         """
@@ -249,57 +647,116 @@ class M3CongestionAnalyzer:
         """혼잡도 비율로 위험 등급 판단"""
         return CongestionLevel.get_level(pct)
     
-    def analyze_frame(self, frame, roi_params=None):
+    def analyze_frame(self, frame, roi_params=None, zone_settings=None, perspective=None):
         """
         [업그레이드] 프레임 종합 분석
         Args:
             frame: 분석할 프레임 이미지
             roi_params: (선택) 요청별 커스텀 ROI 파라미터. 없으면 기본 설정 사용.
+            zone_settings: (선택) 요청별 구역/제외 영역 설정. 없으면 기본 설정 사용.
+            perspective: (선택) 요청별 원근 모델 설정. 없으면 기본 설정 사용.
         """
-        h, w = frame.shape[:2]
+        return self.analyze_frames([frame], roi_params=roi_params, zone_settings=zone_settings,
+                                   perspective=perspective)[0]
+
+    def analyze_frames(self, frames, roi_params=None, zone_settings=None, perspective=None):
+        """
+        [신규] 여러 프레임 일괄 분석 (P2PNet 배치 추론)
+        Args:
+            frames: 분석할 프레임 이미지 리스트
+            roi_params: (선택) 요청별 커스텀 ROI 파라미터. 없으면 기본 설정 사용.
+            zone_settings: (선택) 요청별 구역/제외 영역 설정. 없으면 기본 설정 사용.
+            perspective: (선택) 요청별 원근 모델 설정. 없으면 기본 설정 사용.
+        
+        Returns:
+            list: 프레임 순서대로 analyze_frame과 동일한 형식의 결과
+        """
+        # 1. P2PNet 예측 (배치 추론, ROI 바운딩 박스만 잘라서 추론)
+        #    크롭 검증 대상 프레임은 전체 프레임 입력도 같은 배치 호출에 함께 넣음
+        regions = [self.get_inference_region(frame, roi_params, zone_settings) for frame in frames]
+        checks = [i for i, (frame, region) in enumerate(zip(frames, regions))
+                  if self.crop_check_due(frame.shape, region, roi_params, zone_settings)]
+        predictions = self.predict_counts(list(frames) + [frames[i] for i in checks],
+                                          regions + [None] * len(checks))
+        full_predictions = dict(zip(checks, predictions[len(frames):]))
+        return self.analyze_predictions(frames, predictions[:len(frames)], full_predictions,
+                                        roi_params=roi_params, zone_settings=zone_settings, perspective=perspective)
 
-        # 1. P2PNet 예측 (orig의 predict_count 사용)
-        count, points, scores = self.predict_count(frame)
+    def analyze_predictions(self, frames, predictions, full_predictions=None, roi_params=None,
+                            zone_settings=None, perspective=None):
+        """
+        [신규] 프레임별 예측 결과 → 분석 결과 (크롭 검증 포함)
+        
+        Args:
+            frames: 원본 프레임 리스트
+            predictions: 프레임별 predict_count 결과
+            full_predictions: (선택) {프레임 인덱스: 전체 프레임 예측} (crop_check_due가 True였던 프레임)
+            roi_params / zone_settings / perspective: analyze_prediction과 동일
+        """
+        full_predictions = full_predictions or {}
+        results = []
+        for i, (frame, prediction) in enumerate(zip(frames, predictions)):
+            result = self.analyze_prediction(frame, prediction, roi_params=roi_params, zone_settings=zone_settings,
+                                             perspective=perspective)
+            if i in full_predictions:
+                full_result = self.analyze_prediction(frame, full_predictions[i], roi_params=roi_params,
+                                                      zone_settings=zone_settings, perspective=perspective)
+                result = self.resolve_crop_check(frame, result, full_result, roi_params, zone_settings)
+            results.append(result)
+        return results
+
+    def analyze_prediction(self, frame, prediction, roi_params=None, zone_settings=None, perspective=None):
+        """
+        P2PNet 예측 결과에 필터링/ROI/밀도 계산 적용
+        Args:
+            frame: 원본 프레임 이미지
+            prediction: predict_count가 반환한 (count, points, scores)
+            roi_params: (선택) 요청별 커스텀 ROI 파라미터
+            zone_settings: (선택) 요청별 구역/제외 영역 설정
+            perspective: (선택) 요청별 원근 모델 설정
+        """
+        h, w = frame.shape[:2]
+        count, points, scores = prediction
+        perspective_map = self._perspective_map(frame.shape, perspective)
 
         # 2. [신규] 신뢰도 및 원근 필터링
+        # (원근 모델이 있으면 고정 상/하단 컷 대신 면적 맵의 유효 영역으로 필터링)
         points = filter_by_confidence(points, scores, threshold=self.threshold)
-        points = filter_by_perspective(points, h)
+        if perspective_map is None:
+            points = filter_by_perspective(points, h)
+        elif len(points) > 0:
+            points = points[perspective_map.is_valid(points)]
 
-        # 3. [신규] ROI 설정 (Adaptive or Fixed)
-        if self.use_adaptive_roi and self.roi_polygon is None:
-            # 커스텀 파라미터가 들어오면 캐시를 무시하고 새로 계산하거나, 
-            # 기존 로직을 따르되 파라미터를 우선 적용
-            current_params = roi_params if roi_params else self.roi_params
-            
-            # roi_params가 전달되었거나 캐시가 없으면 새로 생성
-            if roi_params is not None or self.cached_roi is None:
-                # 커스텀 파라미터 사용 시 캐시에 저장하지 않음 (다른 요청 간섭 방지)
-                roi = auto_roi(frame, **current_params)
-                
-                # [디버깅] 100번에 1번만 로그 출력 (너무 많음 방지)
-                # import random
-                # if random.random() < 0.01:
-                #     print(f"🔍 [Analyzer] ROI Params used: {current_params}")
-
-                if roi_params is None: # 기본 파라미터일 때만 캐싱
-                    self.cached_roi = roi
+        # 2-1. [신규] 구역별 집계 + 제외 영역 점 제거 (라벨 래스터 조회 + bincount 한 번)
+        zones, excluded_count = {}, 0
+        compiled_zones = self._compiled_zones(frame.shape, zone_settings)
+        if compiled_zones is not None:
+            labels = compiled_zones.label_points(points)
+            if perspective_map is None:
+                zones, excluded_count = compiled_zones.summarize(
+                    labels, weights=scene_point_weights(points, self.scene_weights, h))
             else:
-                roi = self.cached_roi
-        elif self.roi_polygon:
-            roi = np.array(self.roi_polygon, dtype=np.int32)
+                zones, excluded_count = compiled_zones.summarize(
+                    labels, ground_areas=self._zone_ground_areas(
+                        frame.shape, zone_settings, perspective, compiled_zones, perspective_map))
+            if excluded_count:
+                points = points[labels != compiled_zones.excluded_label]
+
+        # 3. [신규] ROI 설정 (Adaptive or Fixed, 프레임 크기별 캐시)
+        compiled_roi = self._compiled_roi(frame.shape, roi_params)
+        roi = compiled_roi.polygon
+
+        # 4. ROI 내부 점 필터링 (래스터 마스크 조회)
+        roi_points = points[compiled_roi.contains(points)] if len(points) else points
+        if len(roi_points) == 0:
+            roi_points = np.empty((0, 2))
+        
+        # 5. [신규] 가중치 기반 밀도 계산 (원근 모델이 있으면 ROI 지면 면적 기준 명/m²)
+        if perspective_map is None:
+            density, pct = calculate_scene_density(roi_points, compiled_roi.area, self.scene_weights, h)
         else:
-            roi = np.array([[0, h], [w, h], [w, 0], [0, 0]], dtype=np.int32)
-
-        # 4. ROI 내부 점 필터링
-        roi_points = []
-        for p in points:
-            if cv2.pointPolygonTest(roi, (float(p[0]), float(p[1])), False) >= 0:
-                roi_points.append(p)
-        roi_points = np.array(roi_points) if roi_points else np.empty((0, 2))
-        
-        # 5. [신규] 가중치 기반 밀도 계산
-        roi_area = cv2.contourArea(roi)
-        density, pct = calculate_scene_density(roi_points, roi_area, self.scene_weights, h)
+            density, pct = ground_density(
+                len(roi_points), self._roi_ground_area(frame.shape, roi_params, perspective, perspective_map))
         risk_level = CongestionLevel.get_level(pct)
 
         return {
@@ -308,6 +765,8 @@ class M3CongestionAnalyzer:
             'pct': pct,
             'risk_level': risk_level,
             'points': roi_points,
-            'roi_polygon': roi
+            'roi_polygon': roi,
+            'zones': zones,
+            'excluded_count': excluded_count
         }
 
@@ -6,15 +6,30 @@ import torch
 import cv2
 import numpy as np
 import sys
-import asyncio
 import os
+import tempfile
+import threading
+import time
 
 from model import P2PNetModel
 from analyzer import M3CongestionAnalyzer
 from alert import AlertSystem
-from constants import DEFAULT_MAX_CAPACITY
-from database import save_detection
-from video_processor import VideoProcessor
+from constants import (DEFAULT_MAX_CAPACITY, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, DEFAULT_MAX_QUEUE_SIZE,
+                       DEFAULT_TILE_SIZE, DEFAULT_TILE_OVERLAP, DEFAULT_MAX_TILES_PER_BATCH,
+                       DEFAULT_ROI_CROP_MARGIN, DEFAULT_ROI_CROP_VERIFY_FRAMES, DEFAULT_ROI_CROP_VERIFY_INTERVAL,
+                       DEFAULT_WARMUP_RESOLUTIONS, DEFAULT_WARMUP_BATCH_SIZES,
+                       DEFAULT_DECODE_WORKERS, DEFAULT_ANALYSIS_WORKERS, DEFAULT_WORKER_QUEUE_SIZE,
+                       DEFAULT_DECODE_MODE, DEFAULT_MAX_GRAB_SKIP, DEFAULT_VIDEO_JOB_WORKERS,
+                       DEFAULT_VIDEO_JOB_QUEUE_SIZE, DEFAULT_MAX_INFERENCES_PER_SEC)
+from database import save_detections
+from stream_registry import StreamRegistry
+from scheduler import InferenceScheduler
+from workers import BlockingPool, EventLoopLagMonitor
+from live_stream import is_live_source
+from video_jobs import VideoJobManager
+from adaptive_sampling import InferenceBudget
+from backends import create_backend
+from weights import load_weights
 
 
 class M3CongestionAPI:
@@ -26,14 +41,24 @@ class M3CongestionAPI:
                  roi_polygon=None, alert_threshold=50, use_fp16=True, **kwargs):
         """
         Args:
-            model_path: P2PNet 모델 파일 경로
+            model_path: P2PNet 모델 파일 경로 (.pth 체크포인트 또는 weights.py로 변환한 .m3w)
             p2pnet_source_path: P2PNet 소스 코드 경로
             device: 'cuda' 또는 'cpu'
             max_capacity: 최대 수용 인원
             roi_polygon: ROI 다각형 좌표 (선택)
             alert_threshold: 경보 발생 임계값 (%)
             use_fp16: FP16 가속 사용 여부
-            **kwargs: 추가 설정 (threshold, use_adaptive_roi, zone_weights, roi_params 등)
+            **kwargs: 추가 설정 (threshold, use_adaptive_roi, zone_weights, roi_params,
+                      max_batch_size, max_wait_ms, max_queue_size,
+                      backend('torch'/'onnx'/'int8'), onnx_path, quantized_path, num_threads,
+                      tile_size, tile_overlap, max_tiles_per_batch, roi_crop, roi_crop_margin,
+                      roi_crop_verify_frames, roi_crop_verify_interval(크롭/전체 프레임 인원 비교),
+                      compile_mode('script'/'compile', torch 백엔드 전용),
+                      optimize_graph(BN 폴딩/미사용 레이어 제거, torch 백엔드 전용),
+                      decode_workers, analysis_workers, worker_queue_size(블로킹 작업 워커 풀),
+                      decode_mode('sequential'/'seek'), max_grab_skip(영상 파일 프레임 건너뛰기),
+                      spool_dir, video_job_workers, video_job_queue_size(영상 업로드 분석 작업),
+                      adaptive_sampling(위험도 기반 분석 주기), max_inferences_per_sec(전체 추론량 제한) 등)
         """
         # P2PNet 소스 경로 추가
         if p2pnet_source_path not in sys.path:
@@ -42,91 +67,258 @@ class M3CongestionAPI:
         from models import build_model
         from model import P2PNetModel  # P2PNetModel 클래스 활용 권장
         
+        backend_name = kwargs.get('backend', 'torch')
+        
+        if backend_name == 'onnx':
+            # ONNX Runtime 백엔드 (CPU 전용, PyTorch 모델 생성 생략)
+            device_obj = torch.device('cpu')
+            model = None
+            backend = create_backend(
+                'onnx',
+                onnx_path=kwargs.get('onnx_path'),
+                num_threads=kwargs.get('num_threads')
+            )
+            print(f"⚡ M3CongestionAPI: ONNX Runtime 백엔드 ({kwargs.get('onnx_path')})")
+        elif backend_name == 'int8':
+            # INT8 양자화 모델 (quantize.py로 변환, CPU 전용)
+            from quantize import load_quantized_model
+            device_obj = torch.device('cpu')
+            quantized_path = kwargs.get('quantized_path') or model_path
+            if kwargs.get('num_threads'):
+                torch.set_num_threads(int(kwargs['num_threads']))
+            model = load_quantized_model(build_model, quantized_path)
+            backend = create_backend('torch', model=model, device=device_obj)
+            print(f"⚡ M3CongestionAPI: INT8 양자화 모델 ({quantized_path})")
+        else:
+            model, device_obj = self._load_torch_model(build_model, model_path, device, use_fp16,
+                                                       optimize_graph=kwargs.get('optimize_graph', False))
+            # [신규] compile_mode를 지정하면 frozen TorchScript / torch.compile 그래프로 실행
+            backend = create_backend('torch', model=model, device=device_obj,
+                                     compile_mode=kwargs.get('compile_mode'))
+        
+        # M3 분석기 (개선된 파라미터 적용)
+        self.analyzer = M3CongestionAnalyzer(
+            model=model,
+            device=device_obj,
+            roi_polygon=roi_polygon,
+            max_capacity=max_capacity,
+            # [신규] Adaptive ROI 활성화 (고정 ROI가 없을 때만)
+            use_adaptive_roi=kwargs.get('use_adaptive_roi', (roi_polygon is None)),
+            zone_weights=kwargs.get('zone_weights', {'near': 0.5, 'mid': 0.3, 'far': 0.2}),
+            threshold=kwargs.get('threshold', 0.45),
+            roi_params=kwargs.get('roi_params'),
+            backend=backend,
+            # [신규] 4K/파노라마 프레임 타일 추론 (tile_size 미지정 시 사용 안 함)
+            tile_size=kwargs.get('tile_size', DEFAULT_TILE_SIZE),
+            tile_overlap=kwargs.get('tile_overlap', DEFAULT_TILE_OVERLAP),
+            max_tiles_per_batch=kwargs.get('max_tiles_per_batch', DEFAULT_MAX_TILES_PER_BATCH),
+            # [신규] ROI 바운딩 박스만 잘라서 추론
+            roi_crop=kwargs.get('roi_crop', False),
+            roi_crop_margin=kwargs.get('roi_crop_margin', DEFAULT_ROI_CROP_MARGIN),
+            roi_crop_verify_frames=kwargs.get('roi_crop_verify_frames', DEFAULT_ROI_CROP_VERIFY_FRAMES),
+            roi_crop_verify_interval=kwargs.get('roi_crop_verify_interval', DEFAULT_ROI_CROP_VERIFY_INTERVAL)
+        )
+        
+        # 알림 시스템
+        self.alert_system = AlertSystem(alert_threshold=alert_threshold)
+        
+        # [신규] 블로킹 작업 워커 풀 (디코딩/분석을 이벤트 루프 밖에서 실행)
+        worker_queue_size = kwargs.get('worker_queue_size', DEFAULT_WORKER_QUEUE_SIZE)
+        self.decode_pool = BlockingPool('decode', kwargs.get('decode_workers', DEFAULT_DECODE_WORKERS),
+                                        worker_queue_size)
+        self.analysis_pool = BlockingPool('analysis', kwargs.get('analysis_workers', DEFAULT_ANALYSIS_WORKERS),
+                                          worker_queue_size)
+        # [신규] 이벤트 루프 지연 측정 (서버 시작 후 start_loop_monitor()로 시작)
+        self.loop_monitor = EventLoopLagMonitor()
+        
+        # 추론 스케줄러 (모든 카메라/요청의 프레임을 동적 배치로 묶음)
+        self.scheduler = InferenceScheduler(
+            self.analyzer,
+            max_batch_size=kwargs.get('max_batch_size', DEFAULT_MAX_BATCH_SIZE),
+            max_wait_ms=kwargs.get('max_wait_ms', DEFAULT_MAX_WAIT_MS),
+            max_queue_size=kwargs.get('max_queue_size', DEFAULT_MAX_QUEUE_SIZE),
+            analysis_pool=self.analysis_pool
+        )
+        
+        # [신규] 전체 초당 추론량 제한 (카메라 스트림/영상 작업 공용, 0이면 제한 없음)
+        self.inference_budget = InferenceBudget(
+            kwargs.get('max_inferences_per_sec', DEFAULT_MAX_INFERENCES_PER_SEC))
+        
+        # 백그라운드 프로세서 초기화
+        # 카메라별 스트림 분석 태스크 (카메라마다 VideoProcessor/태스크/중지 신호가 따로 있음)
+        self.streams = StreamRegistry(self.analyzer, scheduler=self.scheduler,
+                                      decode_pool=self.decode_pool, analysis_pool=self.analysis_pool,
+                                      decode_mode=kwargs.get('decode_mode', DEFAULT_DECODE_MODE),
+                                      max_grab_skip=kwargs.get('max_grab_skip', DEFAULT_MAX_GRAB_SKIP),
+                                      adaptive=kwargs.get('adaptive_sampling', True),
+                                      budget=self.inference_budget)
+        
+        # [신규] 영상 업로드 분석 작업 엔진 (spool 파일 + 작업 대기열 + 워커)
+        self.jobs = VideoJobManager(
+            self.scheduler,
+            spool_dir=kwargs.get('spool_dir') or os.path.join(tempfile.gettempdir(), 'm3_spool'),
+            decode_pool=self.decode_pool,
+            max_workers=kwargs.get('video_job_workers', DEFAULT_VIDEO_JOB_WORKERS),
+            max_queue_size=kwargs.get('video_job_queue_size', DEFAULT_VIDEO_JOB_QUEUE_SIZE),
+            persist=save_detections,
+            budget=self.inference_budget
+        )
+        
+        # 워밍업 상태 (start_warmup() 호출 시 완료될 때까지 False)
+        self.ready = True
+        self.warmup_stats = None
+        self._warmup_thread = None
+        
+        print(f"✅ M3CongestionAPI 초기화 완료")
+
+    def warmup(self, resolutions=DEFAULT_WARMUP_RESOLUTIONS, batch_sizes=None):
+        """
+        자주 쓰는 해상도로 분석 경로를 미리 실행 (그래프 생성 + cuDNN/oneDNN 알고리즘 선택)
+        
+        ROI 크롭/타일 추론 후의 실제 입력 shape이 만들어지도록 기본 ROI와
+        CCTV별 맞춤 ROI/구역 설정을 모두 거쳐 analyze_frames를 실행함
+        
+        Args:
+            resolutions: (H, W) 목록 (기본: 720p, 1080p, 4K)
+            batch_sizes: 워밍업할 배치 크기 목록 (기본: 1, 카메라 분석 주기당 5장, 스케줄러 max_batch_size)
+                         frozen 그래프는 배치 크기까지 포함한 shape별로 만들어지므로 실제로 쓰는 크기를 모두 실행
+        
+        Returns:
+            dict: 해상도별 첫 호출 시간 (ms)
+        """
+        from config import M3Config
+        # 기본 설정 + CCTV별 ROI/구역 설정 (구역이 있으면 크롭 영역이 달라짐)
+        cctv_ids = sorted(set(M3Config.ROI_SETTINGS_MAP) | set(M3Config.ZONE_SETTINGS_MAP))
+        settings_list = [(None, None)] + [(M3Config.get_roi_params(cctv_id), M3Config.get_zone_settings(cctv_id))
+                                          for cctv_id in cctv_ids]
+        if batch_sizes is None:
+            batch_sizes = sorted(set(DEFAULT_WARMUP_BATCH_SIZES) | {self.scheduler.max_batch_size})
+        
+        self.ready = False
+        stats = {}
+        start = time.perf_counter()
+        try:
+            for h, w in resolutions:
+                for batch_size in batch_sizes:
+                    frames = [np.zeros((h, w, 3), dtype=np.uint8)] * batch_size
+                    t0 = time.perf_counter()
+                    for roi_params, zone_settings in settings_list:
+                        self.analyzer.analyze_frames(frames, roi_params=roi_params, zone_settings=zone_settings)
+                    elapsed = (time.perf_counter() - t0) * 1000
+                    stats[f"{w}x{h}/b{batch_size}"] = round(elapsed, 1)
+                    print(f"🔥 워밍업 {w}x{h} (batch={batch_size}): {elapsed:.0f} ms")
+        finally:
+            self.warmup_stats = stats
+            self.ready = True
+        print(f"✅ 워밍업 완료 ({time.perf_counter() - start:.1f}s)")
+        return stats
+
+    def start_warmup(self, **kwargs):
+        """백그라운드 스레드에서 warmup() 실행 (완료 전까지 ready=False)"""
+        if self._warmup_thread is not None and self._warmup_thread.is_alive():
+            return
+        self.ready = False
+        self._warmup_thread = threading.Thread(target=self.warmup, kwargs=kwargs,
+                                               name="m3-warmup", daemon=True)
+        self._warmup_thread.start()
+
+    @staticmethod
+    def _load_torch_model(build_model, model_path, device, use_fp16, optimize_graph=False):
+        """
+        PyTorch P2PNet 모델 생성 및 체크포인트 로드
+
+        Returns:
+            (model, device_obj)
+        """
         # 모델 로드
         if device == 'cuda' and not torch.cuda.is_available():
             print("\n" + "!"*60)
             print("❌ [치명적 경고] GPU(CUDA)를 요청했으나 사용할 수 없습니다!")
             print("   -> CPU 모드로 강제 전환됩니다. 속도가 매우 느릴 것입니다.")
-            print("   -> 해결책: PyTorch CUDA 버전을 설치해주세요.")
+            print("   -> 해결책: PyTorch CUDA 버전을 설치하거나 ONNX 백엔드(backend='onnx')를 사용해주세요.")
             print("!"*60 + "\n")
             device_obj = torch.device('cpu')
         else:
             device_obj = torch.device(device)
-            
+
         # [디버깅] 현재 사용 중인 디바이스 출력
         if device_obj.type == 'cuda':
             print(f"✅ GPU 가속 활성화: {torch.cuda.get_device_name(0)}")
         else:
             print(f"⚠️ CPU 모드로 실행 중 (느림)")
-        
+
         class Args:
             backbone = 'vgg16_bn'
             row = 2
             line = 2
-        
+
         args = Args()
         model = build_model(args, training=False)
-        checkpoint = torch.load(model_path, map_location=device_obj)
-        model.load_state_dict(checkpoint['model'])
+        # .m3w 가중치면 mmap으로 로드 (워커 간 페이지 공유), 아니면 기존 torch.load
+        load_weights(model, model_path, map_location=device_obj)
         model.to(device_obj)
-        
+
+        # [신규] Conv-BN 폴딩 / 미사용 레이어 제거 (FP32에서 폴딩한 뒤 FP16 변환)
+        if optimize_graph:
+            from optimize_graph import optimize_model, print_report
+            model.float().eval()
+            model, report = optimize_model(model, inplace=True)
+            print_report(report)
+
         # FP16 적용
         if use_fp16 and device_obj.type == 'cuda':
             model.half()
             print("⚡ M3CongestionAPI: FP16 모드 활성화")
             torch.backends.cudnn.benchmark = True
-            
+        else:
+            # FP16으로 저장된 가중치를 FP32로 복원 (이미 FP32면 복사 없음)
+            model.float()
+
         model.eval()
-        
-        # M3 분석기 (개선된 파라미터 적용)
-        self.analyzer = M3CongestionAnalyzer(
-            model=model,
-            device=device_obj,
-            roi_polygon=roi_polygon,
-            max_capacity=max_capacity,
-            # [신규] Adaptive ROI 활성화 (고정 ROI가 없을 때만)
-            use_adaptive_roi=kwargs.get('use_adaptive_roi', (roi_polygon is None)),
-            zone_weights=kwargs.get('zone_weights', {'near': 0.5, 'mid': 0.3, 'far': 0.2}),
-            threshold=kwargs.get('threshold', 0.45),
-            roi_params=kwargs.get('roi_params')
-        )
-        
-        # 알림 시스템
-        self.alert_system = AlertSystem(alert_threshold=alert_threshold)
-        
-        # 백그라운드 프로세서 초기화
-        self.processor = VideoProcessor(self.analyzer)
-        
-        print(f"✅ M3CongestionAPI 초기화 완료")
-        
-    def start_background_task(self, video_path, cctv_no, interval_seconds=60, db_cctv_uuid=None):
+        return model, device_obj
+
+    def start_background_task(self, video_path, cctv_no, interval_seconds=60, db_cctv_uuid=None, live=None):
         """
         백그라운드 분석 시작
         Args:
-            video_path: 영상 경로
+            video_path: 영상 경로 또는 스트림 URL (rtsp://, http:// 등)
             cctv_no: ROI 조회용 ID (예: CCTV_01)
             interval_seconds: 분석 주기
             db_cctv_uuid: DB 저장용 UUID (없으면 cctv_no 사용)
+            live: 실시간 스트림 모드 (None이면 URL일 때만, True면 로컬 파일을 대체 스트림으로 사용)
+        
+        Returns:
+            bool: 새로 시작했으면 True (영상이 없거나 이미 실행 중이면 False)
         """
-        if not os.path.exists(video_path):
+        if not is_live_source(video_path) and not os.path.exists(video_path):
             print(f"⚠️ 영상 파일 없음: {video_path}")
-            return
+            return False
+        if self.streams.is_running(cctv_no):
+            print(f"↩️ [{cctv_no}] 이미 분석 중입니다.")
+            return False
             
         # [수정] 1. Config에서 CCTV ID에 맞는 ROI 설정 가져오기
-        from config import M3Config
-        custom_roi_params = M3Config.get_roi_params(cctv_no)
-        
-        print(f"✅ [{cctv_no}] 맞춤 ROI 설정 로드: {custom_roi_params}")
+        settings = self.get_camera_settings(cctv_no)
+        print(f"✅ [{cctv_no}] 맞춤 ROI 설정 로드: {settings['roi_params']}")
 
-        asyncio.create_task(
-            self.processor.process_stream_simulation(
-                video_path=video_path,
-                cctv_no=cctv_no,
-                interval_seconds=interval_seconds,
-                roi_params=custom_roi_params,
-                db_cctv_uuid=db_cctv_uuid  # [추가] DB 저장용 ID 전달
-            )
+        return self.streams.start(
+            cctv_no,
+            video_path=video_path,
+            interval_seconds=interval_seconds,
+            db_cctv_uuid=db_cctv_uuid,  # [추가] DB 저장용 ID 전달
+            live=live,
+            **settings
         )
+
+    @staticmethod
+    def get_camera_settings(cctv_no):
+        """CCTV별 ROI/구역/원근 설정 (analyze_frames 인자 형식)"""
+        from config import M3Config
+        return {
+            'roi_params': M3Config.get_roi_params(cctv_no),
+            'zone_settings': M3Config.get_zone_settings(cctv_no),
+            'perspective': M3Config.get_perspective_settings(cctv_no),
+        }
     
     def analyze_image_bytes(self, image_bytes):
         """
@@ -145,6 +337,61 @@ class M3CongestionAPI:
         # 분석
         result = self.analyzer.analyze_frame(frame)
         
+        return self._build_response(result)
+    
+    @staticmethod
+    def decode_image(image_bytes):
+        """이미지 바이너리 → OpenCV BGR 프레임 (디코딩 실패 시 None)"""
+        return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+    async def decode_image_async(self, image_bytes):
+        """decode_image를 디코딩 워커 풀에서 실행"""
+        return await self.decode_pool.run(self.decode_image, image_bytes)
+
+    async def analyze_frame_async(self, frame):
+        """
+        디코딩된 프레임 분석 (추론 스케줄러 경유, 전/후처리는 분석 워커 풀에서 실행)
+        
+        다른 카메라 프레임과 함께 배치로 묶여 추론되며, 대기열이 가득 차면
+        SchedulerFullError를 발생시킴
+        """
+        result = await self.scheduler.analyze_frame(frame)
+        return self._build_response(result)
+
+    async def analyze_image_bytes_async(self, image_bytes):
+        """
+        analyze_image_bytes의 비동기 버전 (디코딩/추론 모두 이벤트 루프 밖에서 실행)
+        """
+        frame = await self.decode_image_async(image_bytes)
+        if frame is None:
+            raise ValueError("이미지를 디코딩할 수 없습니다.")
+        return await self.analyze_frame_async(frame)
+
+    def start_services(self):
+        """이벤트 루프 지연 측정 + 영상 작업 워커 시작 (이벤트 루프 안에서 호출)"""
+        self.loop_monitor.start()
+        self.jobs.start()
+
+    async def shutdown(self):
+        """스트림/영상 작업/루프 측정/스케줄러/워커 풀 종료 (서버 종료 시)"""
+        await self.streams.stop_all()
+        await self.jobs.stop()
+        await self.loop_monitor.stop()
+        self.scheduler.stop()
+        self.decode_pool.shutdown()
+        self.analysis_pool.shutdown()
+
+    def get_worker_stats(self):
+        """워커 풀 / 이벤트 루프 지연 통계"""
+        return {
+            'decode_pool': self.decode_pool.get_stats(),
+            'analysis_pool': self.analysis_pool.get_stats(),
+            'event_loop_lag': self.loop_monitor.get_stats(),
+            'inference_budget': self.inference_budget.get_stats(),
+        }
+    
+    def _build_response(self, result):
+        """분석 결과 + 경보 체크 → API 응답 dict"""
         # 경보 체크
         should_alert, alert_msg = self.alert_system.check_alert(
             result['pct'], 
@@ -159,18 +406,47 @@ class M3CongestionAPI:
             'risk_level_en': result['risk_level'].name,
             'alert': should_alert,
             'alert_message': alert_msg if should_alert else None,
-            'points': result['points'].tolist()
+            'points': result['points'].tolist(),
+            'zones': {
+                name: {
+                    'count': zone['count'],
+                    'density': float(zone['density']),
+                    'pct': float(zone['pct']),
+                    'risk_level': zone['risk_level'].korean,
+                    'risk_level_en': zone['risk_level'].name,
+                }
+                for name, zone in result.get('zones', {}).items()
+            },
+            'excluded_count': result.get('excluded_count', 0)
         }
     
-    def analyze_frame(self, frame):
+    def analyze_frame(self, frame, zone_settings=None, perspective=None):
         """
         OpenCV 프레임에서 혼잡도 분석
         
         Args:
             frame: OpenCV BGR 이미지
+            zone_settings: (선택) 구역/제외 영역 설정 (M3Config.get_zone_settings)
+            perspective: (선택) 원근 모델 설정 (M3Config.get_perspective_settings)
         
         Returns:
-            dict: 분석 결과
+            dict: 분석 결과 (구역별 결과는 'zones')
+        """
+        return self.analyzer.analyze_frame(frame, zone_settings=zone_settings, perspective=perspective)
+
+    def analyze_frames(self, frames, roi_params=None, zone_settings=None, perspective=None):
+        """
+        여러 OpenCV 프레임을 한 번의 배치 추론으로 분석
+
+        Args:
+            frames: OpenCV BGR 이미지 리스트
+            roi_params: (선택) 커스텀 ROI 파라미터
+            zone_settings: (선택) 구역/제외 영역 설정
+            perspective: (선택) 원근 모델 설정
+
+        Returns:
+            list: 프레임별 분석 결과
         """
-        return self.analyzer.analyze_frame(frame)
+        return self.analyzer.analyze_frames(frames, roi_params=roi_params, zone_settings=zone_settings,
+                                            perspective=perspective)
 
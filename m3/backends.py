@@ -0,0 +1,189 @@
+"""
+P2PNet 추론 백엔드
+
+M3CongestionAnalyzer는 백엔드를 통해서만 모델을 실행함
+- TorchBackend: PyTorch eager 모델 (기존 방식, GPU/FP16 및 quantize.py INT8 모델 지원)
+- CompiledTorchBackend: 입력 shape별 frozen TorchScript 그래프 또는 torch.compile (opt-in)
+- OnnxRuntimeBackend: export_onnx.py로 만든 ONNX 모델을 ONNX Runtime으로 실행 (CPU 서버용)
+
+모든 백엔드는 (B, 3, H, W) float32 텐서를 받아
+{'pred_logits': (B, N, 2), 'pred_points': (B, N, 2)} 텐서 dict를 반환
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from constants import DEFAULT_MAX_COMPILED_GRAPHS
+
+logger = logging.getLogger(__name__)
+
+# CompiledTorchBackend 모드
+COMPILE_MODES = ('script', 'compile')
+
+# ONNX 입출력 이름 (export_onnx.py와 공유)
+ONNX_INPUT_NAME = 'image'
+ONNX_OUTPUT_NAMES = ['pred_logits', 'pred_points']
+
+
+class TorchBackend:
+    """PyTorch eager 모델 백엔드"""
+    name = 'torch'
+
+    def __init__(self, model, device):
+        """
+        Args:
+            model: P2PNet 모델 (eval 모드)
+            device: 모델이 올라가 있는 디바이스
+        """
+        self.model = model
+        self.device = device
+
+    @property
+    def dtype(self):
+        # INT8 양자화 모델은 가중치가 packed params라 부동소수점 파라미터가 없을 수 있음
+        for param in self.model.parameters():
+            if param.is_floating_point():
+                return param.dtype
+        return torch.float32
+
+    def __call__(self, batch):
+        # FP16 지원
+        if self.dtype == torch.float16:
+            batch = batch.half()
+        with torch.no_grad():
+            return self.model(batch)
+
+
+class CompiledTorchBackend(TorchBackend):
+    """
+    고정(frozen) 그래프 백엔드
+
+    - 'script': 입력 shape별로 torch.jit.trace → torch.jit.freeze 한 그래프를 LRU로 캐시
+      (shape마다 따로 만들기 때문에 앵커 크기 등 shape 의존 연산이 그래프에 상수로 고정되어도 안전)
+    - 'compile': torch.compile(dynamic=False), shape마다 한 번씩 재컴파일
+
+    어느 모드든 새 shape의 첫 호출은 그래프 생성 + cuDNN/oneDNN 알고리즘 선택 비용이 크므로
+    M3CongestionAPI.warmup()으로 자주 쓰는 해상도를 미리 실행해 두는 것을 권장
+    """
+    name = 'compiled'
+
+    def __init__(self, model, device, mode='script', max_graphs=DEFAULT_MAX_COMPILED_GRAPHS):
+        """
+        Args:
+            model: P2PNet 모델 (eval 모드)
+            device: 모델이 올라가 있는 디바이스
+            mode: 'script' 또는 'compile'
+            max_graphs: 'script' 모드에서 유지할 최대 그래프 수 (shape 기준 LRU)
+        """
+        super().__init__(model, device)
+        if mode not in COMPILE_MODES:
+            raise ValueError(f"지원하지 않는 컴파일 모드입니다: {mode} (가능: {COMPILE_MODES})")
+        if mode == 'compile' and not hasattr(torch, 'compile'):
+            raise RuntimeError("torch.compile은 PyTorch 2.0 이상에서만 사용할 수 있습니다. mode='script'를 사용해주세요.")
+
+        self.mode = mode
+        self.name = f'compiled-{mode}'
+        self.max_graphs = max_graphs
+        self._graphs = OrderedDict()
+        self._lock = threading.Lock()
+        self._compiled = torch.compile(model, dynamic=False) if mode == 'compile' else None
+
+    def _trace(self, batch):
+        traced = torch.jit.trace(self.model, batch, strict=False, check_trace=False)
+        return torch.jit.freeze(traced.eval())
+
+    def _get_graph(self, batch):
+        key = (tuple(batch.shape), batch.dtype, batch.device)
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is not None:
+                self._graphs.move_to_end(key)
+                return graph
+
+            graph = self._trace(batch)
+            self._graphs[key] = graph
+            if len(self._graphs) > self.max_graphs:
+                self._graphs.popitem(last=False)
+            logger.info(f"🧊 frozen 그래프 생성: {tuple(batch.shape)} (캐시 {len(self._graphs)}개)")
+            return graph
+
+    def __call__(self, batch):
+        # FP16 지원
+        if self.dtype == torch.float16:
+            batch = batch.half()
+        with torch.no_grad():
+            if self._compiled is not None:
+                return self._compiled(batch)
+            return self._get_graph(batch)(batch)
+
+
+class OnnxRuntimeBackend:
+    """ONNX Runtime 백엔드 (CPU 추론용)"""
+    name = 'onnx'
+
+    def __init__(self, onnx_path, num_threads=None, providers=None):
+        """
+        Args:
+            onnx_path: export_onnx.py로 변환한 .onnx 파일 경로
+            num_threads: 연산자 내부 스레드 수 (None이면 ONNX Runtime 기본값)
+            providers: 실행 프로바이더 목록 (기본: CPUExecutionProvider)
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("ONNX 백엔드를 사용하려면 onnxruntime을 설치해주세요: pip install onnxruntime")
+
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"ONNX 모델 파일이 없습니다: {onnx_path}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+            options.inter_op_num_threads = 1
+
+        self.onnx_path = onnx_path
+        self.num_threads = num_threads
+        self.device = torch.device('cpu')
+        self.dtype = torch.float32
+        self.session = ort.InferenceSession(
+            onnx_path, sess_options=options,
+            providers=providers or ['CPUExecutionProvider']
+        )
+        logger.info(f"✅ ONNX Runtime 세션 생성: {onnx_path} (threads={num_threads or 'auto'})")
+
+    def __call__(self, batch):
+        image = batch.detach().cpu().numpy()
+        if not image.flags['C_CONTIGUOUS']:
+            image = np.ascontiguousarray(image)
+        pred_logits, pred_points = self.session.run(ONNX_OUTPUT_NAMES, {ONNX_INPUT_NAME: image})
+        return {
+            'pred_logits': torch.from_numpy(pred_logits),
+            'pred_points': torch.from_numpy(pred_points)
+        }
+
+
+def create_backend(backend, model=None, device=None, onnx_path=None, num_threads=None, compile_mode=None):
+    """
+    백엔드 이름으로 백엔드 객체 생성
+
+    Args:
+        backend: 'torch' 또는 'onnx'
+        model, device: torch 백엔드용
+        onnx_path, num_threads: onnx 백엔드용
+        compile_mode: torch 백엔드를 frozen/compiled 그래프로 실행 ('script'/'compile', None이면 eager)
+    """
+    if backend == 'torch':
+        if compile_mode:
+            return CompiledTorchBackend(model, device, mode=compile_mode)
+        return TorchBackend(model, device)
+    if backend == 'onnx':
+        if not onnx_path:
+            raise ValueError("ONNX 백엔드는 onnx_path가 필요합니다.")
+        return OnnxRuntimeBackend(onnx_path, num_threads=num_threads)
+    raise ValueError(f"지원하지 않는 백엔드입니다: {backend}")
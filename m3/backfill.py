@@ -0,0 +1,350 @@
+"""
+녹화 영상 재분석 (DAT_Crowd_Detection 백필)
+
+모델/ROI 설정을 바꾼 뒤 보관 중인 녹화 영상(.mov)을 다시 분석해 DB를 채움
+- 분할: 영상을 segment_sec 단위 구간으로 나누되 경계를 직전 키프레임에 맞춤
+  (구간마다 키프레임부터 디코딩하므로 워커끼리 같은 GOP를 중복 디코딩하지 않음)
+- 병렬: 프로세스 풀, 워커마다 분석기 1개를 initializer에서 로드
+  샘플 위치는 영상 전체 기준 격자(interval초마다)라 구간/워커 수와 관계없이 결과가 같음
+- 병합: 구간별 결과를 프레임 인덱스(타임스탬프) 순으로 합침
+- 체크포인트: 구간이 끝날 때마다 <영상>.backfill.json에 저장. 중단 후 다시 실행하면 남은 구간만 처리
+  (분석 설정이 달라졌으면 --restart로 처음부터)
+- 저장: database.save_analysis_results로 bulk insert. insert한 행 수도 체크포인트에 기록해 재실행 시 중복 저장 방지
+
+사용 예:
+    python backfill.py /home/ubuntu/storage/m3 --model-path best_mae.pth --p2pnet-source ./p2pnet_source \
+        --cctv-no CCTV_01 --db-cctv-uuid <COM_CCTV.cctv_no> --workers 4 --interval 20
+
+    python backfill.py IMG_3577.mov --model-path best_mae.pth --p2pnet-source ./p2pnet_source \
+        --dry-run --output-dir ./backfill_out
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+from adaptive_sampling import risk_priority
+from constants import (DEFAULT_ARCHIVE_DIR, DEFAULT_BACKFILL_SEGMENT_SEC, DEFAULT_BACKFILL_INTERVAL_SEC,
+                       DEFAULT_BULK_INSERT_SIZE)
+from frame_reader import FrameReader, list_keyframes
+
+VIDEO_EXTS = ('.mov', '.mp4', '.avi', '.mkv')
+FRAMES_PER_SAMPLE = 5   # VideoProcessor와 같이 샘플마다 연속 5프레임을 분석해 중앙값 사용
+CHECKPOINT_VERSION = 2
+
+# 워커 프로세스마다 1개 (initializer에서 생성)
+_worker_api = None
+
+
+# ----------------------------------------------------------------------
+# 워커 프로세스
+# ----------------------------------------------------------------------
+def _init_worker(api_kwargs, num_threads):
+    """워커 시작 시 분석기 로드 (프로세스당 1회)"""
+    global _worker_api
+    if num_threads:
+        import torch
+        torch.set_num_threads(num_threads)
+    from api import M3CongestionAPI
+    _worker_api = M3CongestionAPI(**api_kwargs)
+
+
+def _analyze_segment(video_path, segment, sample_frames, total_frames, cctv_no):
+    """(워커 프로세스) 구간 하나의 샘플 분석 → (구간 번호, 결과 리스트, 디코딩 통계)"""
+    settings = _worker_api.get_camera_settings(cctv_no) if cctv_no else {}
+    reader = FrameReader(video_path, mode='sequential')
+    fps, _ = reader.open()
+    fps = fps if fps > 0 else 30.0
+    results = []
+    try:
+        for frame_idx in sample_frames:
+            # 영상 끝을 넘겨 읽으면 처음으로 돌아가므로 남은 프레임만 읽음
+            count = min(FRAMES_PER_SAMPLE, total_frames - frame_idx) if total_frames > 0 else FRAMES_PER_SAMPLE
+            frames, looped = reader.read(frame_idx, count=count)
+            if looped or not frames:
+                break
+            data = _worker_api.analyzer.analyze_frames(frames, **settings)
+            median_count = statistics.median(r['count'] for r in data)
+            final = min(data, key=lambda r: abs(r['count'] - median_count))
+            results.append({
+                'frame_idx': frame_idx,
+                'video_sec': round(frame_idx / fps, 3),
+                'count': final['count'],
+                'pct': round(float(final['pct']), 2),
+                'risk_level': final['risk_level'].name,
+                'risk_level_int': risk_priority(final['risk_level']),
+            })
+    finally:
+        reader.release()
+    return segment['index'], results, dict(reader.stats)
+
+
+# ----------------------------------------------------------------------
+# 분할 / 체크포인트
+# ----------------------------------------------------------------------
+def plan_segments(total_frames, fps, keyframes, segment_sec):
+    """segment_sec 간격의 경계를 직전 키프레임으로 당겨 구간 목록 생성 ([{'index', 'start', 'end'}])"""
+    target = max(1, int(segment_sec * fps))
+    starts = [0]
+    cut = target
+    while cut < total_frames:
+        if keyframes:
+            start = keyframes[bisect.bisect_right(keyframes, cut) - 1]
+        else:
+            start = cut
+        if start > starts[-1]:
+            starts.append(start)
+        cut += target
+    ends = starts[1:] + [total_frames]
+    return [{'index': i, 'start': s, 'end': e} for i, (s, e) in enumerate(zip(starts, ends))]
+
+
+def checkpoint_path(video_path, checkpoint_dir=None):
+    name = os.path.basename(video_path) + '.backfill.json'
+    return os.path.join(checkpoint_dir or os.path.dirname(os.path.abspath(video_path)), name)
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    """임시 파일에 쓴 뒤 교체 (쓰는 도중 중단돼도 이전 체크포인트 유지)"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def camera_settings_hash(cctv_no):
+    """CCTV별 ROI/구역/원근 설정의 해시 (M3CongestionAPI.get_camera_settings와 같은 값, 설정이 없으면 None)"""
+    if not cctv_no:
+        return None
+    # 메인 프로세스에서는 torch를 올리지 않도록 api 대신 config에서 직접 읽음
+    from config import M3Config
+    settings = {
+        'roi_params': M3Config.get_roi_params(cctv_no),
+        'zone_settings': M3Config.get_zone_settings(cctv_no),
+        'perspective': M3Config.get_perspective_settings(cctv_no),
+    }
+    encoded = json.dumps(settings, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+def model_file_stat(path):
+    """모델 파일 [크기, 수정 시각] (같은 경로에 다시 학습/변환한 파일을 덮어쓴 경우 구분용)"""
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def make_fingerprint(video_path, args):
+    """결과에 영향을 주는 설정 (달라지면 체크포인트를 이어 쓸 수 없음)"""
+    stat = os.stat(video_path)
+    return {
+        'version': CHECKPOINT_VERSION,
+        'video': os.path.abspath(video_path),
+        'size': stat.st_size,
+        'mtime': int(stat.st_mtime),
+        'interval': args.interval,
+        'segment_sec': args.segment_sec,
+        'model_path': os.path.abspath(args.model_path),
+        'model_stat': model_file_stat(args.model_path),
+        'onnx_stat': model_file_stat(args.onnx_path),
+        'quantized_stat': model_file_stat(args.quantized_path),
+        'backend': args.backend,
+        'cctv_no': args.cctv_no,
+        'camera_settings': camera_settings_hash(args.cctv_no),
+        'db_cctv_uuid': args.db_cctv_uuid,
+    }
+
+
+def find_videos(paths):
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                 if name.lower().endswith(VIDEO_EXTS)))
+        elif os.path.exists(path):
+            videos.append(path)
+        else:
+            print(f"⚠️ 영상을 찾을 수 없습니다: {path}")
+    return videos
+
+
+# ----------------------------------------------------------------------
+# 영상 1개 처리
+# ----------------------------------------------------------------------
+def backfill_video(video_path, args, executor):
+    reader = FrameReader(video_path)
+    fps, total_frames = reader.open()
+    opened = reader.is_opened()
+    reader.release()
+    if not opened or total_frames <= 0:
+        print(f"⚠️ 영상을 열 수 없습니다 (또는 프레임 수를 알 수 없음): {video_path}")
+        return None
+    fps = fps if fps > 0 else 30.0
+
+    ckpt_path = checkpoint_path(video_path, args.checkpoint_dir)
+    os.makedirs(os.path.dirname(ckpt_path), exist_ok=True)
+    fingerprint = make_fingerprint(video_path, args)
+    state = None if args.restart else load_checkpoint(ckpt_path)
+    if state is not None and state['fingerprint'] != fingerprint:
+        raise SystemExit(f"체크포인트의 분석 설정이 다릅니다: {ckpt_path} (처음부터 다시 하려면 --restart)")
+
+    if state is None:
+        keyframes = list_keyframes(video_path)
+        if args.start_time:
+            start_time = datetime.fromisoformat(args.start_time)
+            if start_time.tzinfo is None:
+                start_time = start_time.astimezone()
+        else:
+            # 녹화 파일의 수정 시각 = 녹화 종료 시각으로 보고 영상 길이만큼 앞당김
+            start_time = datetime.fromtimestamp(os.stat(video_path).st_mtime, tz=timezone.utc) - \
+                timedelta(seconds=total_frames / fps)
+        state = {
+            'fingerprint': fingerprint,
+            'fps': fps,
+            'total_frames': total_frames,
+            'start_time': start_time.astimezone(timezone.utc).isoformat(),
+            'keyframes': len(keyframes),
+            'segments': plan_segments(total_frames, fps, keyframes, args.segment_sec),
+            'done': {},
+            'inserted': 0,
+        }
+        save_checkpoint(ckpt_path, state)
+
+    step = max(1, int(args.interval * fps))
+    pending = [seg for seg in state['segments'] if str(seg['index']) not in state['done']]
+    print(f"🎬 {video_path}: {total_frames} 프레임 @ {fps:.2f} fps, 키프레임 {state['keyframes']}개, "
+          f"구간 {len(state['segments'])}개 (남은 구간 {len(pending)}개)")
+
+    # 1. 구간별 분석 (워커 프로세스)
+    start = time.perf_counter()
+    futures = []
+    for seg in pending:
+        first = -(-seg['start'] // step) * step  # 구간 안의 첫 격자 위치
+        samples = list(range(first, seg['end'], step))
+        futures.append(executor.submit(_analyze_segment, video_path, seg, samples, total_frames, args.cctv_no))
+    for i, future in enumerate(as_completed(futures), 1):
+        index, results, stats = future.result()
+        state['done'][str(index)] = results
+        save_checkpoint(ckpt_path, state)
+        print(f"  구간 {index} 완료 ({i}/{len(futures)}): 샘플 {len(results)}개, "
+              f"seek {stats['seeks']} / grab {stats['grabbed']}")
+    if futures:
+        print(f"  분석 {time.perf_counter() - start:.1f}s")
+
+    # 2. 타임스탬프 순 병합
+    merged = sorted((row for rows in state['done'].values() for row in rows), key=lambda r: r['frame_idx'])
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        out_path = os.path.join(args.output_dir, os.path.splitext(os.path.basename(video_path))[0] + '_backfill.jsonl')
+        with open(out_path, 'w', encoding='utf-8') as f:
+            for row in merged:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        print(f"  결과 {len(merged)}건 저장: {out_path}")
+
+    # 3. DB bulk insert (이미 insert한 행은 건너뜀)
+    if not args.dry_run:
+        asyncio.run(insert_results(merged, state, ckpt_path, args))
+    return merged
+
+
+async def insert_results(merged, state, ckpt_path, args):
+    from database import get_db
+
+    db = get_db()
+    if not db.is_enabled():
+        raise SystemExit("DB가 비활성화되어 있습니다 (SUPABASE_URL/SUPABASE_KEY 확인, 또는 --dry-run)")
+    start_time = datetime.fromisoformat(state['start_time'])
+    while state['inserted'] < len(merged):
+        chunk = merged[state['inserted']:state['inserted'] + args.insert_batch]
+        rows = [{
+            'cctv_no': args.db_cctv_uuid,
+            'detected_at': (start_time + timedelta(seconds=row['video_sec'])).isoformat(),
+            'person_count': row['count'],
+            'congestion_level': int(row['pct']),
+            'risk_level_int': row['risk_level_int'],
+        } for row in chunk]
+        saved = await db.save_analysis_results(rows)
+        if saved < len(rows):
+            raise SystemExit(f"DB 저장 실패 ({state['inserted']}번째 행부터). 다시 실행하면 이어서 저장합니다.")
+        state['inserted'] += saved
+        save_checkpoint(ckpt_path, state)
+    print(f"  DB 저장 {state['inserted']}/{len(merged)}건")
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+def get_args_parser():
+    parser = argparse.ArgumentParser('M3 archive backfill', add_help=True)
+    parser.add_argument('videos', nargs='*', default=[DEFAULT_ARCHIVE_DIR],
+                        help=f'영상 파일 또는 디렉터리 (기본: {DEFAULT_ARCHIVE_DIR})')
+    parser.add_argument('--model-path', required=True, help='학습된 체크포인트 (.pth / .m3w)')
+    parser.add_argument('--p2pnet-source', required=True, help='P2PNet 소스 경로')
+    parser.add_argument('--device', default='cpu', help="'cuda' 또는 'cpu'")
+    parser.add_argument('--backend', default='torch', choices=['torch', 'onnx', 'int8'])
+    parser.add_argument('--onnx-path', default=None, help='ONNX 백엔드용 모델 경로')
+    parser.add_argument('--quantized-path', default=None, help='INT8 백엔드용 모델 경로 (quantize.py 결과)')
+    parser.add_argument('--workers', default=2, type=int, help='워커 프로세스 수 (프로세스마다 분석기 1개)')
+    parser.add_argument('--num-threads', default=None, type=int,
+                        help='워커당 torch/ONNX 스레드 수 (기본: CPU 수 / 워커 수)')
+    parser.add_argument('--interval', default=DEFAULT_BACKFILL_INTERVAL_SEC, type=float, help='샘플링 주기 (초)')
+    parser.add_argument('--segment-sec', default=DEFAULT_BACKFILL_SEGMENT_SEC, type=float,
+                        help='구간 길이 (초, 키프레임에 맞춰 조정)')
+    parser.add_argument('--cctv-no', default=None, help='적용할 CCTV별 ROI/구역/원근 설정 (예: CCTV_01)')
+    parser.add_argument('--db-cctv-uuid', default=None, help='DB 저장용 CCTV UUID (COM_CCTV.cctv_no)')
+    parser.add_argument('--start-time', default=None,
+                        help='녹화 시작 시각 ISO 8601 (기본: 파일 수정 시각 - 영상 길이)')
+    parser.add_argument('--insert-batch', default=DEFAULT_BULK_INSERT_SIZE, type=int, help='insert 1회당 행 수')
+    parser.add_argument('--checkpoint-dir', default=None, help='체크포인트 저장 경로 (기본: 영상과 같은 디렉터리)')
+    parser.add_argument('--output-dir', default=None, help='병합 결과 JSONL 저장 경로 (선택)')
+    parser.add_argument('--dry-run', action='store_true', help='DB에 저장하지 않음')
+    parser.add_argument('--restart', action='store_true', help='체크포인트를 무시하고 처음부터')
+    return parser
+
+
+def main(args):
+    if not args.dry_run and not args.db_cctv_uuid:
+        raise SystemExit("--db-cctv-uuid가 필요합니다 (저장 없이 분석만 하려면 --dry-run)")
+    videos = find_videos(args.videos)
+    if not videos:
+        raise SystemExit("처리할 영상이 없습니다.")
+
+    num_threads = args.num_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    api_kwargs = {
+        'model_path': args.model_path,
+        'p2pnet_source_path': args.p2pnet_source,
+        'device': args.device,
+        'backend': args.backend,
+        'onnx_path': args.onnx_path,
+        'quantized_path': args.quantized_path,
+        'num_threads': num_threads,
+    }
+    print(f"📼 M3 백필: 영상 {len(videos)}개, workers={args.workers} (스레드 {num_threads}), "
+          f"interval={args.interval}s, segment={args.segment_sec}s{' (dry-run)' if args.dry_run else ''}")
+
+    # CUDA/torch 스레드 상태를 물려받지 않도록 spawn으로 워커 생성
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(api_kwargs, num_threads)) as executor:
+        for video_path in videos:
+            backfill_video(video_path, args, executor)
+
+
+if __name__ == '__main__':
+    main(get_args_parser().parse_args())
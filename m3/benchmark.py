@@ -0,0 +1,425 @@
+"""
+M3 추론 성능 벤치마크
+
+백엔드별 초당 처리 프레임 수(FPS)와 프레임당 지연 시간을 측정
+--startup이면 워커 프로세스 여러 개를 동시에 띄워 모델 로드 시간과 워커별 RSS/PSS를 측정
+(.pth 체크포인트와 weights.py로 변환한 .m3w 가중치 비교)
+--postprocess면 모델 없이 후처리 필터(신뢰도/원근/구역 밀도)를 점 개수별로 측정
+--decode면 모델 없이 영상 파일 샘플링(seek ↔ sequential grab)의 샘플 프레임당 CPU 시간 측정
+--replay면 VideoProcessor를 가상 시계로 영상 1회 최대 속도 재생 → 타임라인(JSONL) + 단계별 처리량
+
+사용 예:
+    python benchmark.py --model-path best_mae.pth --p2pnet-source ./p2pnet_source \
+        --backends torch onnx int8 --onnx-path p2pnet.onnx --quantized-path p2pnet_int8.pth \
+        --num-threads 4 --resolution 1920x1080
+
+    python benchmark.py --model-path best_mae.pth --p2pnet-source ./p2pnet_source \
+        --startup --weights-path best_mae.m3w --workers 4
+
+    python benchmark.py --model-path best_mae.pth --p2pnet-source ./p2pnet_source \
+        --compile-modes eager script compile --resolutions 1280x720 1920x1080 3840x2160
+
+    python benchmark.py --postprocess --point-counts 10 100 1000 10000
+
+    python benchmark.py --decode sample.mov --intervals 1 3 10 20 --samples 20
+
+    python benchmark.py --model-path best_mae.pth --p2pnet-source ./p2pnet_source \
+        --replay sample.mov --interval 20 --timeline sample_timeline.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import time
+
+import numpy as np
+import torch
+
+from constants import DEFAULT_MAX_GRAB_SKIP
+
+
+def parse_resolution(text):
+    """'1920x1080' → (h, w)"""
+    w, h = text.lower().split('x')
+    return int(h), int(w)
+
+
+def make_frames(resolution, count, seed=0):
+    """벤치마크용 랜덤 BGR 프레임 생성"""
+    h, w = resolution
+    rng = np.random.RandomState(seed)
+    return [rng.randint(0, 256, (h, w, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def time_calls(fn, iters, warmup=2):
+    """fn()을 warmup회 실행 후 iters회 측정 (초 단위 리스트 반환)"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(name, timings, frames_per_call):
+    """측정 결과 요약 출력"""
+    mean = statistics.mean(timings)
+    p50 = statistics.median(timings)
+    p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+    fps = frames_per_call / mean if mean > 0 else float('inf')
+    print(f"  {name:<24} mean {mean * 1000:8.1f} ms | p50 {p50 * 1000:8.1f} ms | "
+          f"p95 {p95 * 1000:8.1f} ms | {fps:7.2f} FPS")
+    return {'name': name, 'mean_ms': mean * 1000, 'p50_ms': p50 * 1000, 'p95_ms': p95 * 1000, 'fps': fps}
+
+
+def build_api(args, backend, compile_mode=None):
+    from api import M3CongestionAPI
+    return M3CongestionAPI(
+        model_path=args.model_path,
+        p2pnet_source_path=args.p2pnet_source,
+        device=args.device,
+        backend=backend,
+        onnx_path=args.onnx_path,
+        quantized_path=args.quantized_path,
+        num_threads=args.num_threads,
+        compile_mode=compile_mode,
+    )
+
+
+def bench_backends(args):
+    """백엔드별 analyze_frames FPS 비교"""
+    frames = make_frames(parse_resolution(args.resolution), args.batch)
+    results = []
+    for backend in args.backends:
+        api = build_api(args, backend)
+        timings = time_calls(lambda: api.analyzer.analyze_frames(frames), args.iters, args.warmup)
+        results.append(summarize(f"{backend} (batch={args.batch})", timings, len(frames)))
+    return results
+
+
+def bench_compile_modes(args):
+    """
+    eager / script / compile 모드별 해상도마다 cold(첫 호출) / warm 지연 시간 비교
+
+    cold는 새 shape의 첫 호출 (그래프 생성 + 알고리즘 선택 포함), warm은 이후 반복 호출
+    """
+    results = []
+    for mode in args.compile_modes:
+        api = build_api(args, 'torch', compile_mode=None if mode == 'eager' else mode)
+        for resolution in args.resolutions:
+            frames = make_frames(parse_resolution(resolution), args.batch)
+            start = time.perf_counter()
+            api.analyzer.analyze_frames(frames)
+            cold = time.perf_counter() - start
+            print(f"  {mode + ' ' + resolution:<24} cold {cold * 1000:8.1f} ms")
+            warm = summarize(f"{mode} {resolution} warm", time_calls(
+                lambda: api.analyzer.analyze_frames(frames), args.iters, warmup=0), len(frames))
+            results.append({'mode': mode, 'resolution': resolution, 'cold_ms': cold * 1000, **warm})
+    return results
+
+
+# 벡터화 이전의 for 루프 구현 (--postprocess에서 결과 비교/속도 기준으로 사용)
+def _loop_filter_by_confidence(points, scores, threshold=0.45):
+    filtered = []
+    for (x, y), s in zip(points, scores):
+        if s >= threshold:
+            filtered.append((x, y))
+    return np.array(filtered) if filtered else np.empty((0, 2))
+
+
+def _loop_filter_by_perspective(points, frame_height):
+    if len(points) == 0: return points
+    filtered = []
+    for p in points:
+        x, y = p[0], p[1]
+        if y < frame_height * 0.10: continue
+        if y > frame_height * 0.95: continue
+        filtered.append((x, y))
+    return np.array(filtered) if filtered else np.empty((0, 2))
+
+
+def _loop_calculate_scene_density(points, roi_area, scene_weights, frame_height):
+    if frame_height is None or roi_area <= 0: return 0.0, 0.0
+    near, mid, far = 0, 0, 0
+    for p in points:
+        y = p[1]
+        if y > frame_height * 0.66: near += 1
+        elif y > frame_height * 0.33: mid += 1
+        else: far += 1
+    weighted_count = (near * scene_weights[0] + mid * scene_weights[1] + far * scene_weights[2])
+    weighted_density = weighted_count / roi_area * 1000
+    pct = min(100, (weighted_density / 0.15) * 100)
+    return weighted_density, pct
+
+
+def _same(a, b):
+    if isinstance(a, tuple):
+        return a == b
+    return a.shape == b.shape and a.dtype == b.dtype and np.array_equal(a, b)
+
+
+def bench_postprocess(args):
+    """
+    후처리 필터의 for 루프 구현 ↔ 벡터화 구현 비교 (점 개수별)
+
+    P2PNet 출력과 같은 float32 (N, 2) 점/점수를 만들어 결과가 같은지 확인한 뒤 지연 시간 측정
+    """
+    from analyzer import filter_by_confidence, filter_by_perspective, calculate_scene_density
+    from constants import DEFAULT_ZONE_WEIGHTS
+
+    h, w = parse_resolution(args.resolution)
+    weights = [DEFAULT_ZONE_WEIGHTS[k] for k in ('near', 'mid', 'far')]
+    roi_area = float(h * w) * 0.5
+    rng = np.random.RandomState(0)
+
+    cases = (
+        ('confidence', _loop_filter_by_confidence, filter_by_confidence,
+         lambda p, s: (p, s, 0.45)),
+        ('perspective', _loop_filter_by_perspective, filter_by_perspective,
+         lambda p, s: (p, h)),
+        ('scene_density', _loop_calculate_scene_density, calculate_scene_density,
+         lambda p, s: (p, roi_area, weights, h)),
+    )
+    results = []
+    for n in args.point_counts:
+        points = (rng.rand(n, 2) * [w, h]).astype(np.float32)
+        scores = rng.rand(n).astype(np.float32)
+        print(f"  --- {n} points ---")
+        for name, loop_fn, vec_fn, make_args in cases:
+            call_args = make_args(points, scores)
+            if not _same(loop_fn(*call_args), vec_fn(*call_args)):
+                raise AssertionError(f"{name}: 벡터화 결과가 기존 구현과 다릅니다 (N={n})")
+            loop = summarize(f"{name} loop", time_calls(lambda: loop_fn(*call_args), args.iters, args.warmup), 1)
+            vec = summarize(f"{name} numpy", time_calls(lambda: vec_fn(*call_args), args.iters, args.warmup), 1)
+            results.append({'points': n, 'filter': name, 'loop_ms': loop['mean_ms'], 'numpy_ms': vec['mean_ms']})
+    return results
+
+
+def bench_decode(args):
+    """
+    영상 파일 샘플링 방식별 CPU 시간 비교 (주기별)
+
+    VideoProcessor와 같이 interval초마다 5프레임씩 읽으며 프로세스 CPU 시간(디코더 스레드 포함)을
+    샘플 프레임 수로 나눔. 두 방식이 같은 프레임을 읽었는지도 함께 확인
+    """
+    import hashlib
+    from frame_reader import FrameReader, DECODE_MODES
+
+    frames_per_sample = 5
+    results = []
+    for interval in args.intervals:
+        digests = {}
+        print(f"  --- interval {interval}s ---")
+        for mode in DECODE_MODES:
+            reader = FrameReader(args.decode, mode=mode, max_grab_skip=args.max_grab_skip)
+            fps, total_frames = reader.open()
+            if not reader.is_opened():
+                raise SystemExit(f"영상을 열 수 없습니다: {args.decode}")
+            fps = fps if fps > 0 else 30.0
+            step = int(interval * fps)
+
+            digest = hashlib.md5()
+            frame_idx = 0
+            cpu_start, wall_start = time.process_time(), time.perf_counter()
+            for _ in range(args.samples):
+                frames, looped = reader.read(frame_idx, count=frames_per_sample)
+                for frame in frames:
+                    digest.update(frame.tobytes())
+                frame_idx = (0 if looped else frame_idx) + step
+                if total_frames > 0:
+                    frame_idx %= total_frames
+            cpu = time.process_time() - cpu_start
+            wall = time.perf_counter() - wall_start
+            reader.release()
+
+            sampled = args.samples * frames_per_sample
+            digests[mode] = digest.hexdigest()
+            row = {'interval_s': interval, 'mode': mode, 'cpu_ms_per_frame': cpu / sampled * 1000,
+                   'wall_ms_per_frame': wall / sampled * 1000, **reader.stats}
+            results.append(row)
+            print(f"  {mode:<10} cpu {row['cpu_ms_per_frame']:8.2f} ms/frame | wall {row['wall_ms_per_frame']:8.2f} "
+                  f"ms/frame | seeks {reader.stats['seeks']:4d} grabbed {reader.stats['grabbed']:6d} "
+                  f"(skip {step}프레임)")
+        if len(set(digests.values())) > 1:
+            print("  ⚠️ 방식별로 읽은 프레임이 다릅니다 (컨테이너의 seek 정확도 확인 필요)")
+    return results
+
+
+def bench_replay(args):
+    """
+    영상 1회 오프라인 재생 처리량 (VideoProcessor + VirtualClock)
+
+    분석 주기 대기 없이 영상을 끝까지 처리하고, 타임라인의 단계별 소요 시간으로
+    주기당 지연과 실시간 대비 배속(시뮬레이션 시간 / 실제 걸린 시간)을 계산
+    """
+    from replay_clock import VirtualClock
+    from video_processor import VideoProcessor
+
+    api = build_api(args, args.backends[0])
+    settings = api.get_camera_settings(args.cctv_no) if args.cctv_no else {}
+    timeline_path = args.timeline or f"{os.path.splitext(os.path.basename(args.replay))[0]}_timeline.jsonl"
+    processor = VideoProcessor(api.analyzer, clock=VirtualClock(), adaptive=not args.fixed_interval)
+
+    wall_start = time.perf_counter()
+    asyncio.run(processor.process_stream_simulation(
+        args.replay, cctv_no=args.cctv_no or 'replay', interval_seconds=args.interval,
+        timeline_path=timeline_path, **settings))
+    wall = time.perf_counter() - wall_start
+
+    with open(timeline_path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    if not records:
+        raise SystemExit(f"분석된 주기가 없습니다: {args.replay}")
+    frames = sum(r['frames'] for r in records)
+    sim_sec = records[-1]['sim_time_sec'] + records[-1]['interval_sec']
+    print(f"  주기 {len(records)}회 / 프레임 {frames}장 | 시뮬레이션 {sim_sec:.0f}s → 실제 {wall:.1f}s "
+          f"({sim_sec / wall:.0f}배속) | {frames / wall:.2f} FPS")
+    for stage in ('decode', 'budget', 'analyze', 'save', 'total'):
+        values = sorted(r['timings_ms'][stage] for r in records)
+        p95 = values[max(0, int(len(values) * 0.95) - 1)]
+        print(f"  {stage:<8} mean {statistics.mean(values):8.1f} ms | p50 {statistics.median(values):8.1f} ms | "
+              f"p95 {p95:8.1f} ms")
+    print(f"  타임라인: {timeline_path}")
+    return {'cycles': len(records), 'frames': frames, 'sim_sec': sim_sec, 'wall_sec': wall}
+
+
+def read_memory_mb():
+    """
+    현재 프로세스 메모리 (MB)
+
+    Linux는 /proc/self/smaps_rollup의 Rss/Pss/공유 페이지를, 그 외에는 최대 RSS만 반환
+    (PSS는 공유 페이지를 공유한 프로세스 수로 나눈 값이라 워커 간 공유 효과가 드러남)
+    """
+    try:
+        fields = {}
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+        return {
+            'rss': fields.get('Rss', 0.0),
+            'pss': fields.get('Pss', 0.0),
+            'shared': fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0),
+        }
+    except OSError:
+        return {'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 'pss': None, 'shared': None}
+
+
+def _startup_worker(model_path, p2pnet_source, device, barrier, results):
+    """워커 1개: 모델 로드 시간 측정 후, 모든 워커가 로드를 마친 시점의 메모리 보고"""
+    from model import P2PNetModel
+
+    start = time.perf_counter()
+    P2PNetModel(model_path, p2pnet_source, device=device, use_fp16=False)
+    load_time = time.perf_counter() - start
+
+    barrier.wait()
+    results.put({'load_s': load_time, **read_memory_mb()})
+    # 다른 워커가 측정을 끝낼 때까지 종료하지 않음 (공유 페이지 유지)
+    barrier.wait()
+
+
+def bench_startup(args):
+    """가중치 파일별 동시 워커 로드 시간 / 워커별 메모리 비교"""
+    ctx = multiprocessing.get_context('spawn')
+    paths = [args.model_path] + ([args.weights_path] if args.weights_path else [])
+    summary = []
+    for path in paths:
+        barrier = ctx.Barrier(args.workers)
+        results = ctx.Queue()
+        procs = [ctx.Process(target=_startup_worker, args=(path, args.p2pnet_source, args.device, barrier, results))
+                 for _ in range(args.workers)]
+        for p in procs:
+            p.start()
+        stats = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+        row = {
+            'path': path,
+            'load_s': statistics.mean(s['load_s'] for s in stats),
+            'rss_mb': statistics.mean(s['rss'] for s in stats),
+            'pss_mb': statistics.mean(s['pss'] for s in stats) if stats[0]['pss'] is not None else None,
+        }
+        summary.append(row)
+        pss = f"{row['pss_mb']:8.1f} MB" if row['pss_mb'] is not None else '     n/a'
+        print(f"  {path:<32} load {row['load_s']:6.2f} s | RSS {row['rss_mb']:8.1f} MB | PSS {pss} "
+              f"(workers={args.workers})")
+    return summary
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser('M3 inference benchmark', add_help=True)
+    parser.add_argument('--model-path', default=None, help='학습된 체크포인트 (.pth, --postprocess 외 필수)')
+    parser.add_argument('--p2pnet-source', default=None, help='P2PNet 소스 경로 (--postprocess 외 필수)')
+    parser.add_argument('--device', default='cpu', help="'cuda' 또는 'cpu'")
+    parser.add_argument('--backends', nargs='+', default=['torch'], choices=['torch', 'onnx', 'int8'])
+    parser.add_argument('--onnx-path', default=None, help='ONNX 백엔드용 모델 경로')
+    parser.add_argument('--quantized-path', default=None, help='INT8 백엔드용 모델 경로 (quantize.py 결과)')
+    parser.add_argument('--num-threads', default=None, type=int, help='ONNX Runtime / torch 스레드 수')
+    parser.add_argument('--resolution', default='1920x1080', help='입력 해상도 (WxH)')
+    parser.add_argument('--batch', default=1, type=int, help='analyze_frames 한 번에 넣을 프레임 수')
+    parser.add_argument('--iters', default=10, type=int)
+    parser.add_argument('--warmup', default=2, type=int)
+    parser.add_argument('--startup', action='store_true', help='워커 시작 시간/메모리 측정 모드')
+    parser.add_argument('--weights-path', default=None, help='--startup 비교용 .m3w 가중치 (weights.py 결과)')
+    parser.add_argument('--workers', default=2, type=int, help='--startup에서 동시에 띄울 워커 수')
+    parser.add_argument('--compile-modes', nargs='+', default=None, choices=['eager', 'script', 'compile'],
+                        help='컴파일 모드별 cold/warm 지연 시간 비교')
+    parser.add_argument('--resolutions', nargs='+', default=['1280x720', '1920x1080', '3840x2160'],
+                        help='--compile-modes에서 측정할 해상도 목록 (WxH)')
+    parser.add_argument('--postprocess', action='store_true', help='후처리 필터 마이크로 벤치마크 (모델 불필요)')
+    parser.add_argument('--point-counts', nargs='+', type=int, default=[10, 100, 1000, 10000],
+                        help='--postprocess에서 측정할 점 개수 목록')
+    parser.add_argument('--decode', default=None, help='영상 파일 샘플링 벤치마크에 쓸 영상 경로 (모델 불필요)')
+    parser.add_argument('--intervals', nargs='+', type=float, default=[1, 3, 10, 20, 60],
+                        help='--decode에서 측정할 분석 주기 목록 (초)')
+    parser.add_argument('--samples', default=20, type=int, help='--decode에서 주기별 샘플링 횟수')
+    parser.add_argument('--max-grab-skip', default=DEFAULT_MAX_GRAB_SKIP, type=int,
+                        help='--decode sequential 모드에서 항상 seek으로 전환할 건너뛰기 프레임 수 (기본: 제한 없음)')
+    parser.add_argument('--replay', default=None, help='가상 시계로 1회 재생할 영상 경로 (처리량 벤치마크)')
+    parser.add_argument('--interval', default=20, type=float, help='--replay 기본 분석 주기 (초)')
+    parser.add_argument('--fixed-interval', action='store_true', help='--replay에서 적응형 분석 주기 끄기')
+    parser.add_argument('--timeline', default=None, help='--replay 타임라인 출력 경로 (기본: <영상이름>_timeline.jsonl)')
+    parser.add_argument('--cctv-no', default=None, help='--replay에 적용할 CCTV별 ROI/구역/원근 설정')
+    return parser
+
+
+def main(args):
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+    if args.postprocess:
+        print(f"📊 M3 후처리 벤치마크: points={args.point_counts}, iters={args.iters}")
+        bench_postprocess(args)
+        return
+    if args.decode:
+        print(f"📊 M3 디코딩 벤치마크: {args.decode}, intervals={args.intervals}s, samples={args.samples}")
+        bench_decode(args)
+        return
+    if not args.model_path or not args.p2pnet_source:
+        raise SystemExit("--model-path와 --p2pnet-source가 필요합니다.")
+    if args.startup:
+        print(f"📊 M3 시작 벤치마크: workers={args.workers}, device={args.device}")
+        bench_startup(args)
+        return
+    if args.replay:
+        print(f"📊 M3 재생 벤치마크: {args.replay}, interval={args.interval}s, backend={args.backends[0]}")
+        bench_replay(args)
+        return
+    if args.compile_modes:
+        print(f"📊 M3 컴파일 모드 벤치마크: {args.compile_modes}, iters={args.iters}")
+        bench_compile_modes(args)
+        return
+    print(f"📊 M3 벤치마크: {args.resolution}, iters={args.iters}")
+    bench_backends(args)
+
+
+if __name__ == '__main__':
+    main(get_args_parser().parse_args())
@@ -68,8 +68,49 @@ class M3Config:
     
     # 기본 ROI (Adaptive ROI 실패 시 사용)
     ROI_POLYGON = None  # Adaptive ROI 사용 시 None
+    # 모든 CCTV에 공통으로 적용할 제외 영역 (비율 좌표 다각형 목록, 광고판/거울 등 오탐 구역)
     EXCLUDE_POLYGONS = []
     
+    # [신규] CCTV별 구역(zone) / 제외 영역 설정 (비율 좌표 0.0~1.0 → 해상도와 무관)
+    # 구역마다 인원/밀도/PCT를 따로 계산하고, 제외 영역 안의 점은 전체/구역 인원에서 뺌
+    ZONE_SETTINGS_MAP = {
+        # 'CCTV_01': {
+        #     'zones': [
+        #         {'name': 'entrance', 'polygon': [(0.0, 0.6), (0.35, 0.6), (0.35, 1.0), (0.0, 1.0)]},
+        #         {'name': 'platform', 'polygon': [(0.35, 0.4), (0.75, 0.4), (0.75, 1.0), (0.35, 1.0)],
+        #          'max_capacity': 120},
+        #         {'name': 'exit', 'polygon': [(0.75, 0.6), (1.0, 0.6), (1.0, 1.0), (0.75, 1.0)]},
+        #     ],
+        #     'exclude': [[(0.85, 0.0), (1.0, 0.0), (1.0, 0.25), (0.85, 0.25)]],
+        # },
+    }
+    
+    # [신규] CCTV별 원근 모델 (설정이 없으면 기존 Near/Mid/Far 가중치 + 상/하단 컷 사용)
+    # 설정하면 밀도를 명/m² 기준으로 계산하므로 카메라 간 pct를 같은 기준으로 비교할 수 있음
+    PERSPECTIVE_SETTINGS_MAP = {
+        # 행별 사람 키 측정값 (y 비율, 사람 키 / 프레임 높이)
+        # 'CCTV_01': {'type': 'row_scale', 'rows': [(0.65, 0.06), (0.95, 0.22)]},
+        # 바닥 위 네 점의 영상 좌표(비율)와 실제 좌표(m)
+        # 'CCTV_02': {'type': 'homography',
+        #             'image_points': [(0.42, 0.20), (0.58, 0.20), (0.85, 0.95), (0.15, 0.95)],
+        #             'ground_points': [(0.0, 40.0), (8.0, 40.0), (8.0, 0.0), (0.0, 0.0)]},
+    }
+    
+    @classmethod
+    def get_perspective_settings(cls, cctv_id):
+        """CCTV ID의 원근 모델 설정 (없으면 None)"""
+        return cls.PERSPECTIVE_SETTINGS_MAP.get(cctv_id)
+    
+    @classmethod
+    def get_zone_settings(cls, cctv_id):
+        """CCTV ID의 구역/제외 영역 설정 (공통 EXCLUDE_POLYGONS 포함, 설정이 없으면 None)"""
+        settings = cls.ZONE_SETTINGS_MAP.get(cctv_id, {})
+        zones = settings.get('zones', [])
+        exclude = list(settings.get('exclude', [])) + list(cls.EXCLUDE_POLYGONS)
+        if not zones and not exclude:
+            return None
+        return {'zones': zones, 'exclude': exclude}
+    
     # 정적 필터 미사용
     USE_STATIC_FILTER = False
     STATIC_THRESHOLD = 0.85
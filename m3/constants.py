@@ -50,3 +50,100 @@ DEFAULT_ROI_PARAMS = {
     'bottom_w_ratio': 0.6
 }
 
+
+# 4. 추론 스케줄러 (카메라 간 동적 배치)
+DEFAULT_MAX_BATCH_SIZE = 8     # 한 번에 묶을 최대 프레임 수
+DEFAULT_MAX_WAIT_MS = 20       # 배치를 채우기 위해 기다리는 최대 시간 (ms)
+DEFAULT_MAX_QUEUE_SIZE = 64    # 대기열 최대 길이 (초과 시 요청 거절)
+                               # 동시 실행 카메라 수 × 분석 주기당 프레임 수(5) 이상으로 설정 (INFER_MAX_QUEUE_SIZE)
+
+
+# 5. 타일 추론 (4K/파노라마 프레임 메모리 상한)
+DEFAULT_TILE_SIZE = None           # 타일 크기 (px, 128 배수). None이면 타일 추론 사용 안 함 (예: 1024)
+DEFAULT_TILE_OVERLAP = 128         # 타일 간 겹침 폭 (px, 128 배수)
+DEFAULT_MAX_TILES_PER_BATCH = 4    # 한 번의 추론에 넣을 최대 타일 수 (메모리 예산)
+DEFAULT_TILE_MERGE_RADIUS = 8.0    # 겹침 구간에서 같은 사람으로 볼 최대 거리 (px, 앵커 간격 8px)
+
+
+# 6. ROI 크롭 추론
+DEFAULT_ROI_CROP_MARGIN = 256      # ROI 바운딩 박스 바깥으로 함께 추론할 주변 영역 (px, 128 배수)
+                                   # P2PNet 출력 1점의 수용 영역(VGG16 conv5_3 196px + FPN/헤드 3x3 conv ≈ 250px)보다 넓게 잡아
+                                   # ROI 안 점의 점수가 전체 프레임 추론과 같도록 함
+DEFAULT_ROI_CROP_VERIFY_FRAMES = 3 # 크롭 설정별로 전체 프레임 추론과 인원을 비교할 프레임 수 (0이면 비교 안 함)
+DEFAULT_ROI_CROP_VERIFY_INTERVAL = 100  # 검증이 끝난 뒤에도 크롭 프레임 N장마다 1장씩 다시 비교 (0이면 처음 몇 장만)
+
+
+# 7. 컴파일 추론 / 워밍업
+DEFAULT_MAX_COMPILED_GRAPHS = 48   # shape별 frozen 그래프 최대 개수 (워밍업 해상도 3 × ROI 설정 3 × 배치 크기 3 + 여유)
+DEFAULT_WARMUP_RESOLUTIONS = [     # 시작 시 미리 실행할 카메라 해상도 (H, W)
+    (720, 1280),    # 720p  → 768x1280
+    (1080, 1920),   # 1080p → 1152x1920
+    (2160, 3840),   # 4K    → 2176x3840
+]
+DEFAULT_WARMUP_BATCH_SIZES = (1, 5)  # 워밍업할 배치 크기 (단일 이미지, 카메라 분석 주기당 5장) + 스케줄러 max_batch_size
+
+
+# 8. ROI 캐시
+DEFAULT_ROI_CACHE_SIZE = 16        # (ROI 파라미터, 프레임 크기)별 ROI 마스크 최대 개수 (1080p 마스크 1개 ≈ 2MB)
+
+
+# 9. 밀도 → PCT 환산 기준
+DENSITY_FULL_PCT = 0.15            # 1000px당 가중 인원 0.15명을 100%로 가정 (전체 ROI/구역 공통)
+
+
+# 10. 원근 모델 (카메라별 지면 면적 맵)
+PERSON_HEIGHT_M = 1.7              # 원근 환산에 쓰는 평균 키 (m)
+DEFAULT_MIN_PERSON_PX = 12         # 사람 키가 이보다 작게 보이는 영역은 검출 신뢰도가 낮아 제외 (px)
+DEFAULT_FULL_DENSITY_PER_M2 = 4.0  # 원근 모델 사용 시 100%로 보는 밀도 (명/m²)
+
+
+# 11. 블로킹 작업 워커 풀 / 이벤트 루프 지연 측정
+DEFAULT_DECODE_WORKERS = 4         # 프레임 디코딩(cap.read/imdecode) 스레드 수
+DEFAULT_ANALYSIS_WORKERS = 2       # 분석 전/후처리(ROI, 점 필터, 구역 집계) 스레드 수
+DEFAULT_WORKER_QUEUE_SIZE = 64     # 풀별 실행 중 + 대기 중 작업 최대 개수 (넘치면 호출 측이 대기)
+LOOP_LAG_INTERVAL_SEC = 0.5        # 이벤트 루프 지연 측정 주기 (초)
+LOOP_LAG_WARN_MS = 100             # 이 값을 넘는 루프 지연은 경고 (ms)
+
+
+# 12. 영상 파일 디코딩
+DEFAULT_DECODE_MODE = 'sequential' # 'sequential': 캡처를 열어 두고 grab()으로 건너뛰기, 'seek': 매 주기 cap.set
+DEFAULT_MAX_GRAB_SKIP = None       # (선택) 이보다 많이 건너뛰면 항상 seek. None이면 측정한 seek/grab 비용으로만 결정
+
+
+# 13. 실시간 스트림(RTSP/HTTP) 수신
+DEFAULT_LIVE_BUFFER_SIZE = 5       # 링 버퍼에 보관할 최신 프레임 수 (분석 주기당 프레임 수와 같게)
+DEFAULT_RECONNECT_MIN_SEC = 1.0    # 첫 재연결 대기 시간 (실패할 때마다 2배)
+DEFAULT_RECONNECT_MAX_SEC = 30.0   # 최대 재연결 대기 시간
+
+
+# 14. 영상 업로드 분석 작업
+DEFAULT_UPLOAD_CHUNK_SIZE = 1024 * 1024  # 업로드를 spool 파일로 옮길 때 한 번에 읽는 크기 (bytes)
+DEFAULT_VIDEO_JOB_WORKERS = 2            # 동시에 실행할 영상 분석 작업 수
+DEFAULT_VIDEO_JOB_QUEUE_SIZE = 16        # 대기 중인 작업 최대 개수 (초과 시 요청 거절)
+DEFAULT_VIDEO_JOB_BATCH_SIZE = 8         # 작업당 한 번에 분석할 샘플 프레임 수
+DEFAULT_JOB_RESULT_TTL_SEC = 3600        # 끝난 작업 결과 보관 시간 (초)
+JOB_RETRY_MIN_SEC = 0.1                  # 추론 대기열이 가득 찼을 때 첫 재시도 대기 (실패할 때마다 2배)
+JOB_RETRY_MAX_SEC = 5.0                  # 최대 재시도 대기 (초)
+JOB_RETRY_TIMEOUT_SEC = 600              # 한 배치가 이 시간 넘게 대기열에 못 들어가면 작업 실패 (초)
+
+
+# 15. 원격 영상(URL) 분석 작업
+DEFAULT_SEGMENT_SEC = 60                 # 결과를 묶어 집계하는 구간 길이 (영상 시간 기준, 초)
+DEFAULT_SEGMENT_FLUSH_SIZE = 10          # 구간 집계를 DB에 한 번에 저장하는 개수 (insert 1회)
+
+
+# 16. 적응형 분석 주기 / 전체 추론량 제한
+ADAPTIVE_MIN_INTERVAL_SEC = 5            # 경고/위험 또는 급상승 카메라의 최소 분석 주기 (초)
+ADAPTIVE_MAX_INTERVAL_SEC = 180          # 안전하고 안정적인 카메라의 최대 분석 주기 (초)
+ADAPTIVE_BOUNDARY_MARGIN_PCT = 5         # 다음 등급 하한까지 이 PCT 이내면 주기 단축
+ADAPTIVE_RISE_PCT_PER_MIN = 5            # 분당 PCT 상승이 이 이상이면 주기 단축 (절반 미만 변화는 안정으로 봄)
+ADAPTIVE_SHRINK_FACTOR = 0.5             # 단축 시 주기 배수
+ADAPTIVE_GROW_FACTOR = 1.5               # 연장 시 주기 배수
+DEFAULT_MAX_INFERENCES_PER_SEC = 0       # 전체 초당 추론 프레임 수 제한 (0이면 제한 없음)
+
+
+# 17. 녹화 영상 재분석 (backfill.py)
+DEFAULT_ARCHIVE_DIR = '/home/ubuntu/storage/m3'  # 녹화 영상(.mov) 보관 경로
+DEFAULT_BACKFILL_SEGMENT_SEC = 300       # 워커 1개가 맡는 구간 길이 (키프레임에 맞춰 조정, 초)
+DEFAULT_BACKFILL_INTERVAL_SEC = 20       # 샘플링 주기 (process_stream_simulation 기본값과 같음, 초)
+DEFAULT_BULK_INSERT_SIZE = 500           # DB insert 1회당 행 수
@@ -5,6 +5,7 @@ Supabase 데이터베이스 연동 모듈
 """
 
 import os
+import asyncio
 import logging
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone
@@ -84,7 +85,8 @@ class SupabaseDB:
                 'cleared_by': None   # 초기값: NULL
             }
             
-            response = self.client.table('DAT_Crowd_Detection').insert(data).execute()
+            # HTTP 요청은 블로킹이므로 스레드에서 실행 (카메라 루프가 이벤트 루프를 막지 않도록)
+            response = await asyncio.to_thread(self.client.table('DAT_Crowd_Detection').insert(data).execute)
             
             logger.info(f"✅ 분석 결과 저장 완료: CCTV={cctv_no}, Count={person_count}, Level={congestion_level}%")
             return response.data[0] if response.data else None
@@ -93,6 +95,45 @@ class SupabaseDB:
             logger.error(f"❌ 분석 결과 저장 실패: {str(e)}")
             return None
     
+    async def save_analysis_results(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        여러 분석 결과를 DAT_Crowd_Detection 테이블에 한 번의 insert로 저장 (영상 구간 집계용)
+        
+        Args:
+            rows: cctv_no, person_count, congestion_level, risk_level_int (선택: detected_at) 딕셔너리 목록
+                  (avg_count 등 테이블에 컬럼이 없는 키는 저장하지 않음. 영상 작업 결과 API의 segments에는 남음)
+        
+        Returns:
+            저장된 행 수 (실패/비활성화 시 0)
+        """
+        if not rows:
+            return 0
+        if not self.is_enabled():
+            logger.warning("DB가 비활성화되어 있습니다. 데이터를 저장하지 않습니다.")
+            return 0
+        
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            data = [{
+                'cctv_no': row['cctv_no'],
+                'detected_at': row.get('detected_at') or now,
+                'person_count': row['person_count'],
+                'congestion_level': row['congestion_level'],
+                'risk_level': row['risk_level_int'],
+                'status': 'NEW',
+                'cleared_by': None
+            } for row in rows]
+            
+            response = await asyncio.to_thread(self.client.table('DAT_Crowd_Detection').insert(data).execute)
+            
+            saved = len(response.data) if response.data else 0
+            logger.info(f"✅ 분석 결과 {saved}건 일괄 저장 완료: CCTV={rows[0]['cctv_no']}")
+            return saved
+            
+        except Exception as e:
+            logger.error(f"❌ 분석 결과 일괄 저장 실패 ({len(rows)}건): {str(e)}")
+            return 0
+    
     async def get_cctv_info_by_idx(self, cctv_idx: str) -> Optional[Dict[str, Any]]:
         """
         cctv_idx ("CCTV_01")로 CCTV 정보 (UUID, URL 등) 조회
@@ -316,6 +357,12 @@ async def save_detection(
     )
 
 
+async def save_detections(rows: List[Dict[str, Any]]) -> int:
+    """분석 결과 여러 건 일괄 저장 (간편 함수)"""
+    db = get_db()
+    return await db.save_analysis_results(rows)
+
+
 async def get_logs(limit: int = 10, cctv_no: Optional[str] = None) -> List[Dict[str, Any]]:
     """분석 로그 조회 (간편 함수)"""
     db = get_db()
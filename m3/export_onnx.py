@@ -0,0 +1,161 @@
+"""
+P2PNet → ONNX 변환 도구
+
+build_model(args, training=False) 그래프를 앵커 포인트 덧셈까지 포함해 ONNX로 내보냄
+(입력 H/W와 배치 크기는 동적 축)
+
+사용 예:
+    python export_onnx.py --model-path best_mae.pth --p2pnet-source ./p2pnet_source \
+        --output p2pnet.onnx --verify
+"""
+
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+import torch
+
+from backends import ONNX_INPUT_NAME, ONNX_OUTPUT_NAMES
+from weights import load_weights
+
+
+class _ExportWrapper(torch.nn.Module):
+    """dict 출력을 ONNX 출력 순서(tuple)로 변환"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, image):
+        outputs = self.model(image)
+        return outputs['pred_logits'], outputs['pred_points']
+
+
+def load_p2pnet(model_path, p2pnet_source_path, device='cpu'):
+    """추론용 P2PNet 생성 + 체크포인트 로드 (FP32, eval 모드)"""
+    if p2pnet_source_path not in sys.path:
+        sys.path.insert(0, p2pnet_source_path)
+    from models import build_model
+
+    class Args:
+        backbone = 'vgg16_bn'
+        row = 2
+        line = 2
+
+    model = build_model(Args(), training=False)
+    load_weights(model, model_path, map_location=device)
+    model.to(device)
+    model.float()
+    model.eval()
+    return model
+
+
+def export_onnx(model, output_path, height=768, width=1280, opset=17):
+    """
+    P2PNet 모델을 ONNX 파일로 저장
+
+    Args:
+        model: eval 모드의 P2PNet (FP32, CPU)
+        output_path: 저장할 .onnx 경로
+        height, width: 트레이싱용 더미 입력 크기 (128 배수)
+        opset: ONNX opset 버전
+    """
+    wrapper = _ExportWrapper(model).eval()
+    dummy = torch.zeros(1, 3, height, width, dtype=torch.float32)
+
+    export_kwargs = dict(
+        input_names=[ONNX_INPUT_NAME],
+        output_names=ONNX_OUTPUT_NAMES,
+        dynamic_axes={
+            ONNX_INPUT_NAME: {0: 'batch', 2: 'height', 3: 'width'},
+            'pred_logits': {0: 'batch', 1: 'num_points'},
+            'pred_points': {0: 'batch', 1: 'num_points'},
+        },
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+    with torch.no_grad():
+        try:
+            # PyTorch 2.x: dynamic_axes를 그대로 쓰는 TorchScript 기반 exporter 사용
+            torch.onnx.export(wrapper, (dummy,), output_path, dynamo=False, **export_kwargs)
+        except TypeError:
+            # dynamo 인자가 없는 구버전 PyTorch
+            torch.onnx.export(wrapper, (dummy,), output_path, **export_kwargs)
+    print(f"✅ ONNX 변환 완료: {output_path} ({os.path.getsize(output_path) / 1e6:.1f} MB)")
+
+
+def verify_parity(model, onnx_path, frames, threshold=0.5, num_threads=None, atol=1e-2):
+    """
+    PyTorch 경로와 ONNX Runtime 경로의 count/points 비교
+
+    Returns:
+        bool: 모든 프레임에서 count가 같고 points 차이가 atol 이내면 True
+    """
+    from analyzer import M3CongestionAnalyzer
+    from backends import OnnxRuntimeBackend
+
+    kwargs = dict(device=torch.device('cpu'), threshold=threshold, use_adaptive_roi=False)
+    torch_analyzer = M3CongestionAnalyzer(model=model, **kwargs)
+    onnx_analyzer = M3CongestionAnalyzer(
+        model=None, backend=OnnxRuntimeBackend(onnx_path, num_threads=num_threads), **kwargs)
+
+    ok = True
+    for i, frame in enumerate(frames):
+        t_count, t_points, _ = torch_analyzer.predict_count(frame)
+        o_count, o_points, _ = onnx_analyzer.predict_count(frame)
+        same_count = t_count == o_count
+        max_diff = float(np.abs(t_points - o_points).max()) if same_count and t_count > 0 else 0.0
+        passed = same_count and max_diff <= atol
+        ok = ok and passed
+        print(f"  [{i}] {frame.shape[1]}x{frame.shape[0]} torch={t_count} onnx={o_count} "
+              f"max|Δpoint|={max_diff:.5f} {'OK' if passed else 'FAIL'}")
+    return ok
+
+
+def load_frames(image_paths, sizes=((720, 1280), (1080, 1920))):
+    """검증용 프레임 로드 (이미지가 없으면 해상도별 랜덤 프레임)"""
+    if image_paths:
+        frames = []
+        for path in image_paths:
+            frame = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                raise ValueError(f"이미지 로드 실패: {path}")
+            frames.append(frame)
+        return frames
+    rng = np.random.RandomState(0)
+    return [rng.randint(0, 256, (h, w, 3), dtype=np.uint8) for h, w in sizes]
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser('P2PNet ONNX export', add_help=True)
+    parser.add_argument('--model-path', required=True, help='학습된 체크포인트 (.pth)')
+    parser.add_argument('--p2pnet-source', required=True, help='P2PNet 소스 경로')
+    parser.add_argument('--output', default='p2pnet.onnx', help='저장할 ONNX 경로')
+    parser.add_argument('--height', default=768, type=int, help='트레이싱 입력 높이 (128 배수)')
+    parser.add_argument('--width', default=1280, type=int, help='트레이싱 입력 너비 (128 배수)')
+    parser.add_argument('--opset', default=17, type=int)
+    parser.add_argument('--verify', action='store_true', help='변환 후 PyTorch와 결과 비교')
+    parser.add_argument('--images', nargs='*', default=None, help='검증용 이미지 (없으면 랜덤 프레임)')
+    parser.add_argument('--threshold', default=0.5, type=float)
+    parser.add_argument('--num-threads', default=None, type=int, help='ONNX Runtime 스레드 수')
+    return parser
+
+
+def main(args):
+    model = load_p2pnet(args.model_path, args.p2pnet_source)
+    export_onnx(model, args.output, height=args.height, width=args.width, opset=args.opset)
+
+    if args.verify:
+        print("🔍 PyTorch ↔ ONNX Runtime 결과 비교")
+        ok = verify_parity(model, args.output, load_frames(args.images),
+                           threshold=args.threshold, num_threads=args.num_threads)
+        if not ok:
+            print("❌ 결과 불일치")
+            sys.exit(1)
+        print("✅ 결과 일치")
+
+
+if __name__ == '__main__':
+    main(get_args_parser().parse_args())
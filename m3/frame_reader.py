@@ -0,0 +1,199 @@
+"""
+영상 파일 프레임 샘플링 리더
+
+분석 주기마다 cap.set(CAP_PROP_POS_FRAMES)로 이동하면 H.264/.mov 소스는 매번
+이전 키프레임으로 seek 한 뒤 목표 프레임까지 다시 디코딩함 (demuxer flush + GOP 재디코딩)
+- 'sequential' 모드: VideoCapture 하나를 계속 열어 두고 순차로 읽으며,
+  샘플 사이의 프레임은 grab()만 호출해 건너뜀 (retrieve()의 색 변환/복사 없음)
+- grab도 프레임을 디코딩하므로 GOP보다 멀리 건너뛸 때는 seek이 더 쌈
+  (OpenCV FFmpeg 백엔드의 seek은 이전 키프레임부터 목표 프레임까지 디코딩)
+  → seek 1회 비용과 grab 1프레임 비용을 실제로 재서 (GOP 길이가 반영됨)
+    skip × grab 비용 > seek 비용이거나 뒤로 가야 할 때만 seek
+    (기본 분석 주기 20~60초 = 30fps에서 600~1800프레임도 고정 상한 없이 비용 비교로 결정,
+     max_grab_skip을 주면 그보다 멀리 건너뛸 때는 항상 seek)
+- 'seek' 모드: 기존 동작 (매 주기 cap.set으로 이동)
+- 'stream' 모드: HTTP 등 원격 영상용. seek은 원격 요청(Range 재요청)이라 쓰지 않고
+  항상 grab으로 앞으로만 건너뜀, 영상 끝에서 처음으로 돌아가지 않음
+"""
+
+import logging
+import threading
+import time
+
+import cv2
+
+from constants import DEFAULT_MAX_GRAB_SKIP
+
+logger = logging.getLogger(__name__)
+
+DECODE_MODES = ('sequential', 'seek', 'stream')
+
+
+def list_keyframes(source):
+    """
+    영상의 키프레임 인덱스 목록 (디코딩 없이 demux만 해서 패킷의 키프레임 플래그를 읽음)
+
+    OpenCV FFmpeg 백엔드의 raw 모드(CAP_PROP_FORMAT=-1)가 필요하며,
+    지원하지 않는 빌드/컨테이너면 빈 리스트 반환
+    """
+    cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+    try:
+        if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+            return []
+        keyframes = []
+        idx = 0
+        while cap.grab():
+            if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(idx)
+            idx += 1
+        return keyframes
+    finally:
+        cap.release()
+
+
+class FrameReader:
+    """
+    VideoCapture 래퍼: read(frame_idx, count)로 frame_idx부터 count장 연속 읽기
+
+    VideoCapture는 스레드 안전하지 않으므로 모든 호출을 내부 lock으로 직렬화함
+    (워커 스레드에서 읽는 도중 해제 요청이 와도 읽기가 끝난 뒤에 해제)
+    """
+
+    def __init__(self, source, mode='sequential', max_grab_skip=DEFAULT_MAX_GRAB_SKIP):
+        """
+        Args:
+            source: 영상 파일 경로
+            mode: 'sequential' (grab으로 건너뛰기), 'seek' (매번 cap.set), 'stream' (grab만, 루프 없음)
+            max_grab_skip: (선택) 이보다 많이 건너뛰어야 하면 grab 대신 seek (프레임 수, None이면 제한 없음)
+        """
+        if mode not in DECODE_MODES:
+            raise ValueError(f"지원하지 않는 디코딩 모드입니다: {mode} (가능: {DECODE_MODES})")
+        self.source = source
+        self.mode = mode
+        self.max_grab_skip = max_grab_skip
+        self.cap = None
+        self.fps = 0.0
+        self.total_frames = 0
+        # 다음 read()가 돌려줄 프레임 인덱스 (모르면 None → seek 필요)
+        self.position = None
+        self.stats = {'retrieved': 0, 'grabbed': 0, 'seeks': 0, 'reopens': 0,
+                      'seek_ms': None, 'grab_ms': None}
+        self._lock = threading.Lock()
+
+    def _record_cost(self, key, ms):
+        """비용 추정치 갱신 (지수 이동 평균)"""
+        old = self.stats[key]
+        self.stats[key] = ms if old is None else old * 0.8 + ms * 0.2
+
+    def open(self):
+        """영상 열기 → (fps, 전체 프레임 수)"""
+        with self._lock:
+            self._open()
+            return self.fps, self.total_frames
+
+    def is_opened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def _open(self):
+        self.cap = cv2.VideoCapture(self.source)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.position = 0
+
+    def _seek(self, frame_idx):
+        start = time.perf_counter()
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        # 처음으로 돌아가는 seek은 키프레임 탐색이 없어 비용 추정에서 제외
+        if frame_idx > 0:
+            self._record_cost('seek_ms', (time.perf_counter() - start) * 1000)
+        self.position = frame_idx
+        self.stats['seeks'] += 1
+
+    def _prefer_grab(self, skip):
+        """skip 프레임을 grab으로 건너뛰는 편이 seek보다 싼지 (비용을 모르면 한 번씩 재 봄)"""
+        if self.max_grab_skip is not None and skip > self.max_grab_skip:
+            return False
+        seek_ms, grab_ms = self.stats['seek_ms'], self.stats['grab_ms']
+        if seek_ms is None:
+            return False
+        if grab_ms is None:
+            return True
+        return skip * grab_ms <= seek_ms
+
+    def _move_to(self, frame_idx):
+        """
+        frame_idx로 이동 (sequential 모드는 grab이 더 싸면 grab으로 건너뜀)
+
+        Returns:
+            bool: grab 도중 영상 끝에 도달했으면 False
+        """
+        skip = frame_idx - self.position if self.position is not None else -1
+        if skip == 0:
+            return True
+        if self.mode == 'seek' or skip < 0 or (self.mode != 'stream' and not self._prefer_grab(skip)):
+            self._seek(frame_idx)
+            return True
+        start = time.perf_counter()
+        for _ in range(skip):
+            if not self.cap.grab():
+                self.position = None
+                return False
+            self.stats['grabbed'] += 1
+        self._record_cost('grab_ms', (time.perf_counter() - start) * 1000 / skip)
+        self.position = frame_idx
+        return True
+
+    def _read_one(self):
+        ret, frame = self.cap.read()
+        if ret:
+            self.position += 1
+            self.stats['retrieved'] += 1
+        return ret, frame
+
+    def read(self, frame_idx, count=5):
+        """
+        frame_idx부터 count장 연속 읽기 (영상 끝에 닿으면 처음으로 돌아가 이어서 읽음)
+
+        'stream' 모드는 영상 끝에서 돌아가지 않고 그때까지 읽은 프레임만 반환
+
+        Returns:
+            (frames, looped): 읽은 프레임 리스트, 영상 끝에 도달했는지 여부
+        """
+        with self._lock:
+            if self.cap is None or not self.cap.isOpened():
+                if self.cap is not None:
+                    logger.warning("⚠️ VideoCapture가 닫혀있어 재연결합니다.")
+                    self.stats['reopens'] += 1
+                self._open()
+
+            looped = not self._move_to(frame_idx)
+            if looped and self.mode == 'stream':
+                return [], True
+            if looped:
+                logger.info("🔄 영상 끝 도달, 처음으로 루프")
+                self._seek(0)
+
+            frames = []
+            for _ in range(count):
+                ret, frame = self._read_one()
+
+                # 영상 끝 처리
+                if not ret:
+                    looped = True
+                    if self.mode == 'stream':
+                        break
+                    logger.info("🔄 영상 끝 도달, 처음으로 루프")
+                    self._seek(0)
+                    ret, frame = self._read_one()
+                    if not ret:
+                        logger.error("영상을 읽을 수 없습니다.")
+                        break
+
+                frames.append(frame)
+            return frames, looped
+
+    def release(self):
+        with self._lock:
+            if self.cap is not None:
+                self.cap.release()
+            self.position = None
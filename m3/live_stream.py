@@ -0,0 +1,187 @@
+"""
+실시간 스트림(RTSP/HTTP) 수신 + 최신 프레임 링 버퍼
+
+영상 파일과 달리 실시간 스트림은 읽지 않은 프레임이 디코더/소켓 버퍼에 쌓이므로,
+분석 주기마다 cap.read()를 호출하면 몇 초~몇 분 전의 밀린 프레임을 분석하게 됨
+- 전용 수신 스레드가 계속 읽으며 가장 최근 buffer_size 장만 링 버퍼(deque)에 보관
+  (오래된 프레임은 자동으로 버려짐 → 분석기는 항상 최신 프레임만 받음)
+- 읽기 실패/연결 끊김 시 지수 백오프로 재연결 (reconnect_min_sec → reconnect_max_sec)
+- 스트림별 수신 fps, 분석 시점의 프레임 지연(lag), 버린 프레임 수, 재연결 횟수 집계
+
+로컬 영상 파일을 source로 주면 파일 fps에 맞춰 읽는 대체 스트림으로 동작함
+(파일 끝 = 연결 끊김으로 처리해 재연결 경로까지 그대로 시험 가능)
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from constants import (DEFAULT_LIVE_BUFFER_SIZE, DEFAULT_RECONNECT_MIN_SEC, DEFAULT_RECONNECT_MAX_SEC)
+
+logger = logging.getLogger(__name__)
+
+LIVE_SCHEMES = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://')
+
+
+def is_live_source(source):
+    """스트림 URL 여부 (rtsp/http 등). 로컬 파일 경로면 False"""
+    return isinstance(source, str) and source.lower().startswith(LIVE_SCHEMES)
+
+
+class LiveFrameReader:
+    """
+    수신 스레드 1개 + 최신 프레임 링 버퍼
+
+    snapshot()은 블로킹 없이 마지막 호출 이후 들어온 프레임 중 최신 것만 돌려줌
+    """
+
+    def __init__(self, source, buffer_size=DEFAULT_LIVE_BUFFER_SIZE,
+                 reconnect_min_sec=DEFAULT_RECONNECT_MIN_SEC, reconnect_max_sec=DEFAULT_RECONNECT_MAX_SEC,
+                 pace=None):
+        """
+        Args:
+            source: 스트림 URL (또는 대체 스트림용 로컬 영상 파일)
+            buffer_size: 링 버퍼 크기 (보관할 최신 프레임 수)
+            reconnect_min_sec / reconnect_max_sec: 재연결 대기 시간 범위 (실패할 때마다 2배)
+            pace: 파일 fps에 맞춰 읽을지 여부 (None이면 로컬 파일일 때만)
+        """
+        self.source = source
+        self.buffer_size = max(1, int(buffer_size))
+        self.reconnect_min_sec = reconnect_min_sec
+        self.reconnect_max_sec = reconnect_max_sec
+        self.pace = (not is_live_source(source)) if pace is None else pace
+
+        # (seq, 수신 시각 monotonic, frame)
+        self._buffer = deque(maxlen=self.buffer_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._seq = 0            # 지금까지 받은 프레임 번호
+        self._consumed_seq = 0   # snapshot()이 마지막으로 돌려준 프레임 번호
+
+        self.stats = {
+            'connected': False,
+            'frames_read': 0,
+            'frames_dropped': 0,   # 분석에 쓰이지 않고 링 버퍼에서 밀려난 프레임
+            'reconnects': 0,
+            'fps': 0.0,            # 수신 fps (지수 이동 평균)
+            'lag_ms': None,        # 마지막 snapshot() 시점에 최신 프레임의 나이
+            'last_error': None,
+        }
+
+    # ------------------------------------------------------------------
+    # 수명 주기
+    # ------------------------------------------------------------------
+    def start(self):
+        """수신 스레드 시작 (이미 실행 중이면 무시)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"m3-live-{self.source}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """수신 스레드 종료 (진행 중인 read()가 끝날 때까지 최대 timeout초 대기)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # ------------------------------------------------------------------
+    # 소비 측 API
+    # ------------------------------------------------------------------
+    def snapshot(self, count=DEFAULT_LIVE_BUFFER_SIZE):
+        """
+        마지막 snapshot() 이후 들어온 프레임 중 최신 count장 (오래된 것부터, 없으면 빈 리스트)
+
+        스트림이 멈춰 새 프레임이 없으면 이미 분석한 프레임을 다시 주지 않음
+        """
+        with self._lock:
+            fresh = [item for item in self._buffer if item[0] > self._consumed_seq][-count:]
+            if not fresh:
+                return []
+            self._consumed_seq = fresh[-1][0]
+            self.stats['lag_ms'] = round((time.monotonic() - fresh[-1][1]) * 1000, 1)
+        return [frame for _, _, frame in fresh]
+
+    # ------------------------------------------------------------------
+    # 수신 스레드
+    # ------------------------------------------------------------------
+    def _run(self):
+        backoff = self.reconnect_min_sec
+        while not self._stop.is_set():
+            cap = cv2.VideoCapture(self.source)
+            if not cap.isOpened():
+                cap.release()
+                self._on_disconnect("스트림을 열 수 없습니다")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.reconnect_max_sec)
+                continue
+
+            logger.info(f"📡 스트림 연결: {self.source}")
+            self.stats['connected'] = True
+            received = self._read_loop(cap)
+            cap.release()
+            if self._stop.is_set():
+                break
+
+            # 프레임을 받은 뒤 끊긴 경우는 백오프를 처음부터 다시 시작
+            if received:
+                backoff = self.reconnect_min_sec
+            self._on_disconnect("프레임 읽기 실패 (연결 끊김 또는 스트림 종료)")
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, self.reconnect_max_sec)
+
+        self.stats['connected'] = False
+
+    def _read_loop(self, cap):
+        """연결이 끊기거나 stop()까지 읽기. 받은 프레임 수 반환"""
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_interval = 1.0 / fps if self.pace and fps > 0 else 0.0
+        received = 0
+        last_at = None
+        next_due = time.monotonic()
+        while not self._stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            now = time.monotonic()
+            received += 1
+            self._push(frame, now)
+
+            if last_at is not None and now > last_at:
+                rate = 1.0 / (now - last_at)
+                self.stats['fps'] = round(rate if self.stats['fps'] == 0 else self.stats['fps'] * 0.95 + rate * 0.05, 2)
+            last_at = now
+
+            # 대체 스트림(로컬 파일)은 실제 카메라처럼 fps에 맞춰 읽음
+            if frame_interval:
+                next_due += frame_interval
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    self._stop.wait(delay)
+                else:
+                    next_due = time.monotonic()
+        return received
+
+    def _push(self, frame, captured_at):
+        with self._lock:
+            if len(self._buffer) == self.buffer_size and self._buffer[0][0] > self._consumed_seq:
+                self.stats['frames_dropped'] += 1
+            self._seq += 1
+            self._buffer.append((self._seq, captured_at, frame))
+            self.stats['frames_read'] += 1
+
+    def _on_disconnect(self, reason):
+        if self.stats['connected']:
+            logger.warning(f"⚠️ 스트림 연결 끊김: {self.source} ({reason})")
+        self.stats['connected'] = False
+        self.stats['reconnects'] += 1
+        self.stats['last_error'] = reason
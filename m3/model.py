@@ -5,6 +5,8 @@ P2PNet 모델 로더
 import torch
 import sys
 
+from weights import load_weights
+
 
 class P2PNetModel:
     """
@@ -13,7 +15,7 @@ class P2PNetModel:
     def __init__(self, model_path, p2pnet_source_path, device='cuda', use_fp16=True):
         """
         Args:
-            model_path: 학습된 모델 파일 경로 (.pth)
+            model_path: 학습된 모델 파일 경로 (.pth 또는 mmap 가중치 .m3w)
             p2pnet_source_path: P2PNet 소스 코드 경로
             device: 'cuda' 또는 'cpu'
             use_fp16: 반정밀도(FP16) 사용 여부 (속도 향상)
@@ -45,13 +47,14 @@ class P2PNetModel:
         
         # 모델 생성 및 로드
         self.model = build_model(args, training=False)
-        checkpoint = torch.load(model_path, map_location=self.device)
-        self.model.load_state_dict(checkpoint['model'])
+        load_weights(self.model, model_path, map_location=self.device)
         self.model.to(self.device)
         
         if self.use_fp16:
             self.model.half()  # FP16 변환
             print("⚡ P2PNet: FP16(반정밀도) 모드 활성화")
+        else:
+            self.model.float()  # FP16 가중치 파일이면 FP32로 복원
             
         self.model.eval()
         
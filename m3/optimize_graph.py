@@ -0,0 +1,202 @@
+"""
+P2PNet 추론 그래프 최적화 도구
+
+로드된 P2PNet(eval 모드)에 다음을 적용해 같은 결과를 내는 추론 전용 모델을 만듦
+- Conv→BatchNorm 폴딩: BN의 scale/shift를 앞 Conv의 weight/bias에 합치고 BN 제거
+  (VGG16-BN 백본의 BN 13개가 사라져 레이어당 메모리 왕복이 한 번 줄어듦)
+- 사용하지 않는 레이어 제거: 회귀/분류 헤드의 conv3/act3/conv4/act4 (forward에서 호출되지 않음)
+- 활성화 함수 in-place 변환: 헤드의 ReLU를 inplace=True로 (중간 텐서 할당 감소)
+
+학습/체크포인트 형식은 그대로 두고, 로드 직후 메모리 안에서만 변환함
+(M3CongestionAPI(..., optimize_graph=True) 또는 INFER_OPTIMIZE_GRAPH=1)
+
+사용 예 (결과 일치 확인 + CPU 지연 시간 비교):
+    python optimize_graph.py --model-path best_mae.pth --p2pnet-source ./p2pnet_source \
+        --verify --benchmark --num-threads 8
+"""
+
+import argparse
+import copy
+import sys
+
+import torch
+from torch import nn
+from torch.nn.modules.batchnorm import _BatchNorm
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from preprocess import FramePreprocessor
+
+# 헤드에서 forward가 호출하지 않는 레이어
+DEAD_HEAD_LAYERS = ('conv3', 'act3', 'conv4', 'act4')
+
+
+def fold_sequential(seq):
+    """
+    Sequential 안의 Conv→BN 쌍을 BN이 합쳐진 Conv 하나로 교체
+
+    Returns:
+        (새 Sequential, 폴딩한 BN 수)
+    """
+    children = list(seq.children())
+    layers = []
+    folded = 0
+    i = 0
+    while i < len(children):
+        layer = children[i]
+        if (isinstance(layer, nn.Conv2d) and i + 1 < len(children)
+                and isinstance(children[i + 1], _BatchNorm)):
+            layers.append(fuse_conv_bn_eval(layer, children[i + 1]))
+            folded += 1
+            i += 2
+            continue
+        layers.append(layer)
+        i += 1
+    return nn.Sequential(*layers), folded
+
+
+def fold_batchnorm(model):
+    """백본 body1~4(또는 body)의 Conv→BN 폴딩"""
+    backbone = model.backbone
+    folded = 0
+    for name in ('body1', 'body2', 'body3', 'body4', 'body'):
+        seq = getattr(backbone, name, None)
+        if isinstance(seq, nn.Sequential):
+            new_seq, count = fold_sequential(seq)
+            setattr(backbone, name, new_seq)
+            folded += count
+    return folded
+
+
+def remove_dead_layers(model):
+    """forward에서 쓰이지 않는 헤드 레이어 삭제 (build_model(training=False)면 이미 없음)"""
+    removed = []
+    for head_name in ('regression', 'classification'):
+        head = getattr(model, head_name)
+        for name in DEAD_HEAD_LAYERS:
+            if hasattr(head, name):
+                delattr(head, name)
+                removed.append(f'{head_name}.{name}')
+    return removed
+
+
+def make_activations_inplace(model):
+    """ReLU를 inplace=True로 변환 (이미 in-place인 VGG ReLU는 건너뜀)"""
+    converted = 0
+    for module in model.modules():
+        if isinstance(module, nn.ReLU) and not module.inplace:
+            module.inplace = True
+            converted += 1
+    return converted
+
+
+def optimize_model(model, inplace=False):
+    """
+    P2PNet → 추론 전용 최적화 모델
+
+    Args:
+        model: eval 모드의 P2PNet (FP32)
+        inplace: True면 전달받은 모델을 직접 변경, False면 복사본을 변경
+
+    Returns:
+        (optimized_model, report)
+    """
+    if model.training:
+        raise ValueError("BN 폴딩은 eval 모드 모델에서만 가능합니다. model.eval()을 먼저 호출해주세요.")
+    optimized = model if inplace else copy.deepcopy(model)
+
+    params_before = sum(p.numel() for p in optimized.parameters())
+    report = {
+        'folded_bn': fold_batchnorm(optimized),
+        'removed_layers': remove_dead_layers(optimized),
+        'inplace_activations': make_activations_inplace(optimized),
+    }
+    report['params_before'] = params_before
+    report['params_after'] = sum(p.numel() for p in optimized.parameters())
+    optimized.eval()
+    return optimized, report
+
+
+def print_report(report):
+    print(f"🔧 그래프 최적화: BN 폴딩 {report['folded_bn']}개, "
+          f"레이어 제거 {len(report['removed_layers'])}개, in-place ReLU {report['inplace_activations']}개, "
+          f"파라미터 {report['params_before'] / 1e6:.2f}M → {report['params_after'] / 1e6:.2f}M")
+
+
+@torch.no_grad()
+def verify_parity(reference, optimized, frames, logits_atol=1e-4, points_atol=1e-2):
+    """
+    원본/최적화 모델의 pred_logits·pred_points 최대 오차 비교
+
+    Returns:
+        bool: 모든 프레임에서 오차가 허용치 이내면 True
+    """
+    preprocessor = FramePreprocessor(device='cpu')
+    ok = True
+    for i, frame in enumerate(frames):
+        batch = preprocessor.preprocess([frame])
+        ref = reference(batch)
+        opt = optimized(batch)
+        logits_diff = float((ref['pred_logits'] - opt['pred_logits']).abs().max())
+        points_diff = float((ref['pred_points'] - opt['pred_points']).abs().max())
+        passed = logits_diff <= logits_atol and points_diff <= points_atol
+        ok = ok and passed
+        print(f"  [{i}] {frame.shape[1]}x{frame.shape[0]} max|Δlogit|={logits_diff:.2e} "
+              f"max|Δpoint|={points_diff:.2e} {'OK' if passed else 'FAIL'}")
+    return ok
+
+
+def benchmark_latency(reference, optimized, frames, iters=10, warmup=2):
+    """원본/최적화 모델의 프레임당 지연 시간 비교 (CPU)"""
+    from benchmark import time_calls, summarize
+
+    preprocessor = FramePreprocessor(device='cpu')
+    # preprocess()는 같은 크기끼리 재사용 버퍼를 돌려주므로 복사해 둠 (모델 실행 시간만 측정)
+    batches = [preprocessor.preprocess([frame]).clone() for frame in frames]
+    print(f"⏱️ 지연 시간 ({len(frames)}장, CPU threads={torch.get_num_threads()})")
+    results = []
+    for name, model in (('original', reference), ('optimized', optimized)):
+        def run():
+            with torch.no_grad():
+                for batch in batches:
+                    model(batch)
+        results.append(summarize(name, time_calls(run, iters, warmup), len(frames)))
+    return results
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser('P2PNet inference graph optimization', add_help=True)
+    parser.add_argument('--model-path', required=True, help='학습된 체크포인트 (.pth / .m3w)')
+    parser.add_argument('--p2pnet-source', required=True, help='P2PNet 소스 경로')
+    parser.add_argument('--verify', action='store_true', help='원본 모델과 출력 비교')
+    parser.add_argument('--benchmark', action='store_true', help='원본/최적화 CPU 지연 시간 비교')
+    parser.add_argument('--images', nargs='*', default=None, help='검증/측정용 이미지 (없으면 랜덤 프레임)')
+    parser.add_argument('--logits-atol', default=1e-4, type=float, help='pred_logits 허용 오차')
+    parser.add_argument('--points-atol', default=1e-2, type=float, help='pred_points 허용 오차 (px)')
+    parser.add_argument('--iters', default=10, type=int)
+    parser.add_argument('--num-threads', default=None, type=int, help='torch CPU 스레드 수')
+    return parser
+
+
+def main(args):
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+
+    from export_onnx import load_p2pnet, load_frames
+    reference = load_p2pnet(args.model_path, args.p2pnet_source)
+    optimized, report = optimize_model(reference)
+    print_report(report)
+
+    frames = load_frames(args.images)
+    if args.verify:
+        print("🔍 원본 ↔ 최적화 모델 결과 비교")
+        if not verify_parity(reference, optimized, frames,
+                             logits_atol=args.logits_atol, points_atol=args.points_atol):
+            print("❌ 결과 불일치")
+            sys.exit(1)
+        print("✅ 결과 일치")
+    if args.benchmark:
+        benchmark_latency(reference, optimized, frames, iters=args.iters)
+
+
+if __name__ == '__main__':
+    main(get_args_parser().parse_args())
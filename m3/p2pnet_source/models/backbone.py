@@ -51,17 +51,20 @@ class BackboneBase_VGG(nn.Module):
 
 class Backbone_VGG(BackboneBase_VGG):
     """ResNet backbone with frozen BatchNorm."""
-    def __init__(self, name: str, return_interm_layers: bool):
+    def __init__(self, name: str, return_interm_layers: bool, pretrained: bool = True):
+        # without ImageNet weights the layers are overwritten by a checkpoint anyway:
+        # skip the download, the classifier and the weight init
+        kwargs = {} if pretrained else {'include_classifier': False, 'init_weights': False}
         if name == 'vgg16_bn':
-            backbone = models.vgg16_bn(pretrained=True)
+            backbone = models.vgg16_bn(pretrained=pretrained, **kwargs)
         elif name == 'vgg16':
-            backbone = models.vgg16(pretrained=True)
+            backbone = models.vgg16(pretrained=pretrained, **kwargs)
         num_channels = 256
         super().__init__(backbone, num_channels, name, return_interm_layers)
 
 
-def build_backbone(args):
-    backbone = Backbone_VGG(args.backbone, True)
+def build_backbone(args, pretrained=True):
+    backbone = Backbone_VGG(args.backbone, True, pretrained=pretrained)
     return backbone
 
 if __name__ == '__main__':
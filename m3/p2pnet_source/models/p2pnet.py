@@ -10,11 +10,22 @@ from .backbone import build_backbone
 from .matcher import build_matcher_crowd
 
 import numpy as np
+import threading
 import time
+from collections import OrderedDict
+
+# conv3/conv4 of both branches are never used in forward
+_UNUSED_HEAD_LAYERS = ('conv3.', 'conv4.')
+
+# drop the weights of layers that were not built from a loaded state dict
+def _drop_unused_head_keys(state_dict, prefix, *args):
+    for key in list(state_dict.keys()):
+        if key.startswith(prefix) and key[len(prefix):].startswith(_UNUSED_HEAD_LAYERS):
+            del state_dict[key]
 
 # the network frmawork of the regression branch
 class RegressionModel(nn.Module):
-    def __init__(self, num_features_in, num_anchor_points=4, feature_size=256):
+    def __init__(self, num_features_in, num_anchor_points=4, feature_size=256, unused_layers=True):
         super(RegressionModel, self).__init__()
 
         self.conv1 = nn.Conv2d(num_features_in, feature_size, kernel_size=3, padding=1)
@@ -23,11 +34,14 @@ class RegressionModel(nn.Module):
         self.conv2 = nn.Conv2d(feature_size, feature_size, kernel_size=3, padding=1)
         self.act2 = nn.ReLU()
 
-        self.conv3 = nn.Conv2d(feature_size, feature_size, kernel_size=3, padding=1)
-        self.act3 = nn.ReLU()
+        if unused_layers:
+            self.conv3 = nn.Conv2d(feature_size, feature_size, kernel_size=3, padding=1)
+            self.act3 = nn.ReLU()
 
-        self.conv4 = nn.Conv2d(feature_size, feature_size, kernel_size=3, padding=1)
-        self.act4 = nn.ReLU()
+            self.conv4 = nn.Conv2d(feature_size, feature_size, kernel_size=3, padding=1)
+            self.act4 = nn.ReLU()
+        else:
+            self._register_load_state_dict_pre_hook(_drop_unused_head_keys)
 
         self.output = nn.Conv2d(feature_size, num_anchor_points * 2, kernel_size=3, padding=1)
     # sub-branch forward
@@ -46,7 +60,8 @@ class RegressionModel(nn.Module):
 
 # the network frmawork of the classification branch
 class ClassificationModel(nn.Module):
-    def __init__(self, num_features_in, num_anchor_points=4, num_classes=80, prior=0.01, feature_size=256):
+    def __init__(self, num_features_in, num_anchor_points=4, num_classes=80, prior=0.01, feature_size=256,
+                 unused_layers=True):
         super(ClassificationModel, self).__init__()
 
         self.num_classes = num_classes
@@ -58,11 +73,14 @@ class ClassificationModel(nn.Module):
         self.conv2 = nn.Conv2d(feature_size, feature_size, kernel_size=3, padding=1)
         self.act2 = nn.ReLU()
 
-        self.conv3 = nn.Conv2d(feature_size, feature_size, kernel_size=3, padding=1)
-        self.act3 = nn.ReLU()
+        if unused_layers:
+            self.conv3 = nn.Conv2d(feature_size, feature_size, kernel_size=3, padding=1)
+            self.act3 = nn.ReLU()
 
-        self.conv4 = nn.Conv2d(feature_size, feature_size, kernel_size=3, padding=1)
-        self.act4 = nn.ReLU()
+            self.conv4 = nn.Conv2d(feature_size, feature_size, kernel_size=3, padding=1)
+            self.act4 = nn.ReLU()
+        else:
+            self._register_load_state_dict_pre_hook(_drop_unused_head_keys)
 
         self.output = nn.Conv2d(feature_size, num_anchor_points * num_classes, kernel_size=3, padding=1)
         self.output_act = nn.Sigmoid()
@@ -117,9 +135,47 @@ def shift(shape, stride, anchor_points):
 
     return all_anchor_points
 
+# torch version of generate_anchor_points, built directly on the target device
+def generate_anchor_points_tensor(stride=16, row=3, line=3, device=None):
+    row_step = stride / row
+    line_step = stride / line
+
+    # float64 keeps the values identical to the NumPy implementation
+    shift_x = (torch.arange(1, line + 1, dtype=torch.float64, device=device) - 0.5) * line_step - stride / 2
+    shift_y = (torch.arange(1, row + 1, dtype=torch.float64, device=device) - 0.5) * row_step - stride / 2
+
+    shift_y, shift_x = torch.meshgrid(shift_y, shift_x, indexing='ij')
+
+    anchor_points = torch.stack((shift_x.reshape(-1), shift_y.reshape(-1)), dim=1)
+
+    return anchor_points
+# torch version of shift
+def shift_tensor(shape, stride, anchor_points):
+    device = anchor_points.device
+    shift_x = (torch.arange(0, shape[1], dtype=torch.float64, device=device) + 0.5) * stride
+    shift_y = (torch.arange(0, shape[0], dtype=torch.float64, device=device) + 0.5) * stride
+
+    shift_y, shift_x = torch.meshgrid(shift_y, shift_x, indexing='ij')
+
+    shifts = torch.stack((shift_x.reshape(-1), shift_y.reshape(-1)), dim=1)
+
+    A = anchor_points.shape[0]
+    K = shifts.shape[0]
+    all_anchor_points = anchor_points.reshape(1, A, 2) + shifts.reshape(K, 1, 2)
+    all_anchor_points = all_anchor_points.reshape(K * A, 2)
+
+    return all_anchor_points
+
+# whether the model is being traced/exported/compiled (Python-side caches must be bypassed)
+def _is_graph_capture():
+    if torch.jit.is_tracing() or torch.onnx.is_in_onnx_export():
+        return True
+    compiler = getattr(torch, 'compiler', None)
+    return compiler is not None and hasattr(compiler, 'is_compiling') and compiler.is_compiling()
+
 # this class generate all reference points on all pyramid levels
 class AnchorPoints(nn.Module):
-    def __init__(self, pyramid_levels=None, strides=None, row=3, line=3):
+    def __init__(self, pyramid_levels=None, strides=None, row=3, line=3, cache_size=8):
         super(AnchorPoints, self).__init__()
 
         if pyramid_levels is None:
@@ -133,24 +189,60 @@ class AnchorPoints(nn.Module):
         self.row = row
         self.line = line
 
-    def forward(self, image):
-        image_shape = image.shape[2:]
-        image_shape = np.array(image_shape)
-        image_shapes = [(image_shape + 2 ** x - 1) // (2 ** x) for x in self.pyramid_levels]
+        # small LRU cache of anchor grids keyed by (H, W, device, dtype)
+        # (the model is called from several threads, so the cache is guarded by a lock)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # locks cannot be pickled/deep-copied; the copy starts with an empty cache
+        state = self.__dict__.copy()
+        state['_cache'] = OrderedDict()
+        state.pop('_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._lock = threading.Lock()
+
+    def build_anchor_points(self, image_shape, device, dtype):
+        image_shapes = [((image_shape[0] + 2 ** x - 1) // (2 ** x),
+                         (image_shape[1] + 2 ** x - 1) // (2 ** x)) for x in self.pyramid_levels]
 
-        all_anchor_points = np.zeros((0, 2)).astype(np.float32)
+        all_anchor_points = []
         # get reference points for each level
         for idx, p in enumerate(self.pyramid_levels):
-            anchor_points = generate_anchor_points(2**p, row=self.row, line=self.line)
-            shifted_anchor_points = shift(image_shapes[idx], self.strides[idx], anchor_points)
-            all_anchor_points = np.append(all_anchor_points, shifted_anchor_points, axis=0)
-
-        all_anchor_points = np.expand_dims(all_anchor_points, axis=0)
-        # send reference points to device
-        if torch.cuda.is_available():
-            return torch.from_numpy(all_anchor_points.astype(np.float32)).cuda()
-        else:
-            return torch.from_numpy(all_anchor_points.astype(np.float32))
+            anchor_points = generate_anchor_points_tensor(2**p, row=self.row, line=self.line, device=device)
+            shifted_anchor_points = shift_tensor(image_shapes[idx], self.strides[idx], anchor_points)
+            all_anchor_points.append(shifted_anchor_points)
+
+        all_anchor_points = torch.cat(all_anchor_points, dim=0).unsqueeze(0)
+        return all_anchor_points.to(dtype)
+
+    def forward(self, image):
+        image_shape = tuple(image.shape[2:])
+        # anchors are at least float32 so that FP16 models keep full-precision coordinates
+        dtype = torch.promote_types(image.dtype, torch.float32)
+
+        # when exporting/tracing, build the anchors in-graph so H/W stay dynamic
+        if _is_graph_capture():
+            return self.build_anchor_points(image_shape, image.device, dtype)
+
+        key = (image_shape[0], image_shape[1], image.device, dtype)
+
+        with self._lock:
+            all_anchor_points = self._cache.get(key)
+            if all_anchor_points is not None:
+                self._cache.move_to_end(key)
+                return all_anchor_points
+
+            all_anchor_points = self.build_anchor_points(image_shape, image.device, dtype)
+            if self.cache_size > 0:
+                self._cache[key] = all_anchor_points
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return all_anchor_points
 
 class Decoder(nn.Module):
     def __init__(self, C3_size, C4_size, C5_size, feature_size=256):
@@ -192,17 +284,20 @@ class Decoder(nn.Module):
 
 # the defenition of the P2PNet model
 class P2PNet(nn.Module):
-    def __init__(self, backbone, row=2, line=2):
+    def __init__(self, backbone, row=2, line=2, inference_only=False):
         super().__init__()
         self.backbone = backbone
         self.num_classes = 2
         # the number of all anchor points
         num_anchor_points = row * line
 
-        self.regression = RegressionModel(num_features_in=256, num_anchor_points=num_anchor_points)
+        # inference builds skip the head layers that forward never uses
+        self.regression = RegressionModel(num_features_in=256, num_anchor_points=num_anchor_points, \
+                                            unused_layers=not inference_only)
         self.classification = ClassificationModel(num_features_in=256, \
                                             num_classes=self.num_classes, \
-                                            num_anchor_points=num_anchor_points)
+                                            num_anchor_points=num_anchor_points, \
+                                            unused_layers=not inference_only)
 
         self.anchor_points = AnchorPoints(pyramid_levels=[3,], row=row, line=line)
 
@@ -218,7 +313,7 @@ class P2PNet(nn.Module):
         # run the regression and classification branch
         regression = self.regression(features_fpn[1]) * 100 # 8x
         classification = self.classification(features_fpn[1])
-        anchor_points = self.anchor_points(samples).repeat(batch_size, 1, 1)
+        anchor_points = self.anchor_points(samples).expand(batch_size, -1, -1)
         # decode the points as prediction
         output_coord = regression + anchor_points
         output_class = classification
@@ -327,8 +422,10 @@ def build(args, training):
     # treats persons as a single class
     num_classes = 1
 
-    backbone = build_backbone(args)
-    model = P2PNet(backbone, args.row, args.line)
+    # inference weights always come from a checkpoint: build without ImageNet weights
+    # (no download, no classifier) and without the unused head layers
+    backbone = build_backbone(args, pretrained=training)
+    model = P2PNet(backbone, args.row, args.line, inference_only=not training)
     if not training: 
         return model
 
@@ -0,0 +1,127 @@
+"""
+카메라별 원근(perspective) 모델 → 픽셀당 지면 면적 맵
+
+3단계(Near/Mid/Far) 고정 가중치와 상/하단 10%/95% 고정 컷 대신,
+카메라마다 원근 모델을 한 번 정의해 두고 프레임 크기별로 float32 면적 맵(m²/px)을 미리 계산
+- 밀도 = ROI(또는 구역) 인원 / ROI 지면 면적 (명/m²) → 카메라 간 pct를 같은 기준으로 비교 가능
+- 점의 유효 여부 = 점 위치의 면적 맵 값 조회(gather) 한 번 (지평선 위 / 사람이 너무 작게 보이는 영역 제외)
+
+지원 모델 (좌표는 모두 프레임 비율 0.0~1.0 → 해상도와 무관):
+    {'type': 'row_scale', 'rows': [(y 비율, 사람 키 / 프레임 높이), ...]}
+        행(y)별 사람 키를 2개 이상 측정해 직선으로 근사 (x 방향 원근 무시)
+    {'type': 'homography', 'image_points': [(x, y) 비율 × 4], 'ground_points': [(X, Y) m × 4]}
+        바닥 위 네 점의 영상 좌표와 실제 좌표(m)로 지면 호모그래피 계산
+    공통 선택 항목: 'min_person_px' (이보다 작게 보이는 영역은 제외)
+"""
+
+import cv2
+import numpy as np
+
+from constants import PERSON_HEIGHT_M, DEFAULT_MIN_PERSON_PX, DEFAULT_FULL_DENSITY_PER_M2
+
+PERSPECTIVE_TYPES = ('row_scale', 'homography')
+
+
+def perspective_key(settings):
+    """원근 설정 dict → 해시 가능한 키"""
+    def freeze(value):
+        if isinstance(value, dict):
+            return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(v) for v in value)
+        return value
+    return freeze(settings)
+
+
+def _row_scale_area(settings, h):
+    """행별 사람 키 직선 근사 → (H, 1) m²/px"""
+    rows = np.asarray(settings['rows'], dtype=np.float64)
+    if len(rows) < 2:
+        raise ValueError("row_scale 원근 모델은 'rows'에 2개 이상의 (y 비율, 키 비율)이 필요합니다.")
+    slope, intercept = np.polyfit(rows[:, 0], rows[:, 1], 1)
+    y_ratio = (np.arange(h, dtype=np.float64) + 0.5) / h
+    person_px = (slope * y_ratio + intercept) * h
+    px_per_m = np.where(person_px > 0, person_px / PERSON_HEIGHT_M, 0.0)
+    area = np.divide(1.0, px_per_m ** 2, out=np.zeros_like(px_per_m), where=px_per_m > 0)
+    return area[:, None]
+
+
+def _homography_area(settings, h, w):
+    """지면 호모그래피 야코비안 → (H, W) m²/px"""
+    image_points = np.asarray(settings['image_points'], dtype=np.float32) * np.float32([w, h])
+    ground_points = np.asarray(settings['ground_points'], dtype=np.float32)
+    if image_points.shape != (4, 2) or ground_points.shape != (4, 2):
+        raise ValueError("homography 원근 모델은 'image_points'/'ground_points'에 4개 점이 필요합니다.")
+    H = cv2.getPerspectiveTransform(image_points, ground_points).astype(np.float64)
+
+    # 기준 점들에서 동차 좌표 w가 양수가 되도록 부호 정규화 (w <= 0 이면 지평선 위)
+    center = np.append(image_points.mean(axis=0), 1.0)
+    if H[2] @ center < 0:
+        H = -H
+
+    # 사영 변환의 야코비안 행렬식 = det(H) / w³
+    xs = np.arange(w, dtype=np.float64) + 0.5
+    ys = np.arange(h, dtype=np.float64)[:, None] + 0.5
+    denom = H[2, 0] * xs + H[2, 1] * ys + H[2, 2]
+    det = abs(np.linalg.det(H))
+    return np.divide(det, denom ** 3, out=np.zeros((h, w)), where=denom > 0)
+
+
+class PerspectiveMap:
+    """
+    프레임 크기에 맞춰 계산한 픽셀당 지면 면적 맵
+
+    Attributes:
+        area: (H, W) float32 m²/px (row_scale은 (H, 1)을 broadcast한 뷰), 제외 영역은 0
+    """
+    __slots__ = ('area',)
+
+    def __init__(self, settings, frame_shape):
+        h, w = frame_shape[:2]
+        kind = settings.get('type')
+        if kind == 'row_scale':
+            area = _row_scale_area(settings, h)
+        elif kind == 'homography':
+            area = _homography_area(settings, h, w)
+        else:
+            raise ValueError(f"지원하지 않는 원근 모델입니다: {kind} (가능: {PERSPECTIVE_TYPES})")
+
+        # 사람 키가 min_person_px보다 작게 보이는 영역 (지평선 근처) 제외
+        min_px = settings.get('min_person_px', DEFAULT_MIN_PERSON_PX)
+        max_area = (PERSON_HEIGHT_M / min_px) ** 2
+        area = np.where(area <= max_area, area, 0.0).astype(np.float32)
+        self.area = np.broadcast_to(area, (h, w))
+
+    def point_area(self, points):
+        """(N, 2) 점 위치의 m²/px (프레임 밖/NaN 좌표는 0)"""
+        points = np.asarray(points)
+        if len(points) == 0:
+            return np.zeros(0, dtype=np.float32)
+        h, w = self.area.shape
+        xs, ys = points[:, 0], points[:, 1]
+        valid = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+        values = np.zeros(len(points), dtype=np.float32)
+        values[valid] = self.area[ys[valid].astype(np.intp), xs[valid].astype(np.intp)]
+        return values
+
+    def is_valid(self, points):
+        """원근 모델 유효 영역 안의 점 여부 (filter_by_perspective 대체)"""
+        return self.point_area(points) > 0
+
+    def ground_area(self, mask=None):
+        """mask(uint8, None이면 전체 프레임) 영역의 지면 면적 (m²)"""
+        if mask is None:
+            return float(self.area.sum(dtype=np.float64))
+        return float(self.area[mask > 0].sum(dtype=np.float64))
+
+    def label_areas(self, labels, size):
+        """라벨 래스터의 라벨별 지면 면적 (m²)"""
+        return np.bincount(labels.ravel(), weights=np.ascontiguousarray(self.area).ravel(), minlength=size)
+
+
+def ground_density(count, ground_area, full_density=DEFAULT_FULL_DENSITY_PER_M2):
+    """인원 / 지면 면적 → (밀도 명/m², pct)"""
+    if ground_area <= 0:
+        return 0.0, 0.0
+    density = count / ground_area
+    return density, min(100, (density / full_density) * 100)
@@ -0,0 +1,151 @@
+"""
+P2PNet 입력 전처리 모듈
+
+감마 보정 → BGR→RGB → ToTensor → Normalize → 128 배수 패딩을
+PIL/torchvision 없이 NumPy uint8 버퍼에서 바로 정규화 텐서로 변환
+(기존 predict_count 전처리와 동일한 수치 결과)
+"""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import torch
+
+# 감마 보정 (야간/저조도 대응, gamma < 1.0 : 어둡게, gamma > 1.0 : 밝게)
+DEFAULT_GAMMA = 1.5
+
+# ImageNet 정규화 값 (학습 시 사용한 값과 동일)
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# P2PNet 입력 크기 배수
+PAD_MULTIPLE = 128
+
+
+def build_gamma_lut(gamma=DEFAULT_GAMMA):
+    """감마 보정용 256단계 Look-Up Table 생성"""
+    return np.array([((i / 255.0) ** (1.0 / gamma)) * 255
+                     for i in np.arange(0, 256)]).astype("uint8")
+
+
+# 모듈 로드 시 1회만 계산
+GAMMA_LUT = build_gamma_lut(DEFAULT_GAMMA)
+
+
+def get_padded_size(h, w, multiple=PAD_MULTIPLE):
+    """(h, w)를 multiple의 배수로 올림한 크기 반환"""
+    gh = ((h + multiple - 1) // multiple) * multiple
+    gw = ((w + multiple - 1) // multiple) * multiple
+    return gh, gw
+
+
+class FramePreprocessor:
+    """
+    프레임 → P2PNet 입력 텐서 변환기
+
+    - 감마 LUT는 1회만 계산하고, LUT 결과도 해상도별 uint8 버퍼에 재사용
+    - 입력 텐서는 (배치 크기, 패딩 크기)별로 미리 할당한 버퍼에 채움
+      (패딩 영역은 검은색을 정규화한 값으로 채워 둠)
+    - 버퍼는 스레드별로 관리되므로 여러 스레드에서 동시에 호출해도 안전함
+    """
+
+    def __init__(self, device='cpu', gamma=DEFAULT_GAMMA, pad_multiple=PAD_MULTIPLE, max_buffers=8):
+        """
+        Args:
+            device: 입력 텐서를 만들 디바이스
+            gamma: 감마 보정 값 (None이면 보정하지 않음)
+            pad_multiple: 패딩 배수 (P2PNet 요구사항: 128)
+            max_buffers: 스레드별로 유지할 최대 버퍼 개수 (LRU)
+        """
+        self.device = torch.device(device)
+        self.gamma_lut = GAMMA_LUT if gamma == DEFAULT_GAMMA else (
+            build_gamma_lut(gamma) if gamma is not None else None)
+        self.pad_multiple = pad_multiple
+        self.max_buffers = max_buffers
+
+        self.mean = torch.as_tensor(IMAGENET_MEAN, dtype=torch.float32, device=self.device).view(-1, 1, 1)
+        self.std = torch.as_tensor(IMAGENET_STD, dtype=torch.float32, device=self.device).view(-1, 1, 1)
+        # 검은색(0) 패딩 픽셀의 정규화 값 (ToTensor → Normalize 순서 그대로)
+        black = torch.zeros(3, 1, 1, dtype=torch.float32, device=self.device)
+        self.pad_value = black.div(255).sub_(self.mean).div_(self.std)
+
+        self._local = threading.local()
+
+    def get_input_size(self, frame):
+        """프레임이 모델에 입력될 때의 패딩 후 크기 (H', W')"""
+        h, w = frame.shape[:2]
+        return get_padded_size(h, w, self.pad_multiple)
+
+    def _get_cache(self):
+        cache = getattr(self._local, 'buffers', None)
+        if cache is None:
+            cache = self._local.buffers = OrderedDict()
+        return cache
+
+    def _get_buffer(self, key, factory):
+        cache = self._get_cache()
+        buf = cache.get(key)
+        if buf is None:
+            buf = factory()
+            cache[key] = buf
+            if len(cache) > self.max_buffers:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return buf
+
+    def _apply_gamma(self, frame):
+        if self.gamma_lut is None:
+            return frame
+        h, w = frame.shape[:2]
+        dst = self._get_buffer(('lut', h, w, frame.shape[2:]),
+                               lambda: np.empty_like(frame))
+        return cv2.LUT(frame, self.gamma_lut, dst=dst)
+
+    def preprocess(self, frames):
+        """
+        패딩 크기가 같은 프레임들을 하나의 배치 텐서로 변환
+
+        Args:
+            frames: OpenCV BGR uint8 이미지 리스트 (모두 같은 패딩 크기여야 함)
+
+        Returns:
+            (B, 3, H', W') float32 텐서. 재사용 버퍼이므로 같은 스레드에서
+            다음 preprocess() 호출 전까지만 유효함
+        """
+        gh, gw = self.get_input_size(frames[0])
+        batch_size = len(frames)
+
+        def new_batch():
+            tensor = torch.empty(batch_size, 3, gh, gw, dtype=torch.float32, device=self.device)
+            return {'tensor': tensor, 'shapes': [None] * batch_size}
+
+        buf = self._get_buffer(('batch', batch_size, gh, gw), new_batch)
+        batch = buf['tensor']
+
+        for b, frame in enumerate(frames):
+            h, w = frame.shape[:2]
+            if self.get_input_size(frame) != (gh, gw):
+                raise ValueError(f"패딩 크기가 다른 프레임은 같은 배치에 넣을 수 없습니다: {frame.shape}")
+
+            slot = batch[b]
+            # 이전에 다른 크기의 프레임이 있던 자리면 패딩 영역 재설정
+            if buf['shapes'][b] != (h, w):
+                slot.copy_(self.pad_value.expand(3, gh, gw))
+                buf['shapes'][b] = (h, w)
+
+            src = torch.from_numpy(self._apply_gamma(frame))
+            if src.device != self.device:
+                src = src.to(self.device, non_blocking=True)
+
+            # BGR(HWC, uint8) → RGB(CHW, float32): 채널 교환 + 레이아웃 + 형변환을 한 번에 복사
+            region = slot[:, :h, :w]
+            for c in range(3):
+                region[c].copy_(src[:, :, 2 - c])
+
+            # ToTensor + Normalize와 동일한 연산 순서
+            region.div_(255).sub_(self.mean).div_(self.std)
+
+        return batch
@@ -0,0 +1,314 @@
+"""
+P2PNet INT8 정적 양자화 (Post-Training Quantization) 도구
+
+VGG16-BN 백본, FPN Decoder, 회귀/분류 헤드를 INT8로 변환 (CPU 배포용)
+- Conv+BN+ReLU / Conv+ReLU 융합 후 SHHA test.list 이미지로 활성값 범위를 보정(calibration)
+- 앵커 포인트 덧셈과 회귀값 스케일(×100)은 FP32로 유지
+- evaluate_crowd_no_overlap 기준 FP32 대비 MAE/MSE 변화와 지연 시간을 함께 보고
+
+사용 예:
+    python quantize.py --model-path best_mae.pth --p2pnet-source ./p2pnet_source \
+        --data-root ./new_public_density_data --output best_mae_int8.pth --eval --benchmark
+
+변환된 모델은 M3CongestionAPI(..., backend='int8', quantized_path='best_mae_int8.pth')로 로드
+"""
+
+import argparse
+import copy
+import os
+import warnings
+
+import cv2
+import numpy as np
+import torch
+from torch import nn
+
+try:
+    import torch.ao.quantization as tq
+except ImportError:  # torch < 1.10
+    import torch.quantization as tq
+
+from preprocess import FramePreprocessor
+
+
+class _QuantizableDecoder(nn.Module):
+    """Decoder의 원소별 덧셈을 양자화 가능한 FloatFunctional로 바꾼 래퍼 (가중치는 그대로 공유)"""
+
+    def __init__(self, decoder):
+        super().__init__()
+        self.decoder = decoder
+        self.add_p4 = nn.quantized.FloatFunctional()
+        self.add_p3 = nn.quantized.FloatFunctional()
+
+    def forward(self, inputs):
+        C3, C4, C5 = inputs
+        d = self.decoder
+
+        P5_x = d.P5_1(C5)
+        P5_upsampled_x = d.P5_upsampled(P5_x)
+        P5_x = d.P5_2(P5_x)
+
+        P4_x = d.P4_1(C4)
+        P4_x = self.add_p4.add(P5_upsampled_x, P4_x)
+        P4_upsampled_x = d.P4_upsampled(P4_x)
+        P4_x = d.P4_2(P4_x)
+
+        P3_x = d.P3_1(C3)
+        P3_x = self.add_p3.add(P3_x, P4_upsampled_x)
+        P3_x = d.P3_2(P3_x)
+
+        return [P3_x, P4_x, P5_x]
+
+
+def select_engine():
+    """현재 CPU에서 사용할 양자화 엔진 선택 (x86 > fbgemm > qnnpack)"""
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in engines:
+            return engine
+    raise RuntimeError(f"지원되는 양자화 엔진이 없습니다: {engines}")
+
+
+def _fuse_sequential(seq):
+    """Sequential 안의 Conv→BN→ReLU / Conv→ReLU 묶음을 융합"""
+    children = list(seq.children())
+    groups = []
+    i = 0
+    while i < len(children):
+        if isinstance(children[i], nn.Conv2d):
+            if (i + 2 < len(children) and isinstance(children[i + 1], nn.BatchNorm2d)
+                    and isinstance(children[i + 2], nn.ReLU)):
+                groups.append([str(i), str(i + 1), str(i + 2)])
+                i += 3
+                continue
+            if i + 1 < len(children) and isinstance(children[i + 1], nn.ReLU):
+                groups.append([str(i), str(i + 1)])
+                i += 2
+                continue
+        i += 1
+    if groups:
+        tq.fuse_modules(seq, groups, inplace=True)
+
+
+def prepare_quantizable(model, engine):
+    """
+    FP32 P2PNet → 보정(calibration) 가능한 양자화 준비 모델
+
+    원본 모델은 변경하지 않고 복사본을 만들어 다음을 적용:
+    - 백본 body1~4의 Conv+BN+ReLU 융합, body1 앞에 QuantStub 삽입
+    - Decoder 덧셈을 FloatFunctional로 교체
+    - 헤드 Conv+ReLU 융합, 출력 Conv 뒤에 DeQuantStub 삽입 (이후 reshape/×100/앵커 덧셈은 FP32)
+
+    Args:
+        model: eval 모드의 P2PNet
+        engine: 양자화 엔진 ('x86', 'fbgemm', 'qnnpack')
+    """
+    torch.backends.quantized.engine = engine
+
+    qmodel = copy.deepcopy(model).cpu().float().eval()
+
+    # 1. 백본
+    backbone = qmodel.backbone
+    for name in ('body1', 'body2', 'body3', 'body4'):
+        _fuse_sequential(getattr(backbone, name))
+    backbone.body1 = nn.Sequential(tq.QuantStub(), *backbone.body1)
+
+    # 2. FPN Decoder
+    qmodel.fpn = _QuantizableDecoder(qmodel.fpn)
+
+    # 3. 헤드 (conv3/conv4는 forward에서 쓰이지 않으므로 양자화 대상에서 제외)
+    for head in (qmodel.regression, qmodel.classification):
+        tq.fuse_modules(head, [['conv1', 'act1'], ['conv2', 'act2']], inplace=True)
+        head.output = nn.Sequential(head.output, tq.DeQuantStub())
+        for name in ('conv3', 'conv4'):
+            layer = getattr(head, name, None)
+            if layer is not None:
+                layer.qconfig = None
+
+    qmodel.qconfig = tq.get_default_qconfig(engine)
+
+    tq.prepare(qmodel, inplace=True)
+    return qmodel
+
+
+def load_calibration_frames(data_root, num_images=32):
+    """SHHA test.list에 등록된 이미지를 BGR 프레임으로 로드 (최대 num_images장)"""
+    from crowd_datasets.SHHA.SHHA import SHHA
+
+    img_list = SHHA(data_root, train=False).img_list
+    if not img_list:
+        raise ValueError(f"test.list에 이미지가 없습니다: {data_root}")
+
+    # 데이터셋 전체에서 고르게 선택
+    if num_images and len(img_list) > num_images:
+        picks = np.linspace(0, len(img_list) - 1, num_images).astype(int)
+        img_list = [img_list[i] for i in picks]
+
+    frames = []
+    for path in img_list:
+        frame = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError(f"이미지 로드 실패: {path}")
+        frames.append(frame)
+    return frames
+
+
+@torch.no_grad()
+def calibrate(prepared, frames):
+    """운영과 같은 전처리(FramePreprocessor)로 프레임을 통과시켜 활성값 범위 수집"""
+    preprocessor = FramePreprocessor(device='cpu')
+    for i, frame in enumerate(frames):
+        prepared(preprocessor.preprocess([frame]))
+        if (i + 1) % 10 == 0:
+            print(f"  보정 진행: {i + 1}/{len(frames)}")
+
+
+def quantize_model(model, frames, engine=None):
+    """
+    FP32 P2PNet → INT8 P2PNet
+
+    Args:
+        model: eval 모드의 P2PNet (FP32)
+        frames: 보정용 BGR 프레임 리스트
+        engine: 양자화 엔진 (None이면 자동 선택)
+
+    Returns:
+        (quantized_model, engine)
+    """
+    engine = engine or select_engine()
+    prepared = prepare_quantizable(model, engine)
+    calibrate(prepared, frames)
+    quantized = tq.convert(prepared.eval(), inplace=False)
+    return quantized, engine
+
+
+def save_quantized(quantized, engine, output_path, backbone='vgg16_bn', row=2, line=2):
+    """INT8 모델 저장 (구조 재생성을 위해 엔진/백본 설정도 함께 저장)"""
+    torch.save({
+        'model': quantized.state_dict(),
+        'engine': engine,
+        'backbone': backbone,
+        'row': row,
+        'line': line,
+    }, output_path)
+    print(f"✅ INT8 모델 저장: {output_path} ({os.path.getsize(output_path) / 1e6:.1f} MB)")
+
+
+def load_quantized_model(build_model, quantized_path):
+    """
+    save_quantized로 저장한 INT8 모델 로드 (CPU 전용)
+
+    Args:
+        build_model: P2PNet 소스의 models.build_model
+        quantized_path: INT8 체크포인트 경로
+    """
+    if not os.path.exists(quantized_path):
+        raise FileNotFoundError(f"INT8 모델 파일이 없습니다: {quantized_path}")
+
+    checkpoint = torch.load(quantized_path, map_location='cpu')
+    if 'engine' not in checkpoint:
+        raise ValueError(f"INT8 체크포인트가 아닙니다 (quantize.py로 변환해주세요): {quantized_path}")
+
+    class Args:
+        backbone = checkpoint.get('backbone', 'vgg16_bn')
+        row = checkpoint.get('row', 2)
+        line = checkpoint.get('line', 2)
+
+    # 같은 구조를 만든 뒤 INT8 가중치를 덮어씀 (보정 없이 바로 변환)
+    model = build_model(Args(), training=False).eval()
+    prepared = prepare_quantizable(model, checkpoint['engine'])
+    with warnings.catch_warnings():
+        # 보정하지 않은 observer 경고 무시 (scale/zero_point는 체크포인트에서 로드)
+        warnings.simplefilter('ignore')
+        quantized = tq.convert(prepared, inplace=True)
+    quantized.load_state_dict(checkpoint['model'])
+    quantized.eval()
+    return quantized
+
+
+def evaluate_drift(fp32_model, int8_model, data_root):
+    """SHHA 검증셋에서 evaluate_crowd_no_overlap으로 FP32/INT8 MAE·MSE 비교"""
+    from torch.utils.data import DataLoader
+    from crowd_datasets import build_dataset
+    from engine import evaluate_crowd_no_overlap
+    import util.misc as utils
+
+    class DatasetArgs:
+        dataset_file = 'SHHA'
+
+    _, val_set = build_dataset(DatasetArgs())(data_root)
+    device = torch.device('cpu')
+
+    report = {}
+    for name, model in (('fp32', fp32_model), ('int8', int8_model)):
+        data_loader = DataLoader(val_set, 1, sampler=torch.utils.data.SequentialSampler(val_set),
+                                 drop_last=False, collate_fn=utils.collate_fn_crowd)
+        mae, mse = evaluate_crowd_no_overlap(model, data_loader, device)
+        report[name] = {'mae': float(mae), 'mse': float(mse)}
+
+    report['drift'] = {
+        'mae': report['int8']['mae'] - report['fp32']['mae'],
+        'mse': report['int8']['mse'] - report['fp32']['mse'],
+    }
+    print(f"📏 정확도 (SHHA test, {len(val_set)}장)")
+    for name in ('fp32', 'int8'):
+        print(f"  {name:<5} MAE {report[name]['mae']:8.2f} | MSE {report[name]['mse']:8.2f}")
+    print(f"  drift MAE {report['drift']['mae']:+8.2f} | MSE {report['drift']['mse']:+8.2f}")
+    return report
+
+
+def benchmark_latency(fp32_model, int8_model, frames, iters=10, warmup=2):
+    """FP32/INT8 모델의 프레임당 지연 시간 비교 (CPU)"""
+    from benchmark import time_calls, summarize
+
+    preprocessor = FramePreprocessor(device='cpu')
+    print(f"⏱️ 지연 시간 ({len(frames)}장, CPU threads={torch.get_num_threads()})")
+    results = []
+    for name, model in (('fp32', fp32_model), ('int8', int8_model)):
+        def run():
+            with torch.no_grad():
+                for frame in frames:
+                    model(preprocessor.preprocess([frame]))
+        results.append(summarize(name, time_calls(run, iters, warmup), len(frames)))
+    return results
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser('P2PNet INT8 quantization', add_help=True)
+    parser.add_argument('--model-path', required=True, help='학습된 FP32 체크포인트 (.pth)')
+    parser.add_argument('--p2pnet-source', required=True, help='P2PNet 소스 경로')
+    parser.add_argument('--data-root', required=True, help='SHHA 형식 데이터 경로 (test.list 포함)')
+    parser.add_argument('--output', default='p2pnet_int8.pth', help='저장할 INT8 체크포인트 경로')
+    parser.add_argument('--num-calib', default=32, type=int, help='보정에 사용할 test.list 이미지 수')
+    parser.add_argument('--engine', default=None, help='양자화 엔진 (x86/fbgemm/qnnpack, 기본: 자동)')
+    parser.add_argument('--eval', action='store_true', help='FP32 대비 MAE/MSE 변화 측정')
+    parser.add_argument('--benchmark', action='store_true', help='FP32/INT8 지연 시간 비교')
+    parser.add_argument('--bench-images', default=4, type=int, help='지연 시간 측정에 쓸 보정 이미지 수')
+    parser.add_argument('--iters', default=10, type=int)
+    parser.add_argument('--num-threads', default=None, type=int, help='torch CPU 스레드 수')
+    return parser
+
+
+def main(args):
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+
+    from export_onnx import load_p2pnet
+    fp32_model = load_p2pnet(args.model_path, args.p2pnet_source)
+
+    print(f"📦 보정 이미지 로드: {args.data_root}/test.list")
+    frames = load_calibration_frames(args.data_root, args.num_calib)
+
+    print(f"🔧 INT8 변환 (보정 {len(frames)}장)")
+    int8_model, engine = quantize_model(fp32_model, frames, engine=args.engine)
+
+    save_quantized(int8_model, engine, args.output)
+
+    if args.eval:
+        evaluate_drift(fp32_model, int8_model, args.data_root)
+    if args.benchmark:
+        benchmark_latency(fp32_model, int8_model, frames[:args.bench_images], iters=args.iters)
+
+
+if __name__ == '__main__':
+    main(get_args_parser().parse_args())
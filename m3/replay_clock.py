@@ -0,0 +1,82 @@
+"""
+VideoProcessor용 시계 + 분석 타임라인 기록
+
+process_stream_simulation은 분석 주기마다 실제로 기다리므로 영상 하나를 처리하는 데
+영상 길이만큼 걸리고, 대기 시간/타이밍이 매번 달라 실행을 재현할 수 없음
+- RealTimeClock: 운영용 (실제 시간만큼 대기, 중지 신호가 오면 즉시 깨어남)
+- VirtualClock: 오프라인 재생용. 대기하지 않고 시뮬레이션 시각만 앞당김
+  → 영상을 최대 속도로 한 번 처리하면서 분석 시각/주기는 실시간과 같은 값으로 기록
+- TimelineWriter: 분석 주기마다 인원/PCT/등급 + 단계별 소요 시간을 JSONL로 기록
+  (영상별 처리량 벤치마크, 실행 간 결과 비교용)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class RealTimeClock:
+    """실제 시간 (운영용)"""
+
+    virtual = False
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    async def wait(self, seconds, stop_event) -> bool:
+        """seconds 동안 대기 (stop_event가 설정되면 즉시 깨어남). 중지 신호를 받았으면 True"""
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+        return stop_event.is_set()
+
+
+class VirtualClock:
+    """
+    가상 시간 (오프라인 재생용)
+
+    wait()는 기다리지 않고 시각만 seconds만큼 앞당김 (다른 태스크에 한 번 양보)
+    """
+
+    virtual = True
+
+    def __init__(self, start=0.0):
+        self._now = float(start)
+
+    def now(self) -> float:
+        return self._now
+
+    async def wait(self, seconds, stop_event) -> bool:
+        self._now += max(0.0, float(seconds))
+        await asyncio.sleep(0)
+        return stop_event.is_set()
+
+
+class TimelineWriter:
+    """분석 주기별 결과를 JSONL 파일로 기록 (한 줄 = 분석 1회)"""
+
+    def __init__(self, path):
+        """
+        Args:
+            path: 출력 파일 경로 (이미 있으면 덮어씀)
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'w', encoding='utf-8')
+        self.records = 0
+
+    def write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.records += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            logger.info(f"🧾 타임라인 {self.records}건 기록: {self.path}")
@@ -0,0 +1,209 @@
+"""
+컴파일된 ROI / 구역(zone) 캐시
+
+ROI 다각형을 (ROI 파라미터, 프레임 크기)마다 한 번만 만들고
+면적/바운딩 박스/uint8 래스터 마스크를 함께 보관해 두어,
+프레임마다 점 하나씩 cv2.pointPolygonTest를 호출하는 대신 마스크 조회 한 번으로 ROI 내부 판정
+
+카메라별 구역(입구/승강장/출구 등)과 제외 영역은 정수 라벨 래스터 하나로 합쳐서
+모든 점의 구역별 인원을 라벨 조회 + np.bincount 한 번으로 계산 (구역 수와 무관한 비용)
+"""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from constants import CongestionLevel, DEFAULT_ROI_CACHE_SIZE, DENSITY_FULL_PCT
+from perspective import ground_density
+
+
+def _lookup_raster(raster, points):
+    """(N, 2) 점 좌표의 래스터 값 (프레임 밖/NaN 좌표는 0)"""
+    h, w = raster.shape
+    xs, ys = points[:, 0], points[:, 1]
+    valid = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+    values = np.zeros(len(points), dtype=raster.dtype)
+    values[valid] = raster[ys[valid].astype(np.intp), xs[valid].astype(np.intp)]
+    return values
+
+
+class CompiledROI:
+    """
+    프레임 크기에 맞춰 미리 계산한 ROI
+
+    Attributes:
+        polygon: (K, 2) int32 ROI 다각형
+        area: cv2.contourArea(polygon)
+        bbox: cv2.boundingRect(polygon) (x, y, w, h)
+        mask: (H, W) uint8 래스터 마스크 (경계 포함 1), 전체 프레임 ROI면 None
+    """
+    __slots__ = ('polygon', 'area', 'bbox', 'mask')
+
+    def __init__(self, polygon, frame_shape, full_frame=False):
+        h, w = frame_shape[:2]
+        self.polygon = np.asarray(polygon, dtype=np.int32)
+        self.area = cv2.contourArea(self.polygon)
+        self.bbox = cv2.boundingRect(self.polygon)
+        if full_frame:
+            self.mask = None
+        else:
+            self.mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(self.mask, [self.polygon], 1)
+
+    def contains(self, points):
+        """
+        (N, 2) 점 배열의 ROI 내부 여부 (N,) bool
+
+        점이 속한 픽셀의 마스크 값으로 판정 (pointPolygonTest(...) >= 0 과 경계 1px 이내에서 동일)
+        """
+        points = np.asarray(points)
+        if len(points) == 0:
+            return np.zeros(0, dtype=bool)
+        if self.mask is None:
+            return np.ones(len(points), dtype=bool)
+        # 프레임 밖(또는 NaN) 좌표는 외부로 처리
+        return _lookup_raster(self.mask, points) > 0
+
+
+def ratio_polygon_to_pixels(polygon, frame_shape):
+    """비율 좌표(0.0~1.0) 다각형 → 프레임 픽셀 좌표 int32 다각형"""
+    h, w = frame_shape[:2]
+    return np.round(np.asarray(polygon, dtype=np.float64) * [w, h]).astype(np.int32)
+
+
+class CompiledZones:
+    """
+    카메라 구역 정의를 프레임 크기에 맞춰 그린 정수 라벨 래스터
+
+    라벨 0은 어느 구역에도 속하지 않는 영역, 1~K는 zones 순서대로의 구역,
+    K+1은 제외 영역 (구역이 겹치면 뒤에 정의한 구역, 제외 영역은 항상 마지막에 덮어씀)
+
+    Attributes:
+        names: 구역 이름 목록 (라벨 1~K)
+        capacities: 구역별 최대 수용 인원 (없으면 None)
+        labels: (H, W) uint8/uint16 라벨 래스터
+        areas: 라벨별 픽셀 수 (겹침/제외 영역을 뺀 실제 면적)
+        excluded_label: 제외 영역 라벨 (K+1)
+        bbox: 모든 구역/제외 영역 다각형을 감싸는 (x, y, w, h) (ROI 크롭 추론 영역 계산용)
+    """
+    __slots__ = ('names', 'capacities', 'labels', 'areas', 'excluded_label', 'bbox')
+
+    def __init__(self, zones, frame_shape, exclude=()):
+        """
+        Args:
+            zones: [{'name': str, 'polygon': [(x, y), ...] 비율 좌표, 'max_capacity': int(선택)}, ...]
+            frame_shape: 프레임 shape
+            exclude: 제외 영역 다각형 목록 (비율 좌표)
+        """
+        h, w = frame_shape[:2]
+        self.names = [zone['name'] for zone in zones]
+        self.capacities = [zone.get('max_capacity') for zone in zones]
+        self.excluded_label = len(zones) + 1
+
+        dtype = np.uint8 if self.excluded_label < 256 else np.uint16
+        self.labels = np.zeros((h, w), dtype=dtype)
+        zone_polygons = [ratio_polygon_to_pixels(zone['polygon'], frame_shape) for zone in zones]
+        exclude_polygons = [ratio_polygon_to_pixels(polygon, frame_shape) for polygon in exclude]
+        for label, polygon in enumerate(zone_polygons, 1):
+            cv2.fillPoly(self.labels, [polygon], label)
+        for polygon in exclude_polygons:
+            cv2.fillPoly(self.labels, [polygon], self.excluded_label)
+        self.bbox = cv2.boundingRect(np.concatenate(zone_polygons + exclude_polygons))
+        self.areas = np.bincount(self.labels.ravel(), minlength=self.excluded_label + 1)
+
+    def label_points(self, points):
+        """(N, 2) 점 배열 → (N,) 라벨"""
+        points = np.asarray(points)
+        if len(points) == 0:
+            return np.zeros(0, dtype=np.intp)
+        return _lookup_raster(self.labels, points).astype(np.intp)
+
+    def summarize(self, labels, weights=None, ground_areas=None):
+        """
+        라벨 → 구역별 인원/밀도/PCT (np.bincount 한 번)
+
+        Args:
+            labels: label_points() 결과
+            weights: (선택) 점별 거리 가중치 (픽셀 밀도 계산용, None이면 1)
+            ground_areas: (선택) 라벨별 지면 면적 m² (원근 모델 사용 시, 밀도 단위 명/m²)
+
+        Returns:
+            (zones dict, 제외 영역 인원)
+        """
+        size = self.excluded_label + 1
+        counts = np.bincount(labels, minlength=size)
+        weighted = np.bincount(labels, weights=weights, minlength=size) if weights is not None else counts
+
+        results = {}
+        for label, (name, capacity) in enumerate(zip(self.names, self.capacities), 1):
+            count = int(counts[label])
+            if ground_areas is not None:
+                density, pct = ground_density(count, float(ground_areas[label]))
+            else:
+                area = int(self.areas[label])
+                density = float(weighted[label]) / area * 1000 if area > 0 else 0.0
+                pct = min(100, (density / DENSITY_FULL_PCT) * 100)
+            if capacity:
+                pct = min(100, round(count / capacity * 100, 2))
+            results[name] = {
+                'count': count,
+                'density': density,
+                'pct': pct,
+                'risk_level': CongestionLevel.get_level(pct),
+            }
+        return results, int(counts[self.excluded_label])
+
+
+class ROICache:
+    """(ROI 종류/파라미터, 프레임 크기) → CompiledROI / CompiledZones LRU 캐시 (스레드 안전)"""
+
+    def __init__(self, max_entries=DEFAULT_ROI_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def params_key(roi_params):
+        """ROI 파라미터 dict → 해시 가능한 키"""
+        return tuple(sorted(roi_params.items())) if roi_params else ()
+
+    @staticmethod
+    def zones_key(zones, exclude=()):
+        """구역 정의 + 제외 영역 → 해시 가능한 키"""
+        def polygon_key(polygon):
+            return tuple(tuple(float(v) for v in p) for p in polygon)
+        return (
+            tuple((zone['name'], polygon_key(zone['polygon']), zone.get('max_capacity')) for zone in zones),
+            tuple(polygon_key(polygon) for polygon in exclude),
+        )
+
+    def get(self, key, build):
+        """
+        캐시된 항목 반환 (없으면 build()로 생성 후 저장)
+
+        Args:
+            key: 해시 가능한 키 (프레임 크기 포함)
+            build: CompiledROI / CompiledZones를 만드는 함수
+        """
+        with self._lock:
+            roi = self._entries.get(key)
+            if roi is not None:
+                self._entries.move_to_end(key)
+                return roi
+
+        roi = build()
+        with self._lock:
+            self._entries[key] = roi
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return roi
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,275 @@
+"""
+추론 스케줄러 모듈
+
+모든 CCTV 태스크와 /analyze 요청의 프레임을 하나의 대기열로 모아
+패딩 크기가 같은 프레임끼리 배치로 묶어 P2PNet을 실행
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from constants import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, DEFAULT_MAX_QUEUE_SIZE
+from workers import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerFullError(RuntimeError):
+    """대기열이 가득 차서 요청을 받을 수 없음"""
+
+
+class _Request:
+    """대기열 항목 (프레임 + 추론 영역 + 결과 전달용 Future)"""
+    __slots__ = ('frame', 'region', 'shape', 'future', 'enqueued_at')
+
+    def __init__(self, frame, region, shape):
+        self.frame = frame
+        self.region = region
+        self.shape = shape
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class InferenceScheduler:
+    """
+    카메라 간 동적 배치 추론 스케줄러
+
+    - submit()으로 들어온 프레임은 제한된 크기의 대기열에 쌓임
+    - 워커 스레드가 max_wait_ms 동안 요청을 모아 패딩 크기별로 묶고,
+      그룹당 최대 max_batch_size 장씩 analyzer.predict_counts()를 1회 호출
+    - 결과는 요청마다 받은 Future로 돌려줌
+    - async API의 추론 영역 계산/후처리는 analysis_pool에서 실행 (이벤트 루프는 대기만 함)
+    """
+
+    def __init__(self, analyzer, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+                 analysis_pool=None):
+        """
+        Args:
+            analyzer: M3CongestionAnalyzer 인스턴스
+            max_batch_size: 한 번의 추론에 묶을 최대 프레임 수
+            max_wait_ms: 첫 요청 이후 배치를 채우기 위해 기다리는 최대 시간 (ms)
+            max_queue_size: 대기열 최대 길이 (초과 시 SchedulerFullError)
+            analysis_pool: (선택) 전/후처리용 workers.BlockingPool (None이면 루프 기본 executor)
+        """
+        self.analyzer = analyzer
+        self.analysis_pool = analysis_pool
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.queue: "queue.Queue[Optional[_Request]]" = queue.Queue(maxsize=max_queue_size)
+
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._running = False
+
+        # 통계 (워커 스레드와 호출 스레드가 함께 갱신)
+        self._stats_lock = threading.Lock()
+        self.total_frames = 0
+        self.total_batches = 0
+        self.rejected = 0
+
+    # ------------------------------------------------------------------
+    # 수명 주기
+    # ------------------------------------------------------------------
+    def start(self):
+        """워커 스레드 시작 (이미 실행 중이면 무시)"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="m3-inference-scheduler", daemon=True)
+            self._thread.start()
+        logger.info(f"🧵 추론 스케줄러 시작 (batch≤{self.max_batch_size}, wait≤{self.max_wait * 1000:.0f}ms)")
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """워커 스레드 종료 (대기 중인 요청은 취소)"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        # 워커가 get()에서 깨어나도록 종료 신호 전달
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._cancel_pending()
+        logger.info("🛑 추론 스케줄러 종료")
+
+    # ------------------------------------------------------------------
+    # 요청 API
+    # ------------------------------------------------------------------
+    def submit(self, frame, region=None) -> Future:
+        """
+        프레임 1장 예측 요청
+
+        Args:
+            frame: OpenCV BGR 이미지
+            region: (선택) 추론 영역 (x0, y0, x1, y1), analyzer.get_inference_region() 결과
+
+        Returns:
+            Future: (count, points, scores) 로 완료됨
+
+        Raises:
+            SchedulerFullError: 대기열이 가득 찬 경우
+        """
+        if not self._running:
+            self.start()
+
+        request = _Request(frame, region, self.analyzer.get_input_size(frame, region))
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise SchedulerFullError(f"추론 대기열이 가득 찼습니다 (max={self.queue.maxsize})")
+        return request.future
+
+    def submit_many(self, frames, regions=None) -> List[Future]:
+        """
+        여러 프레임 예측 요청 (전부 들어가거나 하나도 들어가지 않음)
+
+        대기열에 남은 자리가 프레임 수보다 적으면 바로 거절하고,
+        그 사이 다른 요청이 자리를 채워 중간에 실패하면 이미 넣은 요청을 취소함
+        (워커는 취소된 요청을 건너뜀)
+
+        Raises:
+            SchedulerFullError: 대기열에 전체 프레임을 넣을 자리가 없는 경우
+        """
+        if regions is None:
+            regions = [None] * len(frames)
+        if self.queue.maxsize > 0 and len(frames) > self.queue.maxsize - self.queue.qsize():
+            with self._stats_lock:
+                self.rejected += len(frames)
+            raise SchedulerFullError(
+                f"추론 대기열 자리가 부족합니다 (요청 {len(frames)}장, 대기 {self.queue.qsize()}/{self.queue.maxsize})")
+
+        futures = []
+        try:
+            for frame, region in zip(frames, regions):
+                futures.append(self.submit(frame, region))
+        except SchedulerFullError:
+            for future in futures:
+                future.cancel()
+            raise
+        return futures
+
+    async def predict(self, frame, region=None):
+        """submit()의 asyncio 버전 (이벤트 루프를 막지 않고 결과 대기)"""
+        return await asyncio.wrap_future(self.submit(frame, region))
+
+    async def analyze_frame(self, frame, roi_params=None, zone_settings=None,
+                            perspective=None) -> Dict[str, Any]:
+        """스케줄러를 거쳐 analyzer.analyze_frame과 같은 결과 반환"""
+        results = await self.analyze_frames([frame], roi_params=roi_params, zone_settings=zone_settings,
+                                            perspective=perspective)
+        return results[0]
+
+    async def analyze_frames(self, frames, roi_params=None, zone_settings=None,
+                             perspective=None) -> List[Dict[str, Any]]:
+        """여러 프레임을 한꺼번에 제출 (다른 카메라 요청과 함께 배치될 수 있음)"""
+        def prepare():
+            regions = [self.analyzer.get_inference_region(frame, roi_params, zone_settings) for frame in frames]
+            checks = [i for i, (frame, region) in enumerate(zip(frames, regions))
+                      if self.analyzer.crop_check_due(frame.shape, region, roi_params, zone_settings)]
+            return regions, checks
+        regions, checks = await run_blocking(self.analysis_pool, prepare)
+        
+        # 크롭 검증용 전체 프레임 추론도 같은 대기열/배치로 실행
+        futures = self.submit_many(list(frames) + [frames[i] for i in checks], regions + [None] * len(checks))
+        predictions = await asyncio.gather(*[asyncio.wrap_future(f) for f in futures])
+        full_predictions = dict(zip(checks, predictions[len(frames):]))
+        return await run_blocking(self.analysis_pool, lambda: self.analyzer.analyze_predictions(
+            frames, predictions[:len(frames)], full_predictions,
+            roi_params=roi_params, zone_settings=zone_settings, perspective=perspective))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """스케줄러 상태/통계"""
+        with self._stats_lock:
+            total_frames, total_batches, rejected = self.total_frames, self.total_batches, self.rejected
+        return {
+            'running': self._running,
+            'queue_size': self.queue.qsize(),
+            'max_queue_size': self.queue.maxsize,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'total_frames': total_frames,
+            'total_batches': total_batches,
+            'avg_batch_size': (total_frames / total_batches) if total_batches else 0.0,
+            'rejected': rejected,
+            'roi_crop': self.analyzer.get_roi_crop_stats(),
+        }
+
+    # ------------------------------------------------------------------
+    # 워커
+    # ------------------------------------------------------------------
+    def _run(self):
+        while self._running:
+            first = self.queue.get()
+            if first is None:
+                break
+
+            # 1. 첫 요청 이후 max_wait 동안 요청 수집 (패딩 크기별 그룹화)
+            groups: Dict[tuple, List[_Request]] = {first.shape: [first]}
+            deadline = first.enqueued_at + self.max_wait
+            stop_requested = False
+
+            while True:
+                if len(groups[first.shape]) >= self.max_batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop_requested = True
+                    break
+                group = groups.setdefault(request.shape, [])
+                group.append(request)
+                if len(group) >= self.max_batch_size:
+                    break
+
+            # 2. 그룹별로 max_batch_size 단위 실행
+            for members in groups.values():
+                for i in range(0, len(members), self.max_batch_size):
+                    self._execute(members[i:i + self.max_batch_size])
+
+            if stop_requested:
+                break
+
+    def _execute(self, batch: List[_Request]):
+        # 이미 취소된 요청은 제외
+        batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            predictions = self.analyzer.predict_counts([r.frame for r in batch], [r.region for r in batch])
+        except Exception as e:
+            logger.error(f"배치 추론 실패 (batch={len(batch)}): {e}")
+            for r in batch:
+                r.future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self.total_frames += len(batch)
+            self.total_batches += 1
+        for r, prediction in zip(batch, predictions):
+            r.future.set_result(prediction)
+
+    def _cancel_pending(self):
+        while True:
+            try:
+                request = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.cancel()
@@ -15,13 +15,11 @@ from datetime import datetime
 import traceback
 import threading
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import cv2
-import numpy as np
 from dotenv import load_dotenv
 
 from pathlib import Path
@@ -33,10 +31,12 @@ load_dotenv(dotenv_path=env_path)
 
 # M3 모듈 import
 from api import M3CongestionAPI
-from constants import CongestionLevel
+from constants import CongestionLevel, DEFAULT_MAX_QUEUE_SIZE, DEFAULT_SEGMENT_SEC
 from database import get_db, save_detection
-from video_processor import VideoProcessor
 from dummy_generator import DummyGenerator
+from live_stream import is_live_source
+from scheduler import SchedulerFullError
+from video_jobs import VideoJob, JobQueueFullError
 
 # 로깅 설정
 logging.basicConfig(
@@ -111,6 +111,8 @@ class VideoAnalysisRequest(BaseModel):
     cctv_no: Optional[str] = "CCTV-01"
     frame_interval: int = 120  # N프레임마다 분석
     max_capacity: Optional[int] = None
+    segment_sec: int = DEFAULT_SEGMENT_SEC  # 구간 집계 길이 (영상 시간 기준, 초)
+    start_time: Optional[datetime] = None  # 녹화 시작 시각 (ISO, 시간대 없으면 서버 로컬 시각. 없으면 작업 시작 시각)
 
 class ImageAnalyzeOnceResponse(BaseModel):
     """로그인 시 1회 이미지 분석 응답"""
@@ -150,6 +152,21 @@ async def startup_event():
         model_path = os.getenv('MODEL_PATH')
         p2pnet_source = os.getenv('P2PNET_SOURCE')
         max_capacity = int(os.getenv('MAX_CAPACITY', '200'))
+        max_batch_size = int(os.getenv('INFER_MAX_BATCH_SIZE', '8'))
+        max_wait_ms = float(os.getenv('INFER_MAX_WAIT_MS', '20'))
+        # 추론 대기열 길이 (카메라 수 × 분석 주기당 5장보다 작으면 동시에 분석하는 카메라끼리 요청이 거절됨)
+        max_queue_size = int(os.getenv('INFER_MAX_QUEUE_SIZE', str(DEFAULT_MAX_QUEUE_SIZE)))
+        compile_mode = os.getenv('INFER_COMPILE_MODE') or None  # 'script' / 'compile'
+        warmup = os.getenv('INFER_WARMUP', '1' if compile_mode else '0') == '1'
+        optimize_graph = os.getenv('INFER_OPTIMIZE_GRAPH', '0') == '1'  # Conv-BN 폴딩 등
+        roi_crop = os.getenv('INFER_ROI_CROP', '0') == '1'              # ROI 바운딩 박스만 추론 (verify_roi_crop.py로 확인 후)
+        decode_workers = int(os.getenv('INFER_DECODE_WORKERS', '4'))      # 프레임 디코딩 스레드 수
+        analysis_workers = int(os.getenv('INFER_ANALYSIS_WORKERS', '2'))  # 전/후처리 스레드 수
+        decode_mode = os.getenv('INFER_DECODE_MODE', 'sequential')        # 'sequential' / 'seek'
+        spool_dir = os.getenv('VIDEO_SPOOL_DIR') or None                  # 업로드 임시 파일 경로
+        video_job_workers = int(os.getenv('VIDEO_JOB_WORKERS', '2'))      # 동시 영상 분석 작업 수
+        adaptive_sampling = os.getenv('INFER_ADAPTIVE_SAMPLING', '1') == '1'  # 위험도 기반 분석 주기
+        max_inferences_per_sec = float(os.getenv('INFER_MAX_INFERENCES_PER_SEC', '0'))  # 0이면 제한 없음
         
         if not model_path or not p2pnet_source:
             raise ValueError("환경변수 MODEL_PATH, P2PNET_SOURCE가 설정되지 않았습니다.")
@@ -165,9 +182,30 @@ async def startup_event():
             device='cuda',
             max_capacity=max_capacity,
             roi_polygon=None,  # 필요시 설정
-            alert_threshold=50
+            alert_threshold=50,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            max_queue_size=max_queue_size,
+            compile_mode=compile_mode,
+            optimize_graph=optimize_graph,
+            roi_crop=roi_crop,
+            decode_workers=decode_workers,
+            analysis_workers=analysis_workers,
+            decode_mode=decode_mode,
+            spool_dir=spool_dir,
+            video_job_workers=video_job_workers,
+            adaptive_sampling=adaptive_sampling,
+            max_inferences_per_sec=max_inferences_per_sec
         )
         
+        # 3-0. 이벤트 루프 지연 측정 (/health의 workers.event_loop_lag) + 영상 작업 워커
+        m3_api.start_services()
+        
+        # 3-1. 워밍업 (백그라운드, 완료 전까지 /health는 503)
+        if warmup:
+            logger.info(f"🔥 워밍업 시작 (compile_mode={compile_mode})")
+            m3_api.start_warmup()
+        
         # 4. Supabase 연결 확인 및 DB 초기화
         db = get_db()
         if db.is_enabled():
@@ -184,12 +222,13 @@ async def startup_event():
 
 
 @app.post("/control/start")
-async def start_analysis(cctv_idx: str, video_path: Optional[str] = None):
+async def start_analysis(cctv_idx: str, video_path: Optional[str] = None, live: Optional[bool] = None):
     """
     특정 CCTV 분석 시작 (On-Demand)
     Args:
         cctv_idx: CCTV 식별자 (DB의 cctv_idx 예: "CCTV_01")
-        video_path: 영상 경로 (선택)
+        video_path: 영상 경로 또는 스트림 URL (선택, rtsp/http URL이면 실시간 스트림 모드)
+        live: 실시간 스트림 모드 강제 (True면 로컬 파일을 fps에 맞춰 재생하는 대체 스트림으로 사용)
     """
     if m3_api is None:
         raise HTTPException(status_code=503, detail="모델이 로드되지 않았습니다.")
@@ -241,12 +280,21 @@ async def start_analysis(cctv_idx: str, video_path: Optional[str] = None):
              video_path = "./video/IMG_3544.mov"
         logger.info(f"⚠️ 기본 영상 경로 사용: {video_path}")
     
+    # 이미 실행 중인 카메라면 새 태스크를 만들지 않음
+    if m3_api.streams.is_running(mapped_cctv_no):
+        logger.info(f"↩️ 이미 분석 중: {mapped_cctv_no}")
+        return {"status": "already_running", "cctv_idx": cctv_idx, "mapped_id": mapped_cctv_no,
+                "stream": m3_api.streams.get_stats(mapped_cctv_no)[0]}
+    
     # [수정] mapped_cctv_no(사람이 읽기 쉬운 ID)와 db_save_uuid(DB 저장용 ID)를 함께 전달
-    m3_api.start_background_task(
+    started = m3_api.start_background_task(
         video_path=video_path, 
         cctv_no=mapped_cctv_no, 
-        db_cctv_uuid=db_save_uuid
+        db_cctv_uuid=db_save_uuid,
+        live=live
     )
+    if not started:
+        raise HTTPException(status_code=404, detail=f"영상을 찾을 수 없습니다: {video_path}")
     
 
     global dummy_thread_started
@@ -313,20 +361,56 @@ async def analyze_images_once():
 @app.post("/control/stop")
 async def stop_analysis(cctv_idx: str):
     """
-    분석 중지 (On-Demand)
+    특정 CCTV 분석 중지 (다른 CCTV 분석은 계속 실행)
     """
-    if m3_api and hasattr(m3_api, 'processor'):
-        m3_api.processor.stop()
-        logger.info(f"⏹️ 분석 중지 요청: {cctv_idx}")
-        return {"status": "stopped", "cctv_idx": cctv_idx}
+    if m3_api is None:
+        raise HTTPException(status_code=503, detail="모델이 로드되지 않았습니다.")
     
-    return {"status": "error", "message": "Processor not active"}
+    if not await m3_api.streams.stop(cctv_idx):
+        raise HTTPException(status_code=404, detail=f"실행 중인 분석이 없습니다: {cctv_idx}")
+    logger.info(f"⏹️ 분석 중지 요청: {cctv_idx}")
+    return {"status": "stopped", "cctv_idx": cctv_idx}
+
+
+@app.post("/control/restart")
+async def restart_analysis(cctv_idx: str):
+    """
+    특정 CCTV 분석 재시작 (마지막 시작 설정 그대로)
+    """
+    if m3_api is None:
+        raise HTTPException(status_code=503, detail="모델이 로드되지 않았습니다.")
+    
+    if not await m3_api.streams.restart(cctv_idx):
+        raise HTTPException(status_code=404, detail=f"시작된 적 없는 CCTV입니다: {cctv_idx}")
+    logger.info(f"🔁 분석 재시작 요청: {cctv_idx}")
+    return {"status": "restarted", "cctv_idx": cctv_idx, "stream": m3_api.streams.get_stats(cctv_idx)[0]}
+
+
+@app.get("/control/streams")
+async def list_streams():
+    """
+    CCTV별 분석 태스크 목록 및 통계 (실행 여부, 가동 시간, 마지막 분석 결과 등)
+    """
+    if m3_api is None:
+        raise HTTPException(status_code=503, detail="모델이 로드되지 않았습니다.")
+    
+    streams = m3_api.streams.get_stats()
+    return {
+        "status": "success",
+        "running": m3_api.streams.running_count,
+        "count": len(streams),
+        "streams": streams,
+        "scheduler": m3_api.scheduler.get_stats(),
+        "workers": m3_api.get_worker_stats()
+    }
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """서버 종료 시 실행"""
     logger.info("M3 P2PNet API 서버 종료 중...")
+    if m3_api is not None:
+        await m3_api.shutdown()
 
 
 @app.get("/")
@@ -345,11 +429,18 @@ async def health_check():
     """헬스체크 엔드포인트"""
     if m3_api is None:
         raise HTTPException(status_code=503, detail="모델이 로드되지 않았습니다.")
+    if not m3_api.ready:
+        raise HTTPException(status_code=503, detail="모델 워밍업 중입니다.")
     
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "model_loaded": True
+        "model_loaded": True,
+        "backend": m3_api.analyzer.backend.name,
+        "warmup": m3_api.warmup_stats,
+        "scheduler": m3_api.scheduler.get_stats(),
+        "workers": m3_api.get_worker_stats(),
+        "jobs": m3_api.jobs.get_stats()
     }
 
 
@@ -380,17 +471,19 @@ async def analyze_image(
         if len(contents) == 0:
             raise HTTPException(status_code=400, detail="빈 파일입니다.")
         
-        # 이미지 디코딩
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # 이미지 디코딩 (디코딩 워커 풀에서 실행)
+        image = await m3_api.decode_image_async(contents)
         
         if image is None:
             raise HTTPException(status_code=400, detail="이미지를 디코딩할 수 없습니다.")
         
         logger.info(f"  이미지 크기: {image.shape}")
         
-        # M3 분석
-        result = m3_api.analyze_image_bytes(contents)
+        # M3 분석 (추론 스케줄러 경유 - 카메라 프레임과 함께 배치 처리)
+        try:
+            result = await m3_api.analyze_frame_async(image)
+        except SchedulerFullError:
+            raise HTTPException(status_code=503, detail="추론 대기열이 가득 찼습니다. 잠시 후 다시 시도해주세요.")
         
         # 응답 데이터 구성
         response = AnalysisResponse(
@@ -438,68 +531,134 @@ async def analyze_image(
         raise HTTPException(status_code=500, detail=f"분석 중 오류 발생: {str(e)}")
 
 
-@app.post("/analyze/video")
+@app.post("/analyze/video", status_code=202)
 async def analyze_video_file(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     cctv_no: Optional[str] = "CCTV-01",
     frame_interval: int = 30
 ):
     """
-    영상 분석 API (파일 업로드)
+    영상 분석 API (파일 업로드 → 백그라운드 작업)
+    
+    업로드는 청크 단위로 spool 파일에 저장하고 (메모리 사용량이 파일 크기와 무관),
+    작업 대기열에 등록한 뒤 바로 job_id를 반환함. 진행 상황은 /jobs/{job_id},
+    프레임별 결과는 /jobs/{job_id}/results 로 조회
     
     Args:
         file: 영상 파일 (mp4, avi 등)
-        cctv_no: CCTV 식별자
+        cctv_no: CCTV 식별자 (ROI/구역/원근 설정 조회용)
         frame_interval: N프레임마다 분석 (기본 30)
     
     Returns:
-        job_id와 분석 시작 메시지
+        job_id와 작업 상태
     """
     try:
         logger.info(f"🎬 영상 분석 요청: {file.filename} (CCTV: {cctv_no})")
         
         if m3_api is None:
             raise HTTPException(status_code=503, detail="모델이 로드되지 않았습니다.")
+        if frame_interval < 1:
+            raise HTTPException(status_code=400, detail="frame_interval은 1 이상이어야 합니다.")
+        
+        # 청크 단위로 spool 파일에 저장
+        spool_path, size = await m3_api.jobs.spool_upload(file)
+        logger.info(f"  spool 저장: {spool_path} ({size / 1e6:.1f} MB)")
+        
+        job = VideoJob(
+            spool_path,
+            cctv_no=cctv_no,
+            frame_interval=frame_interval,
+            cleanup_path=spool_path,
+            filename=file.filename,
+            analysis_options=m3_api.get_camera_settings(cctv_no)
+        )
+        try:
+            m3_api.jobs.submit(job)
+        except JobQueueFullError:
+            raise HTTPException(status_code=503, detail="영상 분석 대기열이 가득 찼습니다. 잠시 후 다시 시도해주세요.")
         
-        # 임시 파일로 저장
-        temp_path = f"temp_{datetime.now().timestamp()}_{file.filename}"
-        
-        with open(temp_path, "wb") as f:
-            contents = await file.read()
-            f.write(contents)
-        
-        logger.info(f"  임시 파일 저장: {temp_path}")
-        
-        # TODO: video_processor.py 완성 후 비동기 처리
-        # job_id = str(uuid.uuid4())
-        # background_tasks.add_task(process_video_async, temp_path, cctv_no, frame_interval, job_id)
-        
-        # 현재는 간단한 응답만
         return {
             "status": "accepted",
-            "message": "영상 분석이 시작되었습니다. (구현 예정)",
+            "job_id": job.job_id,
             "cctv_no": cctv_no,
             "filename": file.filename,
-            "note": "video_processor.py 완성 후 실제 처리됩니다."
+            "size_bytes": size,
+            "status_url": f"/jobs/{job.job_id}",
+            "results_url": f"/jobs/{job.job_id}/results"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ 영상 분석 실패: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"분석 중 오류 발생: {str(e)}")
 
 
-@app.post("/analyze/video-url")
+@app.get("/jobs")
+async def list_jobs():
+    """
+    영상 분석 작업 목록 (최근 등록 순)
+    """
+    if m3_api is None:
+        raise HTTPException(status_code=503, detail="모델이 로드되지 않았습니다.")
+    return {"status": "success", "jobs": m3_api.jobs.list_jobs(), "stats": m3_api.jobs.get_stats()}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    영상 분석 작업 상태/진행률 (progress: 0.0~1.0)
+    """
+    if m3_api is None:
+        raise HTTPException(status_code=503, detail="모델이 로드되지 않았습니다.")
+    job = m3_api.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"작업을 찾을 수 없습니다: {job_id}")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, offset: int = 0, limit: int = 100):
+    """
+    영상 분석 작업의 프레임별 결과 (페이지 단위, 작업 진행 중에도 조회 가능)
+    """
+    if m3_api is None:
+        raise HTTPException(status_code=503, detail="모델이 로드되지 않았습니다.")
+    if offset < 0 or not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="offset은 0 이상, limit은 1~1000 이어야 합니다.")
+    page = m3_api.jobs.get_results(job_id, offset=offset, limit=limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail=f"작업을 찾을 수 없습니다: {job_id}")
+    return page
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    영상 분석 작업 취소 (대기 중이면 바로, 실행 중이면 다음 배치 전에 중지)
+    """
+    if m3_api is None:
+        raise HTTPException(status_code=503, detail="모델이 로드되지 않았습니다.")
+    if not m3_api.jobs.cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"진행 중인 작업이 없습니다: {job_id}")
+    return {"status": "cancelling", "job_id": job_id}
+
+
+@app.post("/analyze/video-url", status_code=202)
 async def analyze_video_url(request: VideoAnalysisRequest):
     """
-    영상 분석 API (URL 방식)
+    영상 분석 API (URL 방식 → 백그라운드 작업)
+    
+    URL(http/rtsp 등) 또는 서버 로컬 경로를 내려받지 않고 바로 열어 frame_interval 프레임마다
+    grab으로 건너뛰며 읽고, 스케줄러로 배치 분석함. segment_sec 구간별 집계(최대 인원/PCT/등급)는
+    모아서 DB에 일괄 저장. 진행/취소는 /jobs/{job_id} 와 동일
     
     Args:
         request: 영상 URL 및 분석 옵션
     
     Returns:
-        job_id와 분석 시작 메시지
+        job_id와 작업 상태
     """
     try:
         logger.info(f"🎬 영상 URL 분석 요청: {request.video_url}")
@@ -509,14 +668,51 @@ async def analyze_video_url(request: VideoAnalysisRequest):
         
         if not request.video_url:
             raise HTTPException(status_code=400, detail="video_url이 필요합니다.")
+        if request.frame_interval < 1 or request.segment_sec < 1:
+            raise HTTPException(status_code=400, detail="frame_interval, segment_sec은 1 이상이어야 합니다.")
+        
+        remote = is_live_source(request.video_url)
+        if not remote and not os.path.exists(request.video_url):
+            raise HTTPException(status_code=404, detail=f"영상을 찾을 수 없습니다: {request.video_url}")
+        
+        # DB 저장용 UUID (UUID가 직접 오거나 cctv_idx로 조회되는 경우만 저장)
+        save_target_id = None
+        cctv_no = request.cctv_no
+        if cctv_no and len(cctv_no) >= 30:
+            save_target_id = cctv_no
+        elif cctv_no:
+            db = get_db()
+            if db.is_enabled():
+                cctv_info = await db.get_cctv_info_by_idx(cctv_no)
+                if cctv_info and cctv_info.get('cctv_no'):
+                    save_target_id = cctv_info['cctv_no']
+        if not save_target_id:
+            logger.info(f"👀 DB UUID 없음 - 구간 집계를 저장하지 않습니다: {cctv_no}")
+        
+        job = VideoJob(
+            request.video_url,
+            cctv_no=cctv_no,
+            frame_interval=request.frame_interval,
+            filename=request.video_url,
+            analysis_options=m3_api.get_camera_settings(cctv_no),
+            decode_mode='stream' if remote else 'sequential',
+            segment_sec=request.segment_sec,
+            save_target_id=save_target_id,
+            recording_start=request.start_time.timestamp() if request.start_time else None
+        )
+        try:
+            m3_api.jobs.submit(job)
+        except JobQueueFullError:
+            raise HTTPException(status_code=503, detail="영상 분석 대기열이 가득 찼습니다. 잠시 후 다시 시도해주세요.")
         
-        # TODO: video_processor.py 완성 후 구현
         return {
             "status": "accepted",
-            "message": "영상 URL 분석이 시작되었습니다. (구현 예정)",
+            "job_id": job.job_id,
             "video_url": request.video_url,
-            "cctv_no": request.cctv_no,
-            "note": "video_processor.py 완성 후 실제 처리됩니다."
+            "cctv_no": cctv_no,
+            "db_save": save_target_id is not None,
+            "status_url": f"/jobs/{job.job_id}",
+            "results_url": f"/jobs/{job.job_id}/results"
         }
         
     except HTTPException:
@@ -0,0 +1,191 @@
+"""
+카메라별 스트림 분석 태스크 레지스트리
+
+카메라(cctv_no)마다 VideoProcessor 인스턴스 하나와 asyncio 태스크 하나를 두어
+시작/중지/재시작이 다른 카메라에 영향을 주지 않도록 관리
+- 이미 실행 중인 카메라의 시작 요청은 새 태스크를 만들지 않음 (중복 제거)
+- 중지는 해당 카메라의 stop_event만 설정 (대기 중이면 즉시 깨어나 종료)
+- 태스크가 예외로 끝나도 다른 카메라 태스크는 계속 실행
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from constants import DEFAULT_DECODE_MODE, DEFAULT_MAX_GRAB_SKIP, DEFAULT_LIVE_BUFFER_SIZE
+from video_processor import VideoProcessor
+
+logger = logging.getLogger(__name__)
+
+# 중지 요청 후 태스크 종료를 기다리는 최대 시간 (초과 시 cancel)
+STOP_TIMEOUT_SEC = 10.0
+
+
+class _StreamEntry:
+    """카메라 하나의 실행 상태"""
+    __slots__ = ('cctv_no', 'processor', 'task', 'params', 'started_at', 'restarts', 'error')
+
+    def __init__(self, cctv_no, processor, task, params, restarts=0):
+        self.cctv_no = cctv_no
+        self.processor = processor
+        self.task = task
+        self.params = params
+        self.started_at = time.time()
+        self.restarts = restarts
+        self.error = None
+
+    @property
+    def running(self):
+        return not self.task.done()
+
+
+class StreamRegistry:
+    """cctv_no → (VideoProcessor, asyncio.Task) 레지스트리"""
+
+    def __init__(self, analyzer, scheduler=None, decode_pool=None, analysis_pool=None,
+                 decode_mode=DEFAULT_DECODE_MODE, max_grab_skip=DEFAULT_MAX_GRAB_SKIP,
+                 adaptive=True, budget=None):
+        """
+        Args:
+            analyzer: M3CongestionAnalyzer 인스턴스
+            scheduler: (선택) InferenceScheduler (모든 카메라가 같은 스케줄러로 배치 추론)
+            decode_pool: (선택) 모든 카메라가 공유하는 프레임 디코딩 workers.BlockingPool
+            analysis_pool: (선택) 모든 카메라가 공유하는 분석 workers.BlockingPool
+            decode_mode / max_grab_skip: VideoProcessor 영상 디코딩 설정 (frame_reader.FrameReader)
+            adaptive: 위험도 기반 분석 주기 사용 여부 (adaptive_sampling.AdaptiveInterval)
+            budget: (선택) 모든 카메라가 공유하는 adaptive_sampling.InferenceBudget
+        """
+        self.analyzer = analyzer
+        self.scheduler = scheduler
+        self.decode_pool = decode_pool
+        self.analysis_pool = analysis_pool
+        self.decode_mode = decode_mode
+        self.max_grab_skip = max_grab_skip
+        self.adaptive = adaptive
+        self.budget = budget
+        self._streams: Dict[str, _StreamEntry] = {}
+
+    def is_running(self, cctv_no) -> bool:
+        entry = self._streams.get(cctv_no)
+        return entry is not None and entry.running
+
+    def start(self, cctv_no, restarts=0, **params) -> bool:
+        """
+        카메라 스트림 분석 시작 (이벤트 루프 안에서 호출)
+
+        Args:
+            cctv_no: 카메라 식별자 (레지스트리 키)
+            **params: VideoProcessor.process_stream_simulation 인자 (video_path, interval_seconds 등)
+
+        Returns:
+            bool: 새로 시작했으면 True, 이미 실행 중이면 False
+        """
+        if self.is_running(cctv_no):
+            logger.info(f"↩️ [{cctv_no}] 이미 실행 중 - 시작 요청 무시")
+            return False
+
+        processor = VideoProcessor(self.analyzer, scheduler=self.scheduler,
+                                   decode_pool=self.decode_pool, analysis_pool=self.analysis_pool,
+                                   decode_mode=self.decode_mode, max_grab_skip=self.max_grab_skip,
+                                   adaptive=self.adaptive, budget=self.budget)
+        task = asyncio.create_task(
+            processor.process_stream_simulation(cctv_no=cctv_no, **params),
+            name=f"m3-stream-{cctv_no}",
+        )
+        entry = _StreamEntry(cctv_no, processor, task, params, restarts=restarts)
+        task.add_done_callback(lambda t, e=entry: self._on_done(e, t))
+        self._streams[cctv_no] = entry
+        logger.info(f"▶️ [{cctv_no}] 스트림 태스크 시작 (실행 중 {self.running_count}개)")
+        self._check_queue_capacity()
+        return True
+
+    def _check_queue_capacity(self):
+        """카메라들이 한 주기에 제출하는 프레임이 추론 대기열보다 많으면 경고 (요청 거절로 분석 주기가 밀림)"""
+        if self.scheduler is None or self.scheduler.queue.maxsize <= 0:
+            return
+        needed = self.running_count * DEFAULT_LIVE_BUFFER_SIZE
+        if needed > self.scheduler.queue.maxsize:
+            logger.warning(f"⚠️ 실행 중인 카메라 {self.running_count}개 × {DEFAULT_LIVE_BUFFER_SIZE}장 = {needed}장이 "
+                           f"추론 대기열({self.scheduler.queue.maxsize})보다 많습니다. INFER_MAX_QUEUE_SIZE를 늘려주세요.")
+
+    def _on_done(self, entry, task):
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            entry.error = f"{type(exc).__name__}: {exc}"
+            logger.error(f"❌ [{entry.cctv_no}] 스트림 태스크 비정상 종료: {entry.error}")
+
+    async def stop(self, cctv_no, timeout=STOP_TIMEOUT_SEC) -> bool:
+        """
+        카메라 스트림 중지 (종료될 때까지 대기)
+
+        이미 끝난 태스크(비정상 종료 포함)는 error/통계를 /control/streams에서 볼 수 있도록
+        레지스트리에 그대로 둠
+
+        Returns:
+            bool: 실행 중이던 스트림을 중지했으면 True
+        """
+        entry = self._streams.get(cctv_no)
+        if entry is None or not entry.running:
+            return False
+        del self._streams[cctv_no]
+
+        entry.processor.stop()
+        try:
+            await asyncio.wait_for(asyncio.shield(entry.task), timeout=timeout)
+        except asyncio.TimeoutError:
+            # 프레임 읽기/추론 도중이라 제때 끝나지 않으면 취소하고, 캡처를 놓을 때까지 기다림
+            # (바로 재시작해도 같은 카메라 태스크가 두 개 실행되지 않도록)
+            entry.task.cancel()
+            logger.warning(f"⚠️ [{cctv_no}] {timeout}초 안에 종료되지 않아 태스크를 취소했습니다.")
+            try:
+                await entry.task
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                pass  # 예외는 _on_done에서 기록
+        except Exception:
+            pass  # 예외는 _on_done에서 기록
+        logger.info(f"⏹️ [{cctv_no}] 스트림 중지 (실행 중 {self.running_count}개)")
+        return True
+
+    async def restart(self, cctv_no) -> bool:
+        """
+        마지막 시작 인자로 카메라 스트림 재시작
+
+        Returns:
+            bool: 재시작했으면 True, 등록된 적 없는 카메라면 False
+        """
+        entry = self._streams.get(cctv_no)
+        if entry is None:
+            return False
+        await self.stop(cctv_no)
+        return self.start(cctv_no, restarts=entry.restarts + 1, **entry.params)
+
+    async def stop_all(self):
+        """모든 카메라 스트림 중지 (서버 종료 시)"""
+        await asyncio.gather(*[self.stop(cctv_no) for cctv_no in list(self._streams)])
+
+    @property
+    def running_count(self) -> int:
+        return sum(1 for entry in self._streams.values() if entry.running)
+
+    def get_stats(self, cctv_no=None) -> List[Dict[str, Any]]:
+        """카메라별 상태/통계 목록 (cctv_no를 주면 해당 카메라만)"""
+        entries = self._streams.values() if cctv_no is None else \
+            [e for e in (self._streams.get(cctv_no),) if e is not None]
+        now = time.time()
+        return [{
+            'cctv_no': entry.cctv_no,
+            'running': entry.running,
+            'video_path': entry.params.get('video_path'),
+            'interval_seconds': entry.params.get('interval_seconds'),
+            'started_at': datetime.fromtimestamp(entry.started_at).isoformat(),
+            'uptime_sec': round(now - entry.started_at, 1),
+            'restarts': entry.restarts,
+            'error': entry.error,
+            **entry.processor.stats,
+        } for entry in entries]
@@ -0,0 +1,104 @@
+"""
+대형 프레임(4K/파노라마) 타일 추론 보조 모듈
+
+프레임을 128 정렬된 겹침 타일로 나누고, 겹침 구간에서 중복 검출된 점을
+격자(spatial hash) 기반으로 병합
+"""
+
+import numpy as np
+
+from constants import DEFAULT_TILE_OVERLAP, DEFAULT_TILE_MERGE_RADIUS
+from preprocess import PAD_MULTIPLE, get_padded_size
+
+
+def tile_starts(length, tile_size, overlap, multiple=PAD_MULTIPLE):
+    """
+    한 축의 타일 시작 좌표 목록 (모두 multiple의 배수)
+
+    타일 수는 겹침이 overlap 이상이 되는 최소 개수로 정하고, 시작 좌표는 균등 간격으로 배치
+    (마지막 타일은 패딩 후 끝에 맞추므로 모든 타일의 패딩 후 크기가 같음)
+    """
+    padded = ((length + multiple - 1) // multiple) * multiple
+    if padded <= tile_size:
+        return [0]
+    span = padded - tile_size
+    step = max(multiple, ((tile_size - overlap) // multiple) * multiple)
+    n = -(-span // step) + 1
+    blocks = span // multiple
+    return [(i * blocks // (n - 1)) * multiple for i in range(n)]
+
+
+def compute_tiles(h, w, tile_size, overlap=DEFAULT_TILE_OVERLAP):
+    """
+    프레임을 덮는 타일 영역 목록
+
+    Returns:
+        list: (x0, y0, x1, y1) 튜플 (x1/y1은 프레임 경계로 잘림)
+    """
+    tiles = []
+    for y0 in tile_starts(h, tile_size, overlap):
+        for x0 in tile_starts(w, tile_size, overlap):
+            tiles.append((x0, y0, min(x0 + tile_size, w), min(y0 + tile_size, h)))
+    return tiles
+
+
+def needs_tiling(h, w, tile_size):
+    """패딩 후 크기가 타일보다 크면 타일 추론 대상"""
+    gh, gw = get_padded_size(h, w)
+    return gh > tile_size or gw > tile_size
+
+
+def merge_tile_points(points, scores, tile_ids, tiles, radius=DEFAULT_TILE_MERGE_RADIUS):
+    """
+    타일 간 중복 점 병합
+
+    두 개 이상의 타일이 겹치는 구간의 점만 검사하며, 점수가 높은 점부터
+    radius 격자에 등록하고 다른 타일에서 온 radius 이내 점은 버림
+    (같은 타일 안의 인접한 점은 실제로 다른 사람일 수 있으므로 유지)
+
+    Args:
+        points: (N, 2) 프레임 좌표
+        scores: (N,) 신뢰도
+        tile_ids: (N,) 점이 검출된 타일 인덱스
+        tiles: compute_tiles() 결과
+        radius: 병합 거리 (px)
+
+    Returns:
+        (points, scores)
+    """
+    if len(points) == 0:
+        return points, scores
+
+    # 점마다 몇 개의 타일에 포함되는지 계산 → 1개면 중복될 수 없음
+    boxes = np.asarray(tiles, dtype=np.float32)
+    xs, ys = points[:, 0:1], points[:, 1:2]
+    inside = (xs >= boxes[:, 0]) & (xs < boxes[:, 2]) & (ys >= boxes[:, 1]) & (ys < boxes[:, 3])
+    in_overlap = inside.sum(axis=1) > 1
+
+    keep = np.ones(len(points), dtype=bool)
+    candidates = np.flatnonzero(in_overlap)
+    if len(candidates) > 0:
+        cell = float(radius)
+        r2 = cell * cell
+        grid = {}
+        for i in candidates[np.argsort(-scores[candidates], kind='stable')]:
+            x, y = points[i]
+            cx, cy = int(x // cell), int(y // cell)
+            duplicate = False
+            for gx in (cx - 1, cx, cx + 1):
+                for gy in (cy - 1, cy, cy + 1):
+                    for j in grid.get((gx, gy), ()):
+                        if tile_ids[j] != tile_ids[i] and \
+                                (points[j, 0] - x) ** 2 + (points[j, 1] - y) ** 2 <= r2:
+                            duplicate = True
+                            break
+                    if duplicate:
+                        break
+                if duplicate:
+                    break
+            if duplicate:
+                keep[i] = False
+            else:
+                grid.setdefault((cx, cy), []).append(i)
+
+    return points[keep], scores[keep]
@@ -0,0 +1,102 @@
+"""
+ROI 크롭 추론 ↔ 전체 프레임 추론 결과 비교 도구
+
+M3CongestionAnalyzer(roi_crop=True, INFER_ROI_CROP=1)는 ROI 바운딩 박스(+주변 roi_crop_margin)만
+잘라서 추론함. 샘플 프레임을 CCTV별 ROI/구역 설정으로 크롭/전체 프레임 두 번 분석해
+전체/제외 영역/구역별 인원 차이를 출력함 (크롭을 켜기 전에 확인용.
+운영 중에는 analyzer.crop_check_due/resolve_crop_check가 설정별 처음 몇 장 + 이후 주기적으로
+같은 비교를 하고, 다르면 전체 프레임 추론으로 전환함)
+
+사용 예 (실제 카메라 캡처 이미지 권장, 없으면 랜덤 프레임):
+    python verify_roi_crop.py --model-path best_mae.pth --p2pnet-source ./p2pnet_source \
+        --images cctv01.jpg cctv02.jpg --cctv-ids CCTV_01 CCTV_02
+"""
+
+import argparse
+import sys
+
+import torch
+
+from analyzer import M3CongestionAnalyzer, count_diff
+from backends import create_backend
+from config import M3Config
+from constants import DEFAULT_ROI_CROP_MARGIN
+
+
+def configured_cctv_ids():
+    """ROI/구역 설정이 있는 CCTV ID 목록"""
+    return sorted(set(M3Config.ROI_SETTINGS_MAP) | set(M3Config.ZONE_SETTINGS_MAP))
+
+
+@torch.no_grad()
+def verify_parity(cropped, full, frames, cctv_ids):
+    """
+    크롭/전체 프레임 분석기의 인원 비교
+
+    Args:
+        cropped: roi_crop=True 분석기
+        full: roi_crop=False 분석기 (같은 백엔드)
+        frames: 비교할 프레임 목록
+        cctv_ids: 적용할 CCTV ID 목록 (None은 기본 ROI, 구역 없음)
+
+    Returns:
+        (모든 프레임/설정에서 인원이 같으면 True, 비교 건수, 차이 합계 |Δ|)
+    """
+    ok = True
+    compared, total_diff = 0, 0
+    for cctv_id in cctv_ids:
+        roi_params = M3Config.get_roi_params(cctv_id) if cctv_id else None
+        zone_settings = M3Config.get_zone_settings(cctv_id) if cctv_id else None
+        for i, frame in enumerate(frames):
+            region = cropped.get_inference_region(frame, roi_params, zone_settings)
+            crop_result = cropped.analyze_frame(frame, roi_params=roi_params, zone_settings=zone_settings)
+            full_result = full.analyze_frame(frame, roi_params=roi_params, zone_settings=zone_settings)
+            diff = count_diff(crop_result, full_result)
+            compared += 1
+            total_diff += sum(abs(v) for v in diff.values())
+            ok = ok and not diff
+            zones = ' '.join(f"{name}={zone['count']}" for name, zone in crop_result['zones'].items())
+            print(f"  [{cctv_id or 'default'}/{i}] {frame.shape[1]}x{frame.shape[0]} "
+                  f"crop={region} count={crop_result['count']}/{full_result['count']} "
+                  f"{zones} {'OK' if not diff else f'DIFF {diff}'}")
+    return ok, compared, total_diff
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser('ROI crop inference parity check', add_help=True)
+    parser.add_argument('--model-path', required=True, help='학습된 체크포인트 (.pth / .m3w)')
+    parser.add_argument('--p2pnet-source', required=True, help='P2PNet 소스 경로')
+    parser.add_argument('--images', nargs='*', default=None, help='비교용 이미지 (없으면 랜덤 프레임)')
+    parser.add_argument('--cctv-ids', nargs='*', default=None,
+                        help='적용할 CCTV ID (없으면 기본 ROI + 설정된 모든 CCTV)')
+    parser.add_argument('--threshold', default=0.45, type=float)
+    parser.add_argument('--roi-crop-margin', default=DEFAULT_ROI_CROP_MARGIN, type=int)
+    parser.add_argument('--num-threads', default=None, type=int, help='torch CPU 스레드 수')
+    return parser
+
+
+def main(args):
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+
+    from export_onnx import load_p2pnet, load_frames
+    device = torch.device('cpu')
+    model = load_p2pnet(args.model_path, args.p2pnet_source)
+    backend = create_backend('torch', model=model, device=device)
+    # 같은 백엔드를 공유하고 크롭 여부만 다르게 (운영 중 자동 비교는 끔)
+    cropped = M3CongestionAnalyzer(model, device, threshold=args.threshold, backend=backend,
+                                   roi_crop=True, roi_crop_margin=args.roi_crop_margin, roi_crop_verify_frames=0)
+    full = M3CongestionAnalyzer(model, device, threshold=args.threshold, backend=backend, roi_crop=False)
+
+    frames = load_frames(args.images)
+    cctv_ids = args.cctv_ids if args.cctv_ids else [None] + configured_cctv_ids()
+    print("🔍 ROI 크롭 ↔ 전체 프레임 추론 결과 비교")
+    ok, compared, total_diff = verify_parity(cropped, full, frames, cctv_ids)
+    if not ok:
+        print(f"❌ 결과 불일치 ({compared}건 중 인원 차이 합계 {total_diff}명)")
+        sys.exit(1)
+    print(f"✅ 결과 일치 ({compared}건)")
+
+
+if __name__ == '__main__':
+    main(get_args_parser().parse_args())
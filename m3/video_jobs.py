@@ -0,0 +1,509 @@
+"""
+영상 분석 작업(job) 엔진
+
+/analyze/video 업로드를 메모리에 통째로 올리지 않고 spool 디렉터리에 고정 크기 청크로 저장한 뒤,
+작업 대기열에 넣어 백그라운드 워커가 샘플 프레임을 기존 분석기(추론 스케줄러 경유)로 분석함
+- 업로드: UploadFile.read(chunk_size) → 파일 쓰기 반복 (업로드 크기와 무관하게 메모리 일정)
+- 대기열: 크기 제한 asyncio.Queue (가득 차면 JobQueueFullError → 503)
+- 워커: max_workers 개의 코루틴. 프레임 읽기는 디코딩 워커 풀, 추론은 스케줄러에서 실행
+- 결과: 샘플 프레임별 요약(인원/PCT/등급)만 보관, 페이지 단위로 조회
+- 정리: 작업이 끝나면 spool 파일 삭제, 완료된 작업은 result_ttl_sec 후 목록에서 제거,
+        서버 시작 시 이전 실행에서 남은 spool 파일 삭제
+
+/analyze/video-url 작업은 같은 엔진에서 source로 URL을 바로 열어 (FrameReader 'stream' 모드,
+grab으로만 건너뛰기) 읽으면서 분석하고, segment_sec 구간별 집계를 모아 DB에 일괄 저장함
+(segment_flush_size개마다 insert 1회, 작업이 끝나거나 취소되면 남은 구간 저장)
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from constants import (CongestionLevel, DEFAULT_UPLOAD_CHUNK_SIZE, DEFAULT_VIDEO_JOB_WORKERS,
+                       DEFAULT_VIDEO_JOB_QUEUE_SIZE, DEFAULT_VIDEO_JOB_BATCH_SIZE, DEFAULT_JOB_RESULT_TTL_SEC,
+                       DEFAULT_SEGMENT_FLUSH_SIZE, JOB_RETRY_MIN_SEC, JOB_RETRY_MAX_SEC, JOB_RETRY_TIMEOUT_SEC)
+from frame_reader import FrameReader
+from scheduler import SchedulerFullError
+from workers import run_blocking
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+
+class JobQueueFullError(RuntimeError):
+    """작업 대기열이 가득 차서 새 작업을 받을 수 없음"""
+
+
+class VideoJob:
+    """영상 분석 작업 1개의 상태/진행률/결과"""
+
+    def __init__(self, source, cctv_no=None, frame_interval=30, cleanup_path=None, filename=None,
+                 analysis_options=None, decode_mode='sequential', segment_sec=None, save_target_id=None,
+                 recording_start=None):
+        """
+        Args:
+            source: 분석할 영상 경로
+            cctv_no: CCTV 식별자 (ROI/구역/원근 설정 조회용)
+            frame_interval: N프레임마다 1장 분석
+            cleanup_path: 작업이 끝나면 삭제할 파일 (업로드 spool 파일)
+            filename: 원본 파일 이름 (표시용)
+            analysis_options: analyze_frames에 넘길 roi_params / zone_settings / perspective
+            decode_mode: FrameReader 모드 (원격 URL은 'stream')
+            segment_sec: 구간 집계 길이 (초, None이면 집계하지 않음)
+            save_target_id: 구간 집계를 저장할 DB CCTV UUID (None이면 저장하지 않음)
+            recording_start: 영상의 녹화 시작 시각 (epoch 초, None이면 작업 시작 시각을 대신 사용)
+        """
+        self.job_id = uuid.uuid4().hex
+        self.source = source
+        self.cctv_no = cctv_no
+        self.frame_interval = max(1, int(frame_interval))
+        self.cleanup_path = cleanup_path
+        self.filename = filename
+        self.analysis_options = analysis_options or {}
+        self.decode_mode = decode_mode
+        self.segment_sec = segment_sec
+        self.save_target_id = save_target_id
+        self.recording_start = recording_start
+
+        self.status = 'queued'
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+
+        self.fps = None
+        self.total_frames = None
+        self.frame_idx = 0              # 다음에 분석할 프레임 위치
+        self.results: List[Dict[str, Any]] = []
+        self.segments: List[Dict[str, Any]] = []    # 닫힌 구간 집계
+        self.segments_saved = 0
+        self._segment: Optional[Dict[str, Any]] = None  # 집계 중인 구간
+        self._unsaved: List[Dict[str, Any]] = []        # 아직 DB에 저장하지 않은 구간
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    @property
+    def progress(self):
+        """진행률 (0.0~1.0, 전체 프레임 수를 모르면 None)"""
+        if self.status == 'done':
+            return 1.0
+        if not self.total_frames:
+            return None
+        return round(min(1.0, self.frame_idx / self.total_frames), 4)
+
+    def summary(self) -> Dict[str, Any]:
+        """결과 전체의 요약 (최대/평균 인원, 최고 등급 구간)"""
+        if not self.results:
+            return {}
+        counts = [r['count'] for r in self.results]
+        peak = max(self.results, key=lambda r: r['count'])
+        return {
+            'samples': len(self.results),
+            'max_count': max(counts),
+            'avg_count': round(sum(counts) / len(counts), 2),
+            'peak_time_sec': peak['time_sec'],
+            'peak_risk_level': peak['risk_level'],
+        }
+
+    def add_to_segment(self, row) -> None:
+        """샘플 결과를 구간 집계에 반영 (구간이 바뀌면 이전 구간을 닫음)"""
+        if not self.segment_sec:
+            return
+        index = int(row['time_sec'] // self.segment_sec)
+        seg = self._segment
+        if seg is not None and seg['index'] != index:
+            self.close_segment()
+            seg = None
+        if seg is None:
+            seg = self._segment = {
+                'index': index,
+                'start_sec': index * self.segment_sec,
+                'end_sec': (index + 1) * self.segment_sec,
+                'samples': 0, 'count_sum': 0, 'max_count': 0, 'max_pct': 0.0,
+                'risk_level': None, 'risk_level_int': None,
+            }
+        seg['samples'] += 1
+        seg['count_sum'] += row['count']
+        seg['max_count'] = max(seg['max_count'], row['count'])
+        if seg['risk_level'] is None or row['pct'] > seg['max_pct']:
+            level = CongestionLevel[row['risk_level_en']]
+            seg['max_pct'] = round(row['pct'], 2)
+            seg['risk_level'] = level.korean
+            seg['risk_level_int'] = list(CongestionLevel).index(level) + 1  # 1:안전 ~ 4:위험 (DB 스키마)
+
+    def close_segment(self) -> None:
+        """집계 중인 구간을 닫아 segments / 저장 대기 목록에 추가"""
+        seg, self._segment = self._segment, None
+        if seg is None:
+            return
+        count_sum = seg.pop('count_sum')
+        seg['avg_count'] = round(count_sum / seg['samples'], 2)
+        # 구간 시작 시각 = 녹화 시작 시각 + 영상 내 구간 시작 (녹화 시각을 모르면 작업 시작 시각 기준)
+        base = self.recording_start if self.recording_start is not None else self.started_at
+        if base is not None:
+            seg['detected_at'] = datetime.fromtimestamp(base + seg['start_sec'], timezone.utc).isoformat()
+        self.segments.append(seg)
+        self._unsaved.append(seg)
+
+    def to_dict(self) -> Dict[str, Any]:
+        def iso(ts):
+            # 구간 detected_at과 같은 UTC 기준
+            return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts is not None else None
+        end = self.finished_at or time.time()
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'cctv_no': self.cctv_no,
+            'filename': self.filename,
+            'frame_interval': self.frame_interval,
+            'progress': self.progress,
+            'frame_idx': self.frame_idx,
+            'total_frames': self.total_frames,
+            'fps': self.fps,
+            'samples': len(self.results),
+            'created_at': iso(self.created_at),
+            'started_at': iso(self.started_at),
+            'finished_at': iso(self.finished_at),
+            'recording_start': iso(self.recording_start),
+            'elapsed_sec': round(end - self.started_at, 2) if self.started_at else None,
+            'error': self.error,
+            'summary': self.summary(),
+            'segment_sec': self.segment_sec,
+            'segments': self.segments,
+            'segments_saved': self.segments_saved,
+        }
+
+
+class VideoJobManager:
+    """
+    작업 대기열 + 워커 코루틴
+
+    start()/stop()은 이벤트 루프 안에서 호출 (서버 startup/shutdown)
+    """
+
+    def __init__(self, scheduler, spool_dir, decode_pool=None, max_workers=DEFAULT_VIDEO_JOB_WORKERS,
+                 max_queue_size=DEFAULT_VIDEO_JOB_QUEUE_SIZE, batch_size=DEFAULT_VIDEO_JOB_BATCH_SIZE,
+                 result_ttl_sec=DEFAULT_JOB_RESULT_TTL_SEC, persist=None,
+                 segment_flush_size=DEFAULT_SEGMENT_FLUSH_SIZE, budget=None):
+        """
+        Args:
+            scheduler: InferenceScheduler (카메라 스트림과 같은 배치 추론 경로 사용)
+            spool_dir: 업로드 임시 파일 디렉터리
+            decode_pool: (선택) 프레임 읽기용 workers.BlockingPool
+            max_workers: 동시에 실행할 작업 수
+            max_queue_size: 대기 중인 작업 최대 개수
+            batch_size: 한 번에 분석할 샘플 프레임 수
+            result_ttl_sec: 끝난 작업을 보관하는 시간 (초)
+            persist: (선택) 구간 집계 일괄 저장 코루틴 함수 (rows → 저장된 행 수, database.save_detections)
+            segment_flush_size: 구간 집계를 몇 개씩 모아 저장할지
+            budget: (선택) adaptive_sampling.InferenceBudget (카메라 스트림보다 낮은 우선순위로 받음)
+        """
+        self.scheduler = scheduler
+        self.spool_dir = spool_dir
+        self.decode_pool = decode_pool
+        self.max_workers = max(1, int(max_workers))
+        self.batch_size = max(1, int(batch_size))
+        self.result_ttl_sec = result_ttl_sec
+        self.max_queue_size = max_queue_size
+        self.persist = persist
+        self.segment_flush_size = max(1, int(segment_flush_size))
+        self.budget = budget
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._jobs: Dict[str, VideoJob] = {}
+
+    # ------------------------------------------------------------------
+    # 수명 주기
+    # ------------------------------------------------------------------
+    def start(self):
+        """spool 디렉터리 정리 후 워커 시작 (이미 실행 중이면 무시)"""
+        if self._workers:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        removed = self.cleanup_spool()
+        if removed:
+            logger.info(f"🧹 이전 실행에서 남은 spool 파일 {removed}개 삭제")
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [asyncio.create_task(self._worker(), name=f"m3-video-job-{i}")
+                         for i in range(self.max_workers)]
+        logger.info(f"🎬 영상 작업 워커 {self.max_workers}개 시작 (대기열 {self.max_queue_size}, spool: {self.spool_dir})")
+
+    async def stop(self):
+        """워커 종료 + 끝나지 않은 작업의 spool 파일 삭제"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job in self._jobs.values():
+            if not job.finished:
+                job.status = 'cancelled'
+                self._cleanup(job)
+
+    def cleanup_spool(self):
+        """spool 디렉터리의 파일 삭제 (작업 목록은 메모리에만 있으므로 시작 시점의 파일은 모두 고아)"""
+        removed = 0
+        for name in os.listdir(self.spool_dir):
+            try:
+                os.remove(os.path.join(self.spool_dir, name))
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    # ------------------------------------------------------------------
+    # 업로드 / 작업 등록
+    # ------------------------------------------------------------------
+    async def spool_upload(self, upload, chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE):
+        """
+        UploadFile → spool 파일 (chunk_size 바이트씩 읽고 쓰기)
+
+        Returns:
+            (저장 경로, 바이트 수)
+        """
+        os.makedirs(self.spool_dir, exist_ok=True)
+        ext = os.path.splitext(upload.filename or '')[1][:10]
+        path = os.path.join(self.spool_dir, f"upload_{uuid.uuid4().hex}{ext}")
+        size = 0
+        f = await run_blocking(None, open, path, 'wb')
+        try:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                await run_blocking(None, f.write, chunk)
+                size += len(chunk)
+        except BaseException:
+            await run_blocking(None, f.close)
+            self._remove(path)
+            raise
+        await run_blocking(None, f.close)
+        return path, size
+
+    def submit(self, job: VideoJob) -> VideoJob:
+        """작업 등록 (대기열이 가득 차면 JobQueueFullError, 이때 spool 파일은 삭제)"""
+        if self._queue is None:
+            raise RuntimeError("VideoJobManager.start()가 호출되지 않았습니다.")
+        self._purge_expired()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._cleanup(job)
+            raise JobQueueFullError(f"영상 작업 대기열이 가득 찼습니다 (max={self.max_queue_size})")
+        self._jobs[job.job_id] = job
+        logger.info(f"📥 영상 작업 등록: {job.job_id} ({job.filename or job.source}, {job.frame_interval}프레임 간격)")
+        return job
+
+    # ------------------------------------------------------------------
+    # 조회 / 취소
+    # ------------------------------------------------------------------
+    def get(self, job_id) -> Optional[VideoJob]:
+        self._purge_expired()
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        self._purge_expired()
+        return [job.to_dict() for job in sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)]
+
+    def get_results(self, job_id, offset=0, limit=100) -> Optional[Dict[str, Any]]:
+        """프레임별 결과 페이지 (없는 작업이면 None)"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        offset = max(0, int(offset))
+        limit = max(1, int(limit))
+        return {
+            'job_id': job_id,
+            'status': job.status,
+            'total': len(job.results),
+            'offset': offset,
+            'limit': limit,
+            'results': job.results[offset:offset + limit],
+        }
+
+    def cancel(self, job_id) -> bool:
+        """작업 취소 요청 (대기 중이면 바로, 실행 중이면 다음 배치 전에 중지)"""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_requested = True
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+            self._cleanup(job)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        by_status = {status: 0 for status in JOB_STATUSES}
+        for job in self._jobs.values():
+            by_status[job.status] += 1
+        return {
+            'workers': len(self._workers),
+            'queue_size': self._queue.qsize() if self._queue is not None else 0,
+            'max_queue_size': self.max_queue_size,
+            'jobs': by_status,
+        }
+
+    # ------------------------------------------------------------------
+    # 워커
+    # ------------------------------------------------------------------
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.cancel_requested:
+                    job.status = 'cancelled'
+                    continue
+                await self._run(job)
+            except asyncio.CancelledError:
+                job.status = 'cancelled'
+                raise
+            except Exception as e:
+                job.status = 'failed'
+                job.error = f"{type(e).__name__}: {e}"
+                logger.error(f"❌ 영상 작업 실패 ({job.job_id}): {job.error}")
+            finally:
+                job.finished_at = job.finished_at or time.time()
+                self._cleanup(job)
+                self._queue.task_done()
+
+    async def _run(self, job: VideoJob):
+        job.status = 'running'
+        job.started_at = time.time()
+        reader = FrameReader(job.source, mode=job.decode_mode)
+        try:
+            job.fps, total_frames = await run_blocking(self.decode_pool, reader.open)
+            # 실시간/원격 스트림은 전체 프레임 수를 모르면 0 또는 음수를 돌려줌
+            job.total_frames = total_frames if total_frames > 0 else None
+            if not reader.is_opened():
+                raise ValueError(f"영상을 열 수 없습니다: {job.filename or job.source}")
+            fps = job.fps if job.fps and job.fps > 0 else 30.0
+
+            finished = False
+            while not finished:
+                if job.cancel_requested:
+                    job.status = 'cancelled'
+                    logger.info(f"⏹️ 영상 작업 취소: {job.job_id}")
+                    break
+                batch, finished = await run_blocking(self.decode_pool, self._read_batch, reader, job)
+                if batch:
+                    await self._analyze_batch(job, batch, fps)
+                if len(job._unsaved) >= self.segment_flush_size:
+                    await self._flush_segments(job)
+        finally:
+            await run_blocking(self.decode_pool, reader.release)
+
+        # 마지막 (또는 취소 시점까지의) 구간 저장
+        job.close_segment()
+        await self._flush_segments(job)
+        if job.status == 'cancelled':
+            return
+        if not job.results:
+            # 원격 mp4의 moov가 뒤에 있는데 서버가 Range 요청을 지원하지 않는 경우 등
+            raise ValueError(f"영상에서 프레임을 읽을 수 없습니다: {job.filename or job.source}")
+
+        job.status = 'done'
+        job.finished_at = time.time()
+        logger.info(f"✅ 영상 작업 완료: {job.job_id} (샘플 {len(job.results)}장, "
+                    f"{job.finished_at - job.started_at:.1f}s)")
+
+    def _read_batch(self, reader, job):
+        """(워커 스레드) frame_interval 간격으로 최대 batch_size장 읽기 → ([(frame_idx, frame)], 영상 끝 여부)"""
+        batch = []
+        while len(batch) < self.batch_size:
+            if job.total_frames and job.frame_idx >= job.total_frames:
+                return batch, True
+            frames, looped = reader.read(job.frame_idx, count=1)
+            # 영상 끝에서 처음으로 돌아간 프레임은 버림 (작업은 한 번만 재생)
+            if looped or not frames:
+                return batch, True
+            batch.append((job.frame_idx, frames[0]))
+            job.frame_idx += job.frame_interval
+        return batch, False
+
+    async def _analyze_batch(self, job, batch, fps):
+        """
+        배치 분석 → 결과/구간 집계 반영
+
+        추론 대기열이 가득 차면 실시간 카메라 요청이 우선이므로 대기 시간을 늘려 가며 재시도하고,
+        그 사이 취소 요청이 오면 바로 중단 (JOB_RETRY_TIMEOUT_SEC이 지나면 SchedulerFullError)
+        """
+        frames = [frame for _, frame in batch]
+        if job.cancel_requested:
+            return
+        if self.budget is not None:
+            await self.budget.acquire(len(frames), priority=0)
+        delay = JOB_RETRY_MIN_SEC
+        deadline = time.monotonic() + JOB_RETRY_TIMEOUT_SEC
+        while True:
+            if job.cancel_requested:
+                return
+            try:
+                results = await self.scheduler.analyze_frames(frames, **job.analysis_options)
+                break
+            except SchedulerFullError:
+                if time.monotonic() + delay > deadline:
+                    raise
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, JOB_RETRY_MAX_SEC)
+
+        for (frame_idx, _), result in zip(batch, results):
+            row = {
+                'frame_idx': frame_idx,
+                'time_sec': round(frame_idx / fps, 3),
+                'count': result['count'],
+                'density': float(result['density']),
+                'pct': float(result['pct']),
+                'risk_level': result['risk_level'].korean,
+                'risk_level_en': result['risk_level'].name,
+                'zones': {name: zone['count'] for name, zone in result.get('zones', {}).items()},
+            }
+            job.results.append(row)
+            job.add_to_segment(row)
+
+    async def _flush_segments(self, job):
+        """저장 대기 중인 구간 집계를 insert 1회로 저장 (실패해도 작업은 계속)"""
+        rows, job._unsaved = job._unsaved, []
+        if not rows or self.persist is None or not job.save_target_id:
+            return
+        try:
+            job.segments_saved += await self.persist([{
+                'cctv_no': job.save_target_id,
+                'detected_at': seg.get('detected_at'),
+                'person_count': seg['max_count'],
+                'avg_count': seg['avg_count'],
+                'congestion_level': int(seg['max_pct']),
+                'risk_level_int': seg['risk_level_int'],
+            } for seg in rows])
+        except Exception as e:
+            logger.error(f"❌ 구간 집계 저장 실패 ({job.job_id}, {len(rows)}건): {e}")
+
+    # ------------------------------------------------------------------
+    # 정리
+    # ------------------------------------------------------------------
+    def _cleanup(self, job):
+        if job.cleanup_path:
+            self._remove(job.cleanup_path)
+            job.cleanup_path = None
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _purge_expired(self):
+        """result_ttl_sec이 지난 완료 작업을 목록에서 제거"""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at and now - job.finished_at > self.result_ttl_sec]
+        for job_id in expired:
+            del self._jobs[job_id]
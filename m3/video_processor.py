@@ -4,30 +4,73 @@
 영상 파일에서 프레임을 추출하고 M3 모델로 분석
 """
 # test
-import cv2
 import os
 import logging
-from typing import List, Dict, Any, Optional, Callable
+from typing import Dict, Any, Optional
 from datetime import datetime
 import asyncio
 import time
 import statistics
+from adaptive_sampling import AdaptiveInterval, risk_priority
+from constants import DEFAULT_DECODE_MODE, DEFAULT_MAX_GRAB_SKIP
 from database import save_detection
+from frame_reader import FrameReader
+from live_stream import LiveFrameReader, is_live_source
+from replay_clock import RealTimeClock, TimelineWriter
+from workers import run_blocking
 
 logger = logging.getLogger(__name__)
 
 
 class VideoProcessor:
-    """영상 처리 및 분석 클래스"""
+    """
+    영상 처리 및 분석 클래스
     
-    def __init__(self, analyzer):
+    인스턴스 하나가 카메라 하나의 스트림을 담당 (stop_event/통계도 카메라별).
+    여러 카메라는 stream_registry.StreamRegistry가 카메라마다 인스턴스를 만들어 관리
+    
+    VideoCapture 열기/이동/읽기와 분석은 워커 풀에서 실행하고 이 코루틴은 결과만 기다림
+    (한 카메라가 디코딩/추론 중이어도 이벤트 루프는 다른 요청을 계속 처리)
+    """
+    
+    def __init__(self, analyzer, scheduler=None, decode_pool=None, analysis_pool=None,
+                 decode_mode=DEFAULT_DECODE_MODE, max_grab_skip=DEFAULT_MAX_GRAB_SKIP,
+                 adaptive=True, budget=None, clock=None):
         """
         Args:
             analyzer: M3CongestionAPI 인스턴스
+            scheduler: (선택) InferenceScheduler. 있으면 다른 카메라와 배치로 묶어 추론
+            decode_pool: (선택) 프레임 디코딩용 workers.BlockingPool (None이면 루프 기본 executor)
+            analysis_pool: (선택) 스케줄러 없이 분석할 때 사용할 workers.BlockingPool
+            decode_mode: 'sequential' (grab으로 건너뛰기) 또는 'seek' (매 주기 cap.set)
+            max_grab_skip: (선택) sequential 모드에서 항상 seek으로 전환하는 건너뛰기 프레임 수 (None이면 비용 비교만)
+            adaptive: 위험도에 따라 분석 주기 조절 (False면 interval_seconds 고정)
+            budget: (선택) 모든 카메라가 공유하는 adaptive_sampling.InferenceBudget (초당 추론량 제한)
+            clock: 대기/시각 기준 (기본 replay_clock.RealTimeClock, 오프라인 재생은 VirtualClock)
         """
         self.analyzer = analyzer
+        self.scheduler = scheduler
+        self.decode_pool = decode_pool
+        self.analysis_pool = analysis_pool
+        self.decode_mode = decode_mode
+        self.max_grab_skip = max_grab_skip
+        self.adaptive = adaptive
+        self.budget = budget
+        self.clock = clock or RealTimeClock()
         self.stop_event = asyncio.Event()
-    
+        self.stats = {
+            'analyses': 0,           # 분석 주기 완료 횟수
+            'errors': 0,             # 분석 실패 횟수
+            'last_count': None,
+            'last_pct': None,
+            'last_risk_level': None,
+            'last_analyzed_at': None,
+        }
+
+    async def _wait(self, seconds):
+        """seconds 동안 대기 (중지 신호가 오면 즉시 깨어남, 가상 시계면 시각만 앞당김). 중지 신호를 받았으면 True"""
+        return await self.clock.wait(seconds, self.stop_event)
+
     async def process_stream_simulation(
         self,
         video_path: str,
@@ -35,22 +78,36 @@ class VideoProcessor:
         # interval_seconds: int = 60
         interval_seconds: int = 20,
         roi_params: Optional[Dict[str, float]] = None,
-        db_cctv_uuid: Optional[str] = None  # [추가] DB 저장용 ID
+        db_cctv_uuid: Optional[str] = None,  # [추가] DB 저장용 ID
+        zone_settings: Optional[Dict[str, Any]] = None,
+        perspective: Optional[Dict[str, Any]] = None,
+        live: Optional[bool] = None,
+        timeline_path: Optional[str] = None,
+        loop_video: Optional[bool] = None
     ):
         """
         영상 스트리밍 시뮬레이션 (무한 루프 + 1분 주기 분석)
         
         Args:
-            video_path: 영상 파일 경로
+            video_path: 영상 파일 경로 또는 스트림 URL (rtsp://, http:// 등)
             cctv_no: CCTV 식별자 (ROI 조회용)
-            interval_seconds: 분석 주기 (초)
+            interval_seconds: 분석 주기 (초, adaptive면 기본 주기)
             roi_params: CCTV별 맞춤 ROI 파라미터 (없으면 기본값)
             db_cctv_uuid: DB 저장에 사용할 UUID (없으면 cctv_no 사용)
+            zone_settings: CCTV별 구역/제외 영역 설정 (M3Config.get_zone_settings)
+            perspective: CCTV별 원근 모델 설정 (M3Config.get_perspective_settings)
+            live: 실시간 스트림 모드 여부 (None이면 URL일 때만, True면 로컬 파일도 fps에 맞춰 재생하는 대체 스트림)
+            timeline_path: 분석 주기별 결과/단계별 소요 시간을 기록할 JSONL 파일 (선택)
+            loop_video: 영상 끝에서 처음으로 돌아가 계속할지 (None이면 실제 시계일 때만, 가상 시계는 1회 재생)
         """
         # [중요] 재시작 시 멈춤 신호 초기화
         self.stop_event.clear()
 
-        if not os.path.exists(video_path):
+        live = is_live_source(video_path) if live is None else live
+        if live and self.clock.virtual:
+            raise ValueError("실시간 스트림은 가상 시계로 재생할 수 없습니다.")
+        loop_video = not self.clock.virtual if loop_video is None else loop_video
+        if not is_live_source(video_path) and not os.path.exists(video_path):
             logger.error(f"영상 파일을 찾을 수 없습니다: {video_path}")
             return
             
@@ -60,6 +117,11 @@ class VideoProcessor:
             logger.info(f"🔧 [{cctv_no}] ROI 적용: {roi_params}")
         else:
             logger.info(f"🔧 [{cctv_no}] 기본 ROI 설정 사용")
+        if zone_settings:
+            logger.info(f"🗺️ [{cctv_no}] 구역 {len(zone_settings.get('zones', []))}개, "
+                        f"제외 영역 {len(zone_settings.get('exclude', []))}개")
+        if perspective:
+            logger.info(f"📐 [{cctv_no}] 원근 모델: {perspective.get('type')} (밀도 단위 명/m²)")
         
         # DB 저장용 ID 결정 (uuid가 전달되면 그것을, 아니면 None)
         save_target_id = db_cctv_uuid
@@ -68,67 +130,112 @@ class VideoProcessor:
         else:
             logger.info(f"💾 DB 저장 타겟: {save_target_id}")
 
-        cap = cv2.VideoCapture(video_path)
-        
-        # [추가] FPS 및 전체 프레임 수 확인 (Frame 단위 이동을 위해)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if fps <= 0:
-            fps = 30.0  # 기본값 설정
-            logger.warning(f"⚠️ FPS를 읽을 수 없어 기본값({fps})을 사용합니다.")
-            
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        logger.info(f"🎞️ 영상 정보: {fps} FPS, 총 {total_frames} 프레임")
+        if live:
+            # [신규] 실시간 스트림: 수신 스레드가 최신 프레임만 링 버퍼에 유지 (밀린 프레임은 버림)
+            reader = LiveFrameReader(video_path)
+            self.stats['decode'] = reader.stats
+            reader.start()
+            fps, total_frames = 0.0, 0
+            logger.info(f"📡 [{cctv_no}] 실시간 스트림 모드 (최신 {reader.buffer_size}프레임 링 버퍼)")
+        else:
+            # [추가] FPS 및 전체 프레임 수 확인 (Frame 단위 이동을 위해)
+            # [수정] 캡처 하나를 계속 열어 두고 순차로 읽음 (샘플 사이는 grab()으로 건너뜀)
+            reader = FrameReader(video_path, mode=self.decode_mode, max_grab_skip=self.max_grab_skip)
+            self.stats['decode'] = reader.stats
+            fps, total_frames = await run_blocking(self.decode_pool, reader.open)
+            if fps <= 0:
+                fps = 30.0  # 기본값 설정
+                logger.warning(f"⚠️ FPS를 읽을 수 없어 기본값({fps})을 사용합니다.")
+                
+            logger.info(f"🎞️ 영상 정보: {fps} FPS, 총 {total_frames} 프레임")
 
         last_risk_level_int = -1
         
+        # [신규] 위험도 기반 분석 주기 (PCT 상승/등급 경계 근처 → 단축, 안전하고 안정적 → 연장)
+        sampler = AdaptiveInterval(interval_seconds) if self.adaptive else None
+        next_interval = interval_seconds
+        priority = 1  # 마지막 분석 등급 (추론량 제한 시 우선순위)
+        
         # [수정] 현재 프레임 위치를 직접 관리 (OpenCV 내부 상태 의존도 낮춤)
         current_frame_idx = 0.0
 
+        # [신규] 분석 타임라인 (시각은 clock 기준이라 가상 시계로 재생해도 실시간과 같은 값)
+        timeline = TimelineWriter(timeline_path) if timeline_path else None
+        sim_start = self.clock.now()
+        cycle = 0
+
         try:
             while not self.stop_event.is_set():
-                # 0. 목표 지점으로 이동 (Seek)
-                if cap.isOpened():
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame_idx)
+                cycle_start = time.perf_counter()
+                analyzed_frame_idx = None if live else int(current_frame_idx)
+                if live:
+                    # 0~1. 링 버퍼에서 지난 주기 이후 들어온 최신 프레임 (최대 5장, 블로킹 없음)
+                    frames = reader.snapshot()
                 else:
-                    logger.warning("⚠️ VideoCapture가 닫혀있어 재연결합니다.")
-                    cap = cv2.VideoCapture(video_path)
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame_idx)
+                    # 0~1. 목표 지점으로 이동 후 프레임 캡처 (5프레임 연속 읽기, 디코딩 워커에서 실행)
+                    frames, looped = await run_blocking(self.decode_pool, reader.read, int(current_frame_idx))
+                    if looped and not loop_video:
+                        logger.info(f"🏁 [{cctv_no}] 영상 끝 도달, 재생 종료")
+                        break
+                    if looped:
+                        current_frame_idx = 0
+                        analyzed_frame_idx = 0
+                decoded_at = time.perf_counter()
 
-                # 1. 프레임 캡처 (5프레임 연속 읽기)
+                # 분석 (5프레임을 한 번의 배치 추론으로 처리)
                 frames_data = []
-                
-                for _ in range(5):
-                    ret, frame = cap.read()
-                    
-                    # 영상 끝 처리
-                    if not ret:
-                        logger.info("🔄 영상 끝 도달, 처음으로 루프")
-                        current_frame_idx = 0
-                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        ret, frame = cap.read()
-                        if not ret:
-                            logger.error("영상을 읽을 수 없습니다.")
-                            break
-                    
-                    # 분석
+                if frames:
+                    # 전체 초당 추론량 제한 (토큰이 모자라면 위험 등급이 높은 카메라부터)
+                    if self.budget is not None:
+                        await self.budget.acquire(len(frames), priority=priority)
+                budget_at = time.perf_counter()
+                if frames:
                     try:
-                        result = self.analyzer.analyze_frame(frame, roi_params=roi_params)
-                        frames_data.append(result)
+                        if self.scheduler is not None:
+                            frames_data = await self.scheduler.analyze_frames(
+                                frames, roi_params=roi_params, zone_settings=zone_settings,
+                                perspective=perspective)
+                        else:
+                            frames_data = await run_blocking(
+                                self.analysis_pool, self.analyzer.analyze_frames,
+                                frames, roi_params=roi_params, zone_settings=zone_settings,
+                                perspective=perspective)
                     except Exception as e:
-                        logger.error(f"프레임 분석 실패: {e}")
+                        self.stats['errors'] += 1
+                        logger.error(f"프레임 분석 실패 ({cctv_no}): {e}")
+                analyzed_at = time.perf_counter()
 
                 if not frames_data:
-                    logger.warning("분석된 프레임이 없습니다. 다음 주기로 넘어갑니다.")
-                    await asyncio.sleep(5)
+                    if self.clock.virtual:
+                        # 가상 시계는 대기 없이 같은 위치를 계속 재시도하게 되므로 재생 중단
+                        logger.error(f"분석된 프레임이 없습니다 ({cctv_no}). 재생을 중단합니다.")
+                        break
+                    logger.warning(f"분석된 프레임이 없습니다 ({cctv_no}). 다음 주기로 넘어갑니다.")
+                    await self._wait(5)
                     continue
 
                 # 2. 중앙값 계산 및 DB 저장 (기존 로직 유지)
                 counts = [r['count'] for r in frames_data]
                 median_count = statistics.median(counts)
                 final_result = min(frames_data, key=lambda x: abs(x['count'] - median_count))
+                self.stats.update(
+                    analyses=self.stats['analyses'] + 1,
+                    last_count=final_result['count'],
+                    last_pct=float(final_result['pct']),
+                    last_risk_level=final_result['risk_level'].korean,
+                    last_analyzed_at=datetime.now().isoformat(),
+                )
                 
                 risk_level_map = {'안전': 1, '주의': 2, '경고': 3, '위험': 4}
                 current_risk_int = risk_level_map.get(final_result['risk_level'].korean, 1)
+                priority = risk_priority(final_result['risk_level'])
+                
+                if sampler is not None:
+                    next_interval = sampler.update(final_result['pct'], now=self.clock.now())
+                    self.stats.update(sampler.get_stats())
+                    if sampler.reason != 'base':
+                        logger.info(f"⏱️ [{cctv_no}] 분석 주기 {next_interval:.0f}초 ({sampler.reason}, "
+                                    f"PCT {float(final_result['pct']):.1f}%)")
                 
                 is_status_changed = (current_risk_int != last_risk_level_int)
                 if is_status_changed:
@@ -150,30 +257,63 @@ class VideoProcessor:
                 else:
                     # 저장하지 않더라도 로그는 출력 (디버깅용)
                     logger.info(f"👀 분석 완료 (DB 미저장): {cctv_no} -> {final_result['count']}명, {final_result['risk_level'].korean}")
+                saved_at = time.perf_counter()
+                
+                cycle += 1
+                if timeline is not None:
+                    timeline.write({
+                        'cycle': cycle,
+                        'sim_time_sec': round(self.clock.now() - sim_start, 3),
+                        'frame_idx': analyzed_frame_idx,
+                        'video_sec': round(analyzed_frame_idx / fps, 3) if analyzed_frame_idx is not None and fps else None,
+                        'frames': len(frames_data),
+                        'count': final_result['count'],
+                        'pct': round(float(final_result['pct']), 2),
+                        'risk_level': final_result['risk_level'].name,
+                        'interval_sec': next_interval,
+                        'interval_reason': sampler.reason if sampler is not None else None,
+                        'timings_ms': {
+                            'decode': round((decoded_at - cycle_start) * 1000, 2),
+                            'budget': round((budget_at - decoded_at) * 1000, 2),
+                            'analyze': round((analyzed_at - budget_at) * 1000, 2),
+                            'save': round((saved_at - analyzed_at) * 1000, 2),
+                            'total': round((saved_at - cycle_start) * 1000, 2),
+                        },
+                    })
                 
-                # 3. 다음 분석 위치 계산 (현재 + 3초)
-                prev_frame_idx = current_frame_idx
-                frames_to_skip = int(interval_seconds * fps)
-                current_frame_idx += frames_to_skip
+                # 3. 다음 분석 위치 계산 (영상 파일만. 실시간 스트림은 수신 스레드가 최신 프레임을 유지)
+                if live:
+                    logger.info(f"📡 [{cctv_no}] 수신 {reader.stats['fps']} fps, 지연 {reader.stats['lag_ms']} ms, "
+                                f"버린 프레임 {reader.stats['frames_dropped']}, 재연결 {reader.stats['reconnects']}회")
+                else:
+                    prev_frame_idx = current_frame_idx
+                    frames_to_skip = int(next_interval * fps)
+                    current_frame_idx += frames_to_skip
                 
-                # 전체 프레임 초과 시 루프 처리
-                if total_frames > 0 and current_frame_idx >= total_frames:
-                    current_frame_idx = current_frame_idx % total_frames
-                    logger.info("🔄 영상 루프 예정")
+                    # 전체 프레임 초과 시 루프 처리
+                    if total_frames > 0 and current_frame_idx >= total_frames:
+                        if not loop_video:
+                            logger.info(f"🏁 [{cctv_no}] 영상 끝 도달, 재생 종료")
+                            break
+                        current_frame_idx = current_frame_idx % total_frames
+                        logger.info("🔄 영상 루프 예정")
 
-                # 시간 정보 로깅
-                current_sec = prev_frame_idx / fps if fps else 0
-                next_sec = current_frame_idx / fps if fps else 0
-                logger.info(f"⏩ 다음 분석 대기: {current_sec:.1f}s -> {next_sec:.1f}s (Frame: {int(prev_frame_idx)} -> {int(current_frame_idx)})")
+                    # 시간 정보 로깅
+                    current_sec = prev_frame_idx / fps if fps else 0
+                    next_sec = current_frame_idx / fps if fps else 0
+                    logger.info(f"⏩ 다음 분석 대기: {current_sec:.1f}s -> {next_sec:.1f}s (Frame: {int(prev_frame_idx)} -> {int(current_frame_idx)})")
 
                 # 4. 대기 (실제 시간 흐름 시뮬레이션)
                 # 분석에 걸린 시간은 무시하고, 단순히 주기만큼 기다림 (요청사항 반영)
-                wait_time = max(0, interval_seconds - 1.0) # 분석 시간 고려하여 조금 뺌
+                # (가상 시계는 분석 시간이 시각에 반영되지 않으므로 주기 그대로)
+                wait_time = next_interval if self.clock.virtual else max(0, next_interval - 1.0) # 분석 시간 고려하여 조금 뺌
                 logger.info(f"💤 {wait_time}초 대기...")
-                await asyncio.sleep(wait_time)
+                await self._wait(wait_time)
                 
         finally:
-            cap.release()
+            await run_blocking(self.decode_pool, reader.stop if live else reader.release)
+            if timeline is not None:
+                timeline.close()
             logger.info(f"🛑 M3 시뮬레이션 종료: {cctv_no}")
 
     def stop(self):
@@ -0,0 +1,181 @@
+"""
+메모리 매핑(mmap) 가능한 P2PNet 가중치 파일 (.m3w)
+
+torch.load는 pickle 체크포인트 전체를 워커마다 별도 메모리로 읽어 들이지만,
+.m3w 파일은 텐서를 페이지 경계에 맞춰 평평하게 저장하므로 np.memmap으로 그대로 매핑 가능
+- 로드 시 복사 없이 파라미터가 파일 페이지를 직접 가리킴 (load_state_dict(assign=True))
+- 같은 파일을 여러 uvicorn 워커가 열면 OS 페이지 캐시를 공유 (워커별 RSS 감소)
+- FP16으로 저장하면 파일/메모리 크기가 절반 (GPU FP16 추론용)
+
+파일 구조:
+    [MAGIC 8B][헤더 길이 8B (little-endian)][JSON 헤더][패딩] [텐서 데이터 (각각 PAGE_SIZE 정렬)]...
+
+사용 예:
+    python weights.py --model-path best_mae.pth --output best_mae.m3w [--fp16]
+"""
+
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+import torch
+
+MAGIC = b'M3WGHT01'
+PAGE_SIZE = 4096
+WEIGHTS_EXT = '.m3w'
+
+# torch dtype ↔ 헤더 문자열 ↔ NumPy dtype
+_DTYPES = {
+    'float32': (torch.float32, np.float32),
+    'float16': (torch.float16, np.float16),
+    'float64': (torch.float64, np.float64),
+    'int64': (torch.int64, np.int64),
+    'int32': (torch.int32, np.int32),
+    'uint8': (torch.uint8, np.uint8),
+}
+_DTYPE_NAMES = {torch_dtype: name for name, (torch_dtype, _) in _DTYPES.items()}
+
+
+def _align(offset, alignment=PAGE_SIZE):
+    return ((offset + alignment - 1) // alignment) * alignment
+
+
+def is_mmap_weights(path):
+    """파일이 .m3w 형식인지 확인 (확장자가 아니라 MAGIC으로 판단)"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def save_mmap_weights(state_dict, output_path, fp16=False, meta=None):
+    """
+    state_dict → .m3w 파일
+
+    Args:
+        state_dict: 텐서 dict (CPU로 옮겨서 저장)
+        output_path: 저장 경로
+        fp16: 부동소수점 텐서를 FP16으로 저장할지 여부
+        meta: 함께 저장할 부가 정보 (dict, JSON 직렬화 가능해야 함)
+    """
+    tensors = {}
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu()
+        if fp16 and tensor.is_floating_point():
+            tensor = tensor.half()
+        if tensor.dtype not in _DTYPE_NAMES:
+            raise ValueError(f"지원하지 않는 dtype입니다: {name} ({tensor.dtype})")
+        tensors[name] = tensor.contiguous()
+
+    # 헤더 길이를 알아야 데이터 시작 위치가 정해지므로 오프셋은 상대값으로 먼저 계산
+    entries = {}
+    offset = 0
+    for name, tensor in tensors.items():
+        offset = _align(offset)
+        nbytes = tensor.numel() * tensor.element_size()
+        entries[name] = {
+            'dtype': _DTYPE_NAMES[tensor.dtype],
+            'shape': list(tensor.shape),
+            'offset': offset,
+            'nbytes': nbytes,
+        }
+        offset += nbytes
+
+    header = json.dumps({
+        'meta': dict(meta or {}, fp16=bool(fp16)),
+        'tensors': entries,
+    }).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    with open(output_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, tensor in tensors.items():
+            f.seek(data_start + entries[name]['offset'])
+            f.write(tensor.numpy().tobytes())
+        # 마지막 텐서 뒤도 페이지 단위로 맞춤
+        f.truncate(_align(data_start + offset))
+
+    print(f"✅ 가중치 저장: {output_path} ({os.path.getsize(output_path) / 1e6:.1f} MB, "
+          f"{'FP16' if fp16 else 'FP32'}, 텐서 {len(tensors)}개)")
+
+
+def load_mmap_weights(path):
+    """
+    .m3w 파일을 메모리 매핑해 state_dict로 반환 (데이터 복사 없음)
+
+    copy-on-write(mode='c')로 매핑하므로 다른 프로세스와 물리 페이지를 공유하고,
+    텐서에 쓰기가 일어난 페이지만 해당 프로세스 전용으로 복사됨
+
+    Returns:
+        (state_dict, meta)
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f".m3w 가중치 파일이 아닙니다: {path}")
+        (header_len,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    data_start = _align(len(MAGIC) + 8 + header_len)
+
+    buffer = np.memmap(path, dtype=np.uint8, mode='c')
+    state_dict = {}
+    for name, entry in header['tensors'].items():
+        torch_dtype, np_dtype = _DTYPES[entry['dtype']]
+        start = data_start + entry['offset']
+        array = buffer[start:start + entry['nbytes']].view(np_dtype).reshape(entry['shape'])
+        state_dict[name] = torch.from_numpy(array)
+    return state_dict, header.get('meta', {})
+
+
+def load_weights(model, model_path, map_location='cpu'):
+    """
+    모델에 가중치 로드 (.m3w면 mmap, 아니면 기존 torch.load 체크포인트)
+
+    .m3w는 파라미터가 매핑된 파일 페이지를 직접 가리키도록 assign=True로 로드함
+    (assign을 지원하지 않는 구버전 PyTorch에서는 일반 복사로 대체)
+
+    Returns:
+        meta dict (.pth 체크포인트면 빈 dict)
+    """
+    if not is_mmap_weights(model_path):
+        checkpoint = torch.load(model_path, map_location=map_location)
+        model.load_state_dict(checkpoint['model'])
+        return {}
+
+    state_dict, meta = load_mmap_weights(model_path)
+    try:
+        model.load_state_dict(state_dict, assign=True)
+    except TypeError:  # torch < 2.1
+        model.load_state_dict(state_dict)
+    return meta
+
+
+def convert_checkpoint(model_path, output_path, fp16=False):
+    """torch.load 체크포인트(.pth) → .m3w"""
+    checkpoint = torch.load(model_path, map_location='cpu')
+    state_dict = checkpoint['model'] if 'model' in checkpoint else checkpoint
+    save_mmap_weights(state_dict, output_path, fp16=fp16, meta={'source': os.path.basename(model_path)})
+
+
+def get_args_parser():
+    parser = argparse.ArgumentParser('P2PNet mmap weight converter', add_help=True)
+    parser.add_argument('--model-path', required=True, help='학습된 체크포인트 (.pth)')
+    parser.add_argument('--output', default=None, help=f'저장할 경로 (기본: 체크포인트 이름{WEIGHTS_EXT})')
+    parser.add_argument('--fp16', action='store_true', help='부동소수점 가중치를 FP16으로 저장')
+    return parser
+
+
+def main(args):
+    output = args.output or os.path.splitext(args.model_path)[0] + WEIGHTS_EXT
+    start = time.perf_counter()
+    convert_checkpoint(args.model_path, output, fp16=args.fp16)
+    print(f"⏱️ 변환 시간: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main(get_args_parser().parse_args())
@@ -0,0 +1,157 @@
+"""
+블로킹 작업용 워커 풀 + 이벤트 루프 지연 측정
+
+프레임 디코딩(cap.read/cap.set/imdecode)과 분석(전처리/추론/후처리)은 모두 GIL을 놓는
+블로킹 호출이므로 이벤트 루프에서 직접 실행하지 않고 전용 스레드 풀에서 실행함
+- 이벤트 루프는 작업을 넘기고 결과를 await 하는 조율만 담당 (/health, /analyze 응답 유지)
+- 풀마다 대기열 크기를 제한하여, 넘치면 호출한 코루틴이 자리가 날 때까지 대기 (백프레셔)
+- EventLoopLagMonitor: 주기적으로 sleep 후 실제로 깨어난 시각과의 차이로 루프 지연 측정
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from constants import LOOP_LAG_INTERVAL_SEC, LOOP_LAG_WARN_MS
+
+logger = logging.getLogger(__name__)
+
+
+class BlockingPool:
+    """
+    크기가 제한된 대기열을 가진 스레드 풀
+
+    run()으로 넘긴 작업은 max_workers 개의 스레드에서 실행되고,
+    실행 중 + 대기 중 작업이 max_pending 개를 넘으면 run()은 자리가 날 때까지 기다림
+    """
+
+    def __init__(self, name, max_workers, max_pending):
+        """
+        Args:
+            name: 풀 이름 (스레드 이름 접두사, 통계 표시용)
+            max_workers: 워커 스레드 수
+            max_pending: 실행 중 + 대기 중 작업 최대 개수
+        """
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(self.max_workers, int(max_pending))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"m3-{name}")
+        # asyncio.Semaphore는 처음 사용하는 이벤트 루프에 묶이므로 run()에서 생성
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        # 통계
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_queue_wait_ms = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs)를 워커 스레드에서 실행하고 결과 반환 (대기열이 가득 차면 대기)"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        loop = asyncio.get_running_loop()
+
+        queued_at = time.perf_counter()
+        async with self._slots:
+            self.submitted += 1
+            self.in_flight += 1
+            self.max_queue_wait_ms = max(self.max_queue_wait_ms, (time.perf_counter() - queued_at) * 1000)
+            try:
+                return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                self.completed += 1
+
+    def shutdown(self, wait=False):
+        """워커 스레드 종료 (wait=False면 실행 중인 작업을 기다리지 않음)"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'in_flight': self.in_flight,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'max_queue_wait_ms': round(self.max_queue_wait_ms, 1),
+        }
+
+
+async def run_blocking(pool, fn, *args, **kwargs):
+    """pool(BlockingPool)에서 실행 (pool이 None이면 이벤트 루프 기본 executor 사용)"""
+    if pool is not None:
+        return await pool.run(fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(None, lambda: fn(*args, **kwargs))
+
+
+class EventLoopLagMonitor:
+    """
+    이벤트 루프 지연 측정
+
+    interval초마다 깨어나도록 sleep 한 뒤 실제 경과 시간과의 차이를 기록함.
+    누군가 루프를 막고 있으면 (블로킹 호출) 그만큼 늦게 깨어나므로 지연이 커짐
+    """
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL_SEC, warn_ms=LOOP_LAG_WARN_MS):
+        """
+        Args:
+            interval: 측정 주기 (초)
+            warn_ms: 이 값을 넘는 지연은 경고 로그 + slow_samples 집계
+        """
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self._task: Optional[asyncio.Task] = None
+
+        # 통계
+        self.samples = 0
+        self.slow_samples = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.avg_ms = 0.0  # 지수 이동 평균
+
+    def start(self):
+        """측정 태스크 시작 (이벤트 루프 안에서 호출, 이미 실행 중이면 무시)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="m3-loop-lag")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, (time.perf_counter() - expected) * 1000))
+
+    def _record(self, lag_ms):
+        self.samples += 1
+        self.last_ms = lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+        self.avg_ms = lag_ms if self.samples == 1 else self.avg_ms * 0.9 + lag_ms * 0.1
+        if lag_ms > self.warn_ms:
+            self.slow_samples += 1
+            logger.warning(f"🐢 이벤트 루프 지연 {lag_ms:.0f}ms (기준 {self.warn_ms}ms)")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'interval_sec': self.interval,
+            'samples': self.samples,
+            'slow_samples': self.slow_samples,
+            'last_ms': round(self.last_ms, 2),
+            'avg_ms': round(self.avg_ms, 2),
+            'max_ms': round(self.max_ms, 2),
+        }